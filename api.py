@@ -1,19 +1,54 @@
-from fastapi import FastAPI, HTTPException, Header
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi import Depends, FastAPI, HTTPException, Header, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
+from typing import List, Optional
 import uvicorn
+import asyncio
+import json
 import os
 
 # Import our customized Udemy API wrapper
-from udemy import UdemyAPI
+from curl_cffi.requests.exceptions import RequestException
+from udemy import AsyncUdemyAPI, UdemyAPI, close_async_session, courses_from_pages, curriculum_from_pages, get_async_session
+from cache import asset_cache, listing_cache, token_cache, token_hash
+from models import Asset, Lecture, attachment_url
+from responses import FastJSONResponse, negotiated_json
+from planner import SizePlanner
+from downloader import sanitize_filename
+from mediacache import media_cache, media_key, relay
+from prefetch import Prefetcher
+from zipstream import MISSING_NAME, ZipStream, archive_name, course_attachments, missing_report
+from urllib.parse import urlparse
+import metrics
+from jobs import DEFAULT_PRIORITY, TERMINAL_STATES, Job, JobConflict, job_manager
 
-app = FastAPI(title="Udemy Downloader API")
+def track_activity(authorization: str = Header(None)):
+    # Keeps the token's speculative prefetch alive for as long as its client is making requests
+    if authorization:
+        prefetcher.touch(authorization)
+
+app = FastAPI(title="Udemy Downloader API", default_response_class=FastJSONResponse,
+              dependencies=[Depends(track_activity)])
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Release the pooled keep-alive connections to Udemy
+    await close_async_session()
 
 # Mount the static frontend files
 # We will serve the index.html on the root path later.
 app.mount("/app", StaticFiles(directory="public"), name="public")
 
+# How many lectures /api/resolve-course resolves against Udemy at once
+RESOLVE_CONCURRENCY = int(os.environ.get("RESOLVE_CONCURRENCY", "8"))
+
+# Behind nginx/Apache (e.g. Passenger), hand cached media to the web server's sendfile instead:
+# MEDIA_SENDFILE_HEADER=X-Accel-Redirect (nginx) or X-Sendfile (Apache), plus the URL/path prefix
+# under which MEDIA_CACHE_DIR is exposed to it. Cached files are 0600, so the proxy has to run as this account.
+MEDIA_SENDFILE_HEADER = os.environ.get("MEDIA_SENDFILE_HEADER")
+MEDIA_SENDFILE_PREFIX = os.environ.get("MEDIA_SENDFILE_PREFIX", "")
+
 class TokenReq(BaseModel):
     access_token: str
 
@@ -21,64 +56,148 @@ class LoginReq(BaseModel):
     email: str
     password: str
 
+class JobReq(BaseModel):
+    course_id: int
+    title: Optional[str] = None
+    lecture_ids: Optional[List[int]] = None
+    priority: int = DEFAULT_PRIORITY
+
+def _asset_key(api, course_id, lecture_id):
+    return (token_hash(api.access_token), course_id, lecture_id)
+
+async def fetch_lecture_asset(api, course_id, lecture_id):
+    """Returns a lecture's asset payload through the shared expiry-aware asset cache."""
+    return await asset_cache.get(_asset_key(api, course_id, lecture_id), lambda: api.get_lecture_asset(course_id, lecture_id))
+
+# Opt-in (PREFETCH_LECTURES): warms the asset lookups of the lectures a user is likely to open next
+prefetcher = Prefetcher(fetch_lecture_asset, lambda api, course_id, lecture_id: asset_cache.contains(_asset_key(api, course_id, lecture_id)))
+
+def _courses_key(api):
+    return f"courses:{token_hash(api.access_token)}"
+
+async def fetch_course_pages(api):
+    """Returns the raw enrolled-course listing pages through the stale-while-revalidate listing cache."""
+    async def load(previous):
+        return await api.get_subscribed_courses_pages(previous["pages"] if previous else None)
+
+    return await listing_cache.get(_courses_key(api), load)
+
+def _listing_json(request, key, cached, build):
+    """negotiated_json for a response built from a cached listing, memoized per listing version."""
+    version = listing_cache.version(key, cached)
+    return negotiated_json(request, lambda: build(cached["pages"]), cache_key=(key, version) if version else None)
+
+def _curriculum_loader(api, course_id):
+    async def load(previous):
+        return await api.get_course_curriculum_pages(course_id, previous["pages"] if previous else None)
+    return load
+
+def _curriculum_key(api, course_id):
+    return f"curriculum:{token_hash(api.access_token)}:{course_id}"
+
+async def fetch_curriculum(api, course_id):
+    """Returns a course curriculum through the stale-while-revalidate listing cache."""
+    res = await listing_cache.get(_curriculum_key(api, course_id), _curriculum_loader(api, course_id))
+    if "error" in res:
+        return res
+    return curriculum_from_pages(res["pages"])
+
 @app.post("/api/login")
 async def login(req: LoginReq):
     """
     Attempts to login via email and password instead of access_token.
     """
-    res = UdemyAPI.login_with_credentials(req.email, req.password)
+    res = await AsyncUdemyAPI.login_with_credentials(req.email, req.password)
     
     if "error" in res:
         raise HTTPException(status_code=401, detail=res["error"])
-        
+
+    # The token was just issued, so the /api/auth check the frontend makes next needn't ask Udemy
+    await token_cache.remember(token_hash(res["access_token"]), {"valid": True})
     return {"status": "success", "access_token": res["access_token"]}
 
 @app.post("/api/auth")
 async def auth(req: TokenReq):
     """
-    Validates the token by attempting to fetch the first page of courses.
+    Validates the token with a single one-item request; the verdict is cached briefly per token.
     """
-    api = UdemyAPI(req.access_token)
-    res = api.get_subscribed_courses()
-    
-    if "error" in res:
-        raise HTTPException(status_code=401, detail=res["error"])
-        
+    api = AsyncUdemyAPI(req.access_token)
+    res = await token_cache.get(token_hash(req.access_token), api.check_token)
+
+    if not res.get("valid"):
+        # No verdict at all means Udemy couldn't be asked, which says nothing about the token
+        raise HTTPException(status_code=401 if "valid" in res else 503, detail=res["error"])
+
     # If successful, we just return an OK status to the frontend
     return {"status": "success", "message": "Token is valid"}
 
 @app.get("/api/courses")
-async def get_courses(authorization: str = Header(None)):
+async def get_courses(request: Request, authorization: str = Header(None)):
     """
     Returns the list of enrolled courses.
     The frontend should send the token in the Authorization header.
+    Carries an ETag (answering If-None-Match with 304) and is compressed when the client accepts it.
     """
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization Header")
         
-    api = UdemyAPI(authorization)
-    res = api.get_subscribed_courses()
+    api = AsyncUdemyAPI(authorization)
+    res = await fetch_course_pages(api)
     
     if "error" in res:
         raise HTTPException(status_code=400, detail=res["error"])
         
-    return res
+    return _listing_json(request, _courses_key(api), res, courses_from_pages)
 
 @app.get("/api/curriculum/{course_id}")
-async def get_curriculum(course_id: int, authorization: str = Header(None)):
+async def get_curriculum(course_id: int, request: Request, authorization: str = Header(None)):
     """
     Returns the curriculum for a given course.
+    Cached curricula carry an ETag (answering If-None-Match with 304) and are compressed when
+    the client accepts it; a cold miss is streamed out as the pages arrive instead.
     """
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization Header")
         
-    api = UdemyAPI(authorization)
-    res = api.get_course_curriculum(course_id)
-    
-    if "error" in res:
-        raise HTTPException(status_code=400, detail=res["error"])
-        
-    return res
+    api = AsyncUdemyAPI(authorization)
+    key = _curriculum_key(api, course_id)
+    cached = await listing_cache.get_cached(key, _curriculum_loader(api, course_id))
+    if cached is not None:
+        if prefetcher.enabled and not await request.is_disconnected():
+            prefetcher.curriculum_served(api, course_id, curriculum_from_pages(cached["pages"])["curriculum"])
+        return _listing_json(request, key, cached, curriculum_from_pages)
+
+    # Cold miss: stream {"curriculum": [...]} out page by page as Udemy returns it
+    pages = api.iter_course_curriculum_pages(course_id)
+    try:
+        first = await pages.__anext__()
+    except RequestException:
+        raise HTTPException(status_code=400, detail="Failed to fetch curriculum.")
+
+    async def stream():
+        fetched = [first]
+        separator = ""
+        yield '{"curriculum": ['
+        try:
+            page = first
+            while True:
+                for item in page["results"]:
+                    yield separator + json.dumps(item)
+                    separator = ", "
+                page = await pages.__anext__()
+                fetched.append(page)
+        except StopAsyncIteration:
+            yield "]}"
+            await listing_cache.put(key, {"pages": fetched})
+            # Only once the client has taken the whole curriculum; a disconnect never gets here
+            prefetcher.curriculum_served(api, course_id, [item for page in fetched for item in page["results"]])
+        except RequestException:
+            # Too late for an error status: close the JSON and flag the truncation instead
+            yield '], "error": "Failed to fetch curriculum."}'
+        finally:
+            await pages.aclose()
+
+    return StreamingResponse(stream(), media_type="application/json")
 
 @app.get("/api/resolve-download/{course_id}/{lecture_id}")
 async def resolve_download(course_id: int, lecture_id: int, quality: str = None, authorization: str = Header(None)):
@@ -90,8 +209,9 @@ async def resolve_download(course_id: int, lecture_id: int, quality: str = None,
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization Header")
         
-    api = UdemyAPI(authorization)
-    asset_info = api.get_lecture_asset(course_id, lecture_id)
+    api = AsyncUdemyAPI(authorization)
+    asset_info = await fetch_lecture_asset(api, course_id, lecture_id)
+    prefetcher.lecture_resolved(api, course_id, lecture_id)
     
     if not asset_info:
         raise HTTPException(status_code=404, detail="Asset not found")
@@ -99,42 +219,66 @@ async def resolve_download(course_id: int, lecture_id: int, quality: str = None,
     if "error" in asset_info:
         raise HTTPException(status_code=400, detail=asset_info["error"])
         
-    asset = asset_info.get("asset", {})
+    asset = Asset.from_json(asset_info.get("asset"))
     
     # Check for DRM
-    if asset.get("course_is_drmed") or asset.get("media_license_token"):
+    if asset.is_drm:
          return {"status": "drm_locked", "message": "This video is DRM protected and cannot be downloaded."}
-         
-    # Try to extract stream URLs
-    stream_urls = asset.get("stream_urls")
-    if stream_urls:
-         video_streams = stream_urls.get("Video", [])
-         if video_streams:
-             
-             # If a specific quality is requested, try to find it
-             if quality:
-                 for stream in video_streams:
-                     if str(stream.get("label")) == quality:
-                         return {"status": "success", "url": stream.get("file"), "type": "video", "quality": quality}
-             
-             # Fallback to highest quality if specific one isn't found or requested
-             try:
-                 video_streams.sort(key=lambda x: int(x.get("label", "0")), reverse=True)
-             except ValueError:
-                 pass
-             
-             best_stream = video_streams[0]
-             return {"status": "success", "url": best_stream.get("file"), "type": "video", "quality": best_stream.get("label")}
-                 
-    # Fallback to download_urls if stream_urls fails
-    download_urls = asset.get("download_urls")
-    if download_urls:
-         video_downloads = download_urls.get("Video", [])
-         if video_downloads:
-             return {"status": "success", "url": video_downloads[0].get("file"), "type": "video"}
+
+    video = asset.select_video(quality)
+    if video:
+         return {"status": "success", "type": "video", **video.to_dict()}
              
     raise HTTPException(status_code=404, detail="No suitable download link found for this non-DRM video.")
 
+@app.get("/api/media/{course_id}/{lecture_id}")
+async def relay_media(course_id: int, lecture_id: int, request: Request, quality: str = None,
+                      authorization: str = Header(None)):
+    """
+    Relays a lecture's video through this server, with HTTP Range support.
+    Videos are cached on local disk (shared between users who can access the lecture, LRU-bounded),
+    so repeat fetches are served from disk without touching Udemy's CDN.
+    """
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Missing Authorization Header")
+
+    # Resolving with the caller's own token is also what authorizes them for the shared cache entry
+    api = AsyncUdemyAPI(authorization)
+    asset_info = await fetch_lecture_asset(api, course_id, lecture_id)
+    prefetcher.lecture_resolved(api, course_id, lecture_id)
+    if not asset_info:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    if "error" in asset_info:
+        raise HTTPException(status_code=400, detail=asset_info["error"])
+
+    asset = Asset.from_json(asset_info.get("asset"))
+    if asset.is_drm:
+        raise HTTPException(status_code=403, detail="This video is DRM protected and cannot be downloaded.")
+    video = asset.select_video(quality)
+    if not video:
+        raise HTTPException(status_code=404, detail="No suitable video stream found.")
+    if urlparse(video.url).path.endswith(".m3u8"):
+        raise HTTPException(status_code=422, detail="This lecture is only available as HLS; use /api/jobs to download it.")
+
+    key = media_key(course_id, lecture_id, video.label)
+    path = media_cache.lookup(key)
+    if path:
+        if MEDIA_SENDFILE_HEADER:
+            return Response(headers={MEDIA_SENDFILE_HEADER: MEDIA_SENDFILE_PREFIX + os.path.basename(path)},
+                            media_type="video/mp4")
+        # FileResponse answers Range requests itself
+        return FileResponse(path, media_type="video/mp4")
+
+    range_header = request.headers.get("range")
+    if range_header in ("bytes=0-", ""):
+        range_header = None
+    # A signed URL the CDN refuses won't start working again: resolve a fresh one next time
+    response = await relay(media_cache, key, video.url, range_header,
+                           on_rejected=lambda: asset_cache.invalidate(_asset_key(api, course_id, lecture_id)))
+    if response is None:
+        raise HTTPException(status_code=502, detail="Upstream media request failed")
+    return response
+
 @app.get("/api/lecture-qualities/{course_id}/{lecture_id}")
 async def lecture_qualities(course_id: int, lecture_id: int, authorization: str = Header(None)):
     """
@@ -143,31 +287,20 @@ async def lecture_qualities(course_id: int, lecture_id: int, authorization: str
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization Header")
         
-    api = UdemyAPI(authorization)
-    asset_info = api.get_lecture_asset(course_id, lecture_id)
+    api = AsyncUdemyAPI(authorization)
+    asset_info = await fetch_lecture_asset(api, course_id, lecture_id)
+    prefetcher.lecture_resolved(api, course_id, lecture_id)
     
     if not asset_info or "error" in asset_info:
         raise HTTPException(status_code=400, detail="Failed to fetch asset info")
         
-    asset = asset_info.get("asset", {})
+    asset = Asset.from_json(asset_info.get("asset"))
     
-    if asset.get("course_is_drmed") or asset.get("media_license_token"):
+    if asset.is_drm:
          return {"is_drm": True, "qualities": []}
          
-    qualities = []
-    stream_urls = asset.get("stream_urls")
-    if stream_urls and "Video" in stream_urls:
-        for stream in stream_urls.get("Video", []):
-            if stream.get("label"):
-                qualities.append(str(stream.get("label")))
-                
-    # Sort qualities descending (e.g. 1080, 720, 480)
-    try:
-        qualities.sort(key=lambda x: int(x), reverse=True)
-    except ValueError:
-        pass
-        
-    return {"is_drm": False, "qualities": list(set(qualities))}
+    # Highest first (e.g. 1080, 720, 480), without duplicates
+    return {"is_drm": False, "qualities": list(dict.fromkeys(asset.qualities))}
 
 @app.get("/api/resolve-attachment/{course_id}/{lecture_id}/{asset_id}")
 async def resolve_attachment(course_id: int, lecture_id: int, asset_id: int, authorization: str = Header(None)):
@@ -177,8 +310,8 @@ async def resolve_attachment(course_id: int, lecture_id: int, asset_id: int, aut
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization Header")
         
-    api = UdemyAPI(authorization)
-    supp_info = api.get_supplementary_asset(course_id, lecture_id, asset_id)
+    api = AsyncUdemyAPI(authorization)
+    supp_info = await api.get_supplementary_asset(course_id, lecture_id, asset_id)
     
     if not supp_info:
         raise HTTPException(status_code=404, detail="Attachment not found")
@@ -186,16 +319,284 @@ async def resolve_attachment(course_id: int, lecture_id: int, asset_id: int, aut
     if "error" in supp_info:
         raise HTTPException(status_code=400, detail=supp_info["error"])
         
-    download_urls = supp_info.get("download_urls", {})
-    
-    # It's usually under 'File'
-    if "File" in download_urls and len(download_urls["File"]) > 0:
-        file_url = download_urls["File"][0].get("file")
-        if file_url:
-             return {"status": "success", "url": file_url, "type": "attachment"}
+    file_url = attachment_url(supp_info)
+    if file_url:
+         return {"status": "success", "url": file_url, "type": "attachment"}
              
     raise HTTPException(status_code=404, detail="Could not extract download link for attachment.")
 
+async def _resolve_lecture(api, course_id, lecture, quality):
+    """Resolves one curriculum Lecture (video and attachments) into a result dict for /api/resolve-course."""
+    lecture_id = lecture.id
+    result = {"lecture_id": lecture_id, "title": lecture.title, "object_index": lecture.object_index}
+
+    # The slim curriculum projection may omit asset_type: is_video then says "look it up"
+    if lecture.asset.is_video:
+        asset_info = await fetch_lecture_asset(api, course_id, lecture_id)
+        if not asset_info or "error" in asset_info:
+            result["status"] = "error"
+            result["message"] = (asset_info or {}).get("error", "Asset not found")
+        else:
+            asset = Asset.from_json(asset_info.get("asset"))
+            video = asset.select_video(quality)
+            if not asset.is_video:
+                result["status"] = "no_video"
+            elif asset.is_drm:
+                result["status"] = "drm_locked"
+            else:
+                result["status"] = "success" if video else "not_found"
+                if video:
+                    result.update(video.to_dict())
+    else:
+        result["status"] = "no_video"
+
+    attachments = []
+    for supp in lecture.attachments:
+        if not supp.id or supp.is_external:
+            continue
+        supp_info = await api.get_supplementary_asset(course_id, lecture_id, supp.id)
+        file_url = attachment_url(supp_info) if supp_info and "error" not in supp_info else None
+        attachments.append({
+            "asset_id": supp.id,
+            "filename": supp.filename or supp.title,
+            "url": file_url
+        })
+    result["attachments"] = attachments
+    return result
+
+@app.get("/api/resolve-course/{course_id}")
+async def resolve_course(course_id: int, quality: str = None, authorization: str = Header(None)):
+    """
+    Resolves every lecture of a course (best video URL plus attachment URLs) in one call.
+    Results are streamed back as NDJSON, one line per lecture in completion order,
+    followed by a final {"status": "done"} line.
+    """
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Missing Authorization Header")
+
+    api = AsyncUdemyAPI(authorization)
+    res = await fetch_curriculum(api, course_id)
+
+    if "error" in res:
+        raise HTTPException(status_code=400, detail=res["error"])
+
+    lectures = [Lecture.from_json(item) for item in res["curriculum"] if item.get("_class") == "lecture"]
+    semaphore = asyncio.Semaphore(RESOLVE_CONCURRENCY)
+
+    async def resolve(item):
+        async with semaphore:
+            return await _resolve_lecture(api, course_id, item, quality)
+
+    async def stream():
+        tasks = [asyncio.ensure_future(resolve(item)) for item in lectures]
+        try:
+            with metrics.span("resolve_course", course=course_id):
+                for next_done in asyncio.as_completed(tasks):
+                    yield json.dumps(await next_done) + "\n"
+            yield json.dumps({"status": "done", "count": len(lectures)}) + "\n"
+        finally:
+            # Client went away (or we finished): don't leave resolves running
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.get("/api/courses/{course_id}/attachments.zip")
+async def attachments_zip(course_id: int, authorization: str = Header(None)):
+    """
+    Streams every attachment of a course as one ZIP, laid out in chapter folders.
+    Attachments are resolved concurrently and each file is relayed into the archive as its
+    bytes arrive, in resolve order, so nothing is buffered or written to disk. Attachments
+    that can't be fetched are listed in a MISSING.txt at the end.
+    """
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Missing Authorization Header")
+
+    api = AsyncUdemyAPI(authorization)
+    res = await fetch_curriculum(api, course_id)
+    if "error" in res:
+        raise HTTPException(status_code=400, detail=res["error"])
+
+    attachments = course_attachments(res["curriculum"])
+    if not attachments:
+        raise HTTPException(status_code=404, detail="This course has no attachments.")
+    semaphore = asyncio.Semaphore(RESOLVE_CONCURRENCY)
+
+    async def resolve(found):
+        folder, lecture, supp = found
+        async with semaphore:
+            supp_info = await api.get_supplementary_asset(course_id, lecture.id, supp.id)
+        return found, attachment_url(supp_info) if supp_info and "error" not in supp_info else None
+
+    async def stream():
+        archive = ZipStream()
+        missing = []
+        tasks = [asyncio.ensure_future(resolve(found)) for found in attachments]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                (folder, lecture, supp), file_url = await next_done
+                label = archive_name(folder, supp, file_url or "")
+                try:
+                    upstream = await get_async_session().get(file_url, stream=True) if file_url else None
+                except RequestException:
+                    upstream = None
+                if upstream is None or upstream.status_code != 200:
+                    if upstream is not None:
+                        await upstream.aclose()
+                    missing.append(label)
+                    continue
+                yield archive.start_entry(label)
+                try:
+                    async for chunk in upstream.aiter_content():
+                        yield archive.write(chunk)
+                except RequestException:
+                    # Too late to leave it out: close the truncated entry and report it
+                    missing.append(label)
+                finally:
+                    await upstream.aclose()
+                yield archive.end_entry()
+            if missing:
+                yield archive.add(MISSING_NAME, missing_report(missing))
+            yield archive.finish()
+        finally:
+            # Client went away (or we finished): don't leave resolves running
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/zip", headers={
+        "Content-Disposition": f'attachment; filename="course-{course_id}-attachments.zip"'
+    })
+
+@app.get("/api/plan/{course_id}")
+async def plan_course(course_id: int, budget_gb: float = None, mbps: float = None, hours: float = None,
+                      authorization: str = Header(None)):
+    """
+    Probes the size of every video stream and attachment of a course and returns the total
+    bytes per quality tier. With a disk budget (budget_gb) and/or a bandwidth budget
+    (mbps megabytes/sec for `hours`), also recommends the best tier that fits.
+    """
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Missing Authorization Header")
+
+    res = await fetch_curriculum(AsyncUdemyAPI(authorization), course_id)
+    if "error" in res:
+        raise HTTPException(status_code=400, detail=res["error"])
+
+    budgets = []
+    if budget_gb is not None:
+        budgets.append(int(budget_gb * 1024 ** 3))
+    if mbps and hours:
+        budgets.append(int(mbps * 1024 * 1024 * hours * 3600))
+    budget = min(budgets) if budgets else None
+
+    # Probing is blocking HTTP fanned out over a thread pool
+    planner = SizePlanner(UdemyAPI(authorization))
+    return await asyncio.to_thread(planner.plan, course_id, res["curriculum"], budget)
+
+def _owned_job(job_id, authorization):
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Missing Authorization Header")
+    job = job_manager.get(job_id, token_hash(authorization))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/api/jobs")
+async def create_job(req: JobReq, authorization: str = Header(None)):
+    """
+    Queues a server-side download of a course, or of just `lecture_ids` from it.
+    Lower `priority` values run first; each token gets a limited number of jobs running at once.
+    """
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Missing Authorization Header")
+
+    # The title becomes the job's folder name under JOBS_DIR
+    if req.title is not None and sanitize_filename(req.title) in ("", ".", ".."):
+        raise HTTPException(status_code=422, detail="Invalid title.")
+
+    job = Job(authorization, req.course_id, req.title, req.lecture_ids, req.priority)
+    try:
+        job_manager.submit(job)
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return job.to_dict()
+
+@app.get("/api/jobs")
+async def list_jobs(authorization: str = Header(None)):
+    """
+    Returns every job submitted with this token.
+    """
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Missing Authorization Header")
+
+    return {"jobs": [job.to_dict() for job in job_manager.list(token_hash(authorization))]}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, authorization: str = Header(None)):
+    return _owned_job(job_id, authorization).to_dict()
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, authorization: str = Header(None)):
+    """
+    Server-Sent Events stream of a job's progress: a `progress` event whenever it changes
+    (at most every 0.5s) and a final `end` event once it completes, fails or is cancelled.
+    """
+    job = _owned_job(job_id, authorization)
+
+    async def stream():
+        seen = None
+        while True:
+            if job.version != seen:
+                seen = job.version
+                payload = job.to_dict()
+                if payload["state"] in TERMINAL_STATES:
+                    yield f"event: end\ndata: {json.dumps(payload)}\n\n"
+                    return
+                yield f"event: progress\ndata: {json.dumps(payload)}\n\n"
+            else:
+                # Comment line keeps proxies from timing out an idle stream
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, authorization: str = Header(None)):
+    return job_manager.cancel(_owned_job(job_id, authorization)).to_dict()
+
+@app.post("/api/jobs/{job_id}/resume")
+async def resume_job(job_id: str, authorization: str = Header(None)):
+    """
+    Re-queues a cancelled or failed job. Finished files are skipped and partial ones resumed.
+    """
+    job = _owned_job(job_id, authorization)
+    if job.state not in ("cancelled", "failed"):
+        raise HTTPException(status_code=409, detail=f"Job is {job.state}")
+    try:
+        return job_manager.resume(job).to_dict()
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/api/cache-stats")
+async def cache_stats():
+    """
+    Returns hit/miss counters for the in-process caches.
+    """
+    return {
+        "lecture_assets": asset_cache.stats(),
+        "listings": listing_cache.stats(),
+        "tokens": token_cache.stats(),
+        "media": media_cache.stats(),
+        "prefetch": prefetcher.stats()
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Prometheus scrape endpoint: Udemy API latency, transfer, post-processing, span and cache metrics.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     # Redirect root to /app/index.html
@@ -0,0 +1,252 @@
+"""
+Load benchmark for every api.py route against the local fake Udemy server.
+
+Starts bench/fake_udemy.py in-process and `uvicorn api:app` in a subprocess pointed at it,
+then drives each route with --concurrency parallel clients for --requests requests.
+Prints one JSON object per route (req/s, p50/p90/p99/max latency, the first (cold) request,
+errors) and a final summary with the server's peak RSS:
+
+    python bench/bench_api.py --requests 500 --concurrency 32
+    python bench/bench_api.py --route curriculum --route resolve_course --workers 4 --cache-url sqlite:///tmp/bench.sqlite3
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from curl_cffi import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_udemy
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values, share):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(share * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def peak_rss_mb(pid):
+    """Peak RSS (VmHWM) of pid plus its worker processes, from /proc; None where that isn't available."""
+    total_kb = 0
+    pids = [pid]
+    for children in glob.glob(f"/proc/{pid}/task/*/children"):
+        with open(children) as f:
+            pids += [int(child) for child in f.read().split()]
+    for each in pids:
+        try:
+            with open(f"/proc/{each}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            return None
+    return round(total_kb / 1024, 1)
+
+
+class Route:
+    """One benchmarked route: request i is `method path(i)` with an optional JSON body."""
+    def __init__(self, name, method, path, body=None, ok=(200,)):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body
+        self.ok = ok
+
+
+def build_routes(fake, course_id, tokens):
+    lectures = fake.lecture_ids(course_id)
+    with_attachment = [lecture_id for lecture_id in lectures if fake.has_attachment(lecture_id)] or lectures
+    lecture = lambda i: lectures[i % len(lectures)]
+    attachment = lambda i: with_attachment[i % len(with_attachment)]
+    return [
+        Route("index", "GET", lambda i: "/", ok=(200, 302)),
+        Route("login", "POST", lambda i: "/api/login", lambda i: {"email": f"user{i}@example.com", "password": "secret"}),
+        Route("auth", "POST", lambda i: "/api/auth", lambda i: {"access_token": tokens[i % len(tokens)]}),
+        Route("courses", "GET", lambda i: "/api/courses"),
+        Route("curriculum", "GET", lambda i: f"/api/curriculum/{course_id}"),
+        Route("resolve_download", "GET", lambda i: f"/api/resolve-download/{course_id}/{lecture(i)}"),
+        Route("lecture_qualities", "GET", lambda i: f"/api/lecture-qualities/{course_id}/{lecture(i)}"),
+        Route("resolve_attachment", "GET",
+              lambda i: f"/api/resolve-attachment/{course_id}/{attachment(i)}/{attachment(i) * 10 + 1}"),
+        Route("resolve_course", "GET", lambda i: f"/api/resolve-course/{course_id}"),
+        Route("attachments_zip", "GET", lambda i: f"/api/courses/{course_id}/attachments.zip"),
+        Route("plan", "GET", lambda i: f"/api/plan/{course_id}?budget_gb=1"),
+        Route("media", "GET", lambda i: f"/api/media/{course_id}/{lecture(i)}?quality=360"),
+        Route("jobs_create", "POST", lambda i: "/api/jobs", lambda i: {"course_id": course_id, "lecture_ids": [0]}),
+        Route("jobs_list", "GET", lambda i: "/api/jobs"),
+        Route("job_get", "GET", lambda i: "/api/jobs/{job_id}"),
+        Route("job_events", "GET", lambda i: "/api/jobs/{job_id}/events"),
+        Route("job_cancel", "POST", lambda i: "/api/jobs/{job_id}/cancel"),
+        Route("job_resume", "POST", lambda i: "/api/jobs/{job_id}/resume", ok=(200, 409)),
+        Route("cache_stats", "GET", lambda i: "/api/cache-stats"),
+        Route("metrics", "GET", lambda i: "/metrics"),
+    ]
+
+
+async def run_route(session, base, route, requests_total, concurrency, tokens, job_id):
+    latencies = []
+    statuses = {}
+    errors = 0
+    received = 0
+    counter = iter(range(requests_total))
+    first_ms = None
+
+    async def client():
+        nonlocal errors, received, first_ms
+        for i in counter:
+            token = tokens[i % len(tokens)]
+            kwargs = {"headers": {"Authorization": token, "Accept-Encoding": "gzip, br"}, "allow_redirects": False}
+            if route.body:
+                kwargs["json"] = route.body(i)
+            url = base + route.path(i).replace("{job_id}", job_id or "")
+            started = time.perf_counter()
+            try:
+                response = await session.request(route.method, url, **kwargs)
+                elapsed = time.perf_counter() - started
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                received += len(response.content)
+                if response.status_code not in route.ok:
+                    errors += 1
+            except requests.exceptions.RequestException:
+                elapsed = time.perf_counter() - started
+                statuses["error"] = statuses.get("error", 0) + 1
+                errors += 1
+            latencies.append(elapsed)
+            if i == 0:
+                first_ms = round(elapsed * 1000, 2)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        "route": route.name,
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "req_per_s": round(len(latencies) / wall, 1),
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p90_ms": ms(percentile(latencies, 0.90)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+        "first_ms": first_ms,
+        "errors": errors,
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        "mb_received": round(received / (1024 * 1024), 2)
+    }
+
+
+async def wait_for_server(session, base, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"uvicorn exited with code {process.returncode}")
+        try:
+            if (await session.get(base + "/api/cache-stats")).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        await asyncio.sleep(0.1)
+    raise SystemExit("uvicorn did not come up in time")
+
+
+async def create_finished_job(session, base, token, course_id):
+    """A job for the job_* routes to look at: it only walks the curriculum, then completes."""
+    headers = {"Authorization": token}
+    response = await session.post(base + "/api/jobs", json={"course_id": course_id, "lecture_ids": [0]}, headers=headers)
+    job_id = response.json()["id"]
+    for _ in range(300):
+        if (await session.get(f"{base}/api/jobs/{job_id}", headers=headers)).json()["state"] in ("completed", "failed"):
+            break
+        await asyncio.sleep(0.1)
+    return job_id
+
+
+async def bench(args, fake, base, process):
+    tokens = [f"bench-token-{i}" for i in range(args.tokens)]
+    routes = build_routes(fake, args.course, tokens)
+    if args.route:
+        routes = [route for route in routes if route.name in args.route]
+
+    async with requests.AsyncSession(max_clients=args.concurrency * 2, timeout=120) as session:
+        await wait_for_server(session, base, process)
+        job_id = None
+        if any(route.name.startswith("job_") for route in routes):
+            job_id = await create_finished_job(session, base, tokens[0], args.course)
+        results = []
+        for route in routes:
+            result = await run_route(session, base, route, args.requests, args.concurrency, tokens, job_id)
+            results.append(result)
+            print(json.dumps(result), flush=True)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per route")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--route", action="append", help="Only benchmark these routes (repeatable)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--tokens", type=int, default=1, help="Distinct access tokens to spread requests over")
+    parser.add_argument("--course", type=int, default=1)
+    parser.add_argument("--cache-url", default="memory://", help="CACHE_URL for the server (see cachebackends.py)")
+    fake_udemy.add_arguments(parser)
+    args = parser.parse_args()
+
+    fake = fake_udemy.from_args(args).start()
+    scratch = tempfile.mkdtemp(prefix="bench_api_")
+    port = free_port()
+    env = {
+        **os.environ, **fake.env(),
+        "CACHE_URL": args.cache_url,
+        "MEDIA_CACHE_DIR": os.path.join(scratch, "media"),
+        "JOBS_DIR": os.path.join(scratch, "jobs"),
+        "UDEMY_RATE": os.environ.get("UDEMY_RATE", "100000"),
+        "UDEMY_BURST": os.environ.get("UDEMY_BURST", "100000")
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+        # The server's own progress prints would interleave with the JSON results
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL
+    )
+    try:
+        started = time.perf_counter()
+        results = asyncio.run(bench(args, fake, f"http://127.0.0.1:{port}", process))
+        print(json.dumps({
+            "summary": True,
+            "routes": len(results),
+            "errors": sum(result["errors"] for result in results),
+            "seconds": round(time.perf_counter() - started, 2),
+            "server_peak_rss_mb": peak_rss_mb(process.pid),
+            "upstream_requests": fake.requests,
+            "upstream_throttled": fake.throttled
+        }))
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        fake.stop()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+End-to-end benchmark: main.py downloads a whole course from the local fake Udemy server.
+
+main.py runs in a subprocess (so its peak RSS is measured on its own) against
+bench/fake_udemy.py. Prints one JSON object with wall time, bytes written, MB/s and peak RSS:
+
+    python bench/bench_course.py --lectures-per-chapter 20 --video-mb 16 --bandwidth-mbps 200
+    python bench/bench_course.py --rate-429 0.05 --main-arg=--transfer-workers=8
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_udemy
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def tree_size(path):
+    total = files = 0
+    for folder, _, names in os.walk(path):
+        for name in names:
+            total += os.path.getsize(os.path.join(folder, name))
+            files += 1
+    return total, files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--course", type=int, default=1)
+    parser.add_argument("--main-arg", action="append", default=[],
+                        help="Extra argument passed to main.py (repeatable), e.g. --main-arg=--quality=720")
+    parser.add_argument("--keep", action="store_true", help="Keep the downloaded files (path is in the output)")
+    fake_udemy.add_arguments(parser)
+    args = parser.parse_args()
+
+    fake = fake_udemy.from_args(args).start()
+    output = tempfile.mkdtemp(prefix="bench_course_")
+    env = {**os.environ, **fake.env(), "UDEMY_RATE": os.environ.get("UDEMY_RATE", "1000"),
+           "UDEMY_BURST": os.environ.get("UDEMY_BURST", "1000")}
+    command = [sys.executable, os.path.join(ROOT, "main.py"), "--token", "bench", "--course", str(args.course),
+               "--output", output, *args.main_arg]
+
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        returncode = subprocess.run(command, cwd=ROOT, env=env, stdout=devnull).returncode
+    elapsed = time.perf_counter() - started
+    fake.stop()
+
+    peak_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if sys.platform == "darwin":
+        peak_kb //= 1024
+    size, files = tree_size(output)
+    expected = args.chapters * args.lectures_per_chapter
+    if not args.keep:
+        shutil.rmtree(output, ignore_errors=True)
+
+    print(json.dumps({
+        "ok": returncode == 0,
+        "lectures": expected,
+        "files": files,
+        "bytes": size,
+        "seconds": round(elapsed, 3),
+        "mb_per_s": round(size / (1024 * 1024) / elapsed, 1),
+        "peak_rss_mb": round(peak_kb / 1024, 1),
+        "api_requests": fake.requests,
+        "throttled": fake.throttled,
+        "output": output if args.keep else None
+    }))
+
+
+if __name__ == "__main__":
+    main()
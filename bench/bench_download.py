@@ -0,0 +1,128 @@
+"""
+Microbenchmark for Downloader.download_file against a local HTTP server.
+
+Each scenario runs in a fresh subprocess so its peak RSS is measured on its own.
+Prints one JSON object per scenario:
+
+    python bench/bench_download.py --size-mb 512
+"""
+import argparse
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+BLOCK = bytes(range(256)) * 4096  # 1 MB
+
+
+class PayloadHandler(BaseHTTPRequestHandler):
+    """
+    Serves `size` bytes of synthetic data generated on the fly.
+    /ranged honours Range requests, /plain ignores them, /unsized sends no Content-Length.
+    """
+    protocol_version = "HTTP/1.1"
+    size = 0
+
+    def do_GET(self):
+        start, end = 0, self.size - 1
+        ranged = self.path.startswith("/ranged")
+        unsized = self.path.startswith("/unsized")
+
+        range_header = self.headers.get("Range")
+        if ranged and range_header:
+            match = re.match(r"bytes=(\d+)-(\d*)", range_header)
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else end
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{self.size}")
+        else:
+            self.send_response(200)
+
+        if unsized:
+            # No length: the body ends when the connection closes
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        else:
+            self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = BLOCK[:min(len(BLOCK), remaining)]
+            self.wfile.write(chunk)
+            remaining -= len(chunk)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(size):
+    PayloadHandler.size = size
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PayloadHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_one(url, size):
+    """Child process: download once and report throughput and peak RSS."""
+    import downloader
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dl = downloader.Downloader(tmp)
+        dest = os.path.join(tmp, "payload.bin")
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                started = time.perf_counter()
+                dl.download_file(url, dest)
+                elapsed = time.perf_counter() - started
+            finally:
+                sys.stdout = stdout
+        ok = os.path.exists(dest) and os.path.getsize(dest) == size
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_kb //= 1024
+    print(json.dumps({
+        "ok": ok,
+        "seconds": round(elapsed, 3),
+        "mb_per_s": round(size / (1024 * 1024) / elapsed, 1),
+        "peak_rss_mb": round(peak_kb / 1024, 1)
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--scenario", action="append", choices=["ranged", "plain", "unsized"],
+                        help="Scenario(s) to run (default: all)")
+    parser.add_argument("--child-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    size = args.size_mb * 1024 * 1024
+
+    if args.child_url:
+        run_one(args.child_url, size)
+        return
+
+    server = start_server(size)
+    base = f"http://127.0.0.1:{server.server_port}"
+    for scenario in args.scenario or ["ranged", "plain", "unsized"]:
+        out = subprocess.run(
+            [sys.executable, __file__, "--size-mb", str(args.size_mb), "--child-url", f"{base}/{scenario}/payload.bin"],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(json.dumps({"scenario": scenario, "size_mb": args.size_mb, **result}))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
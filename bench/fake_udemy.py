@@ -0,0 +1,440 @@
+"""
+Local stand-in for the parts of Udemy that UdemyAPI and the downloader talk to.
+
+Serves the api-2.0 endpoints (paginated subscribed-courses and subscriber-curriculum-items,
+lecture assets with stream_urls, supplementary assets), the login popup, and synthetic media:
+progressive MP4s (valid enough for in-place branding, with Range and HEAD support), HLS
+playlists with .ts segments, and zip attachments. Latency, jitter, 429 rate and per-connection
+bandwidth are configurable. Point the app at it with UDEMY_BASE_URL / UDEMY_LOGIN_URL:
+
+    python bench/fake_udemy.py --port 8765 --latency-ms 40 --rate-429 0.02
+    UDEMY_BASE_URL=http://127.0.0.1:8765/api-2.0 python main.py --token x --course 1
+"""
+import argparse
+import io
+import json
+import random
+import re
+import struct
+import threading
+import time
+import zipfile
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+BLOCK = bytes(range(256)) * 256  # 64 KB
+# Share of the configured video size served at each quality label
+QUALITY_SCALE = {"1080": 1.0, "720": 0.5, "360": 0.25}
+HLS_SEGMENT_SECONDS = 4
+HLS_BANDWIDTH = {"1080": 5000000, "720": 2500000, "360": 800000}
+INVALID_TOKEN = "invalid"
+
+
+def _box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def mp4_header(payload_size, duration_seconds=60):
+    """ftyp + a minimal moov (just mvhd) + the mdat header for `payload_size` bytes of media."""
+    matrix = struct.pack(">9I", 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+    mvhd = _box(b"mvhd", struct.pack(">IIIIII", 0, 0, 0, 1000, duration_seconds * 1000, 0x00010000)
+                + struct.pack(">H", 0x0100) + bytes(10) + matrix + bytes(24) + struct.pack(">I", 2))
+    ftyp = _box(b"ftyp", b"isom" + struct.pack(">I", 512) + b"isomiso2mp41")
+    return ftyp + _box(b"moov", mvhd) + struct.pack(">I4s", 8 + payload_size, b"mdat")
+
+
+class FakeUdemy:
+    """Synthetic catalogue plus the knobs every request handler reads."""
+    def __init__(self, courses=3, chapters=5, lectures_per_chapter=10, video_mb=8.0, attachment_every=5,
+                 attachment_kb=256, hls_every=0, latency_ms=0.0, jitter_ms=0.0, rate_429=0.0, retry_after=1,
+                 bandwidth_mbps=0.0, seed=0):
+        self.courses = courses
+        self.chapters = chapters
+        self.lectures_per_chapter = lectures_per_chapter
+        self.video_bytes = int(video_mb * 1024 * 1024)
+        self.attachment_every = attachment_every
+        self.attachment_bytes = int(attachment_kb * 1024)
+        self.hls_every = hls_every
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        # Bytes per second per connection, 0 for unlimited
+        self.bandwidth = bandwidth_mbps * 1024 * 1024 / 8
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._zip = None
+        self.requests = 0
+        self.throttled = 0
+        self.server = None
+
+    @property
+    def origin(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    @property
+    def api_url(self):
+        return self.origin + "/api-2.0"
+
+    @property
+    def login_url(self):
+        return self.origin + "/join/login-popup/"
+
+    def env(self):
+        """Environment variables that point udemy.py at this server."""
+        return {"UDEMY_BASE_URL": self.api_url, "UDEMY_LOGIN_URL": self.login_url}
+
+    def start(self, host="127.0.0.1", port=0):
+        self.server = ThreadingHTTPServer((host, port), FakeUdemyHandler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _roll(self):
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + (self._random.uniform(-self.jitter, self.jitter) if self.jitter else 0)
+            throttle = self.rate_429 and self._random.random() < self.rate_429
+            if throttle:
+                self.throttled += 1
+        return max(delay, 0), throttle
+
+    # --- catalogue -------------------------------------------------------------------------
+
+    def course_ids(self):
+        return list(range(1, self.courses + 1))
+
+    def lecture_ids(self, course_id):
+        total = self.chapters * self.lectures_per_chapter
+        return [course_id * 10000 + i for i in range(1, total + 1)]
+
+    def has_attachment(self, lecture_id):
+        return self.attachment_every and lecture_id % self.attachment_every == 0
+
+    def is_hls(self, lecture_id):
+        return self.hls_every and lecture_id % self.hls_every == 0
+
+    def curriculum(self, course_id):
+        items = []
+        lectures = iter(self.lecture_ids(course_id))
+        for chapter in range(1, self.chapters + 1):
+            items.append({"_class": "chapter", "id": course_id * 10000 + 5000 + chapter,
+                          "title": f"Chapter {chapter}", "object_index": chapter})
+            for _ in range(self.lectures_per_chapter):
+                lecture_id = next(lectures)
+                index = lecture_id % 10000
+                supplementary = []
+                if self.has_attachment(lecture_id):
+                    supplementary.append({"_class": "asset", "id": lecture_id * 10 + 1, "title": f"Resources {index}",
+                                          "filename": f"resources-{index}.zip", "asset_type": "File", "is_external": False})
+                items.append({
+                    "_class": "lecture", "id": lecture_id, "title": f"Lecture {index}", "object_index": index,
+                    "asset": {"_class": "asset", "id": lecture_id * 10, "asset_type": "Video", "title": f"lecture-{index}.mp4",
+                              "filename": f"lecture-{index}.mp4", "is_external": False},
+                    "supplementary_assets": supplementary
+                })
+            if chapter % 2 == 0:
+                items.append({"_class": "quiz", "id": course_id * 10000 + 8000 + chapter, "title": f"Quiz {chapter}"})
+        return items
+
+    def lecture_asset(self, course_id, lecture_id):
+        expires = int(time.time()) + 3600
+        if self.is_hls(lecture_id):
+            videos = [{"type": "application/x-mpegURL", "label": "auto",
+                       "file": f"{self.origin}/media/hls/{course_id}/{lecture_id}/master.m3u8?Expires={expires}"}]
+        else:
+            videos = [{"type": "video/mp4", "label": label,
+                       "file": f"{self.origin}/media/video/{course_id}/{lecture_id}/{label}.mp4?Expires={expires}"}
+                      for label in QUALITY_SCALE]
+        return {"_class": "lecture", "id": lecture_id, "asset": {
+            "_class": "asset", "asset_type": "Video", "length": 60,
+            "stream_urls": {"Video": videos}, "download_urls": None,
+            "media_license_token": None, "course_is_drmed": False
+        }}
+
+    def video_size(self, label):
+        return int(self.video_bytes * QUALITY_SCALE.get(label, 1.0))
+
+    def zip_payload(self):
+        if self._zip is None:
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+                archive.writestr("README.txt", "Synthetic attachment\n")
+                archive.writestr("data.bin", (BLOCK * (self.attachment_bytes // len(BLOCK) + 1))[:self.attachment_bytes])
+            self._zip = buffer.getvalue()
+        return self._zip
+
+
+class FakeUdemyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def log_message(self, *args):
+        pass
+
+    # --- plumbing --------------------------------------------------------------------------
+
+    def _send_json(self, payload, status=200, headers=()):
+        body = json.dumps(payload).encode()
+        etag = '"%08x"' % zlib.crc32(body)
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 200:
+            self.send_header("ETag", etag)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_throttled(self, chunks):
+        """Writes the chunks, pacing them to the configured per-connection bandwidth."""
+        bandwidth = self.fake.bandwidth
+        started = time.perf_counter()
+        sent = 0
+        for chunk in chunks:
+            self.wfile.write(chunk)
+            sent += len(chunk)
+            if bandwidth:
+                ahead = sent / bandwidth - (time.perf_counter() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+    def _send_bytes(self, size, read, content_type, head=False):
+        """Sends a virtual file of `size` bytes (read(offset, length) gives its contents), honouring Range."""
+        start, end = 0, size - 1
+        match = re.match(r"bytes=(\d*)-(\d*)$", self.headers.get("Range") or "")
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(size - int(match.group(2)), 0)
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if head:
+            return
+
+        def chunks():
+            offset = start
+            while offset <= end:
+                length = min(len(BLOCK), end - offset + 1)
+                yield read(offset, length)
+                offset += length
+        try:
+            self._write_throttled(chunks())
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    @staticmethod
+    def _pattern(offset, length):
+        first = offset % len(BLOCK)
+        data = BLOCK[first:first + length]
+        while len(data) < length:
+            data += BLOCK[:length - len(data)]
+        return data
+
+    # --- routes ----------------------------------------------------------------------------
+
+    def do_HEAD(self):
+        self._route(head=True)
+
+    def do_GET(self):
+        self._route()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        if urlparse(self.path).path.startswith("/join/login-popup"):
+            if "csrftoken=" not in (self.headers.get("Cookie") or ""):
+                return self._send_json({"detail": "CSRF cookie not set."}, 403)
+            return self._send_json({}, headers=[("Set-Cookie", "access_token=fake-access-token; Path=/")])
+        self._send_json({"detail": "Not found."}, 404)
+
+    def _route(self, head=False):
+        url = urlparse(self.path)
+        path = url.path
+        if path.startswith("/media/"):
+            return self._media(path, head)
+        if path.startswith("/join/login-popup"):
+            return self._send_json({}, headers=[("Set-Cookie", "csrftoken=fake-csrf-token; Path=/")])
+        if not path.startswith("/api-2.0/"):
+            return self._send_json({"detail": "Not found."}, 404)
+
+        delay, throttle = self.fake._roll()
+        if delay:
+            time.sleep(delay)
+        if throttle:
+            return self._send_json({"detail": "Request was throttled."}, 429,
+                                   headers=[("Retry-After", str(self.fake.retry_after))])
+        if (self.headers.get("Authorization") or "") in ("", f"Bearer {INVALID_TOKEN}"):
+            return self._send_json({"detail": "Authentication credentials were not provided."}, 403)
+
+        query = parse_qs(url.query)
+        api_path = path[len("/api-2.0"):]
+        if api_path.rstrip("/") == "/users/me/subscribed-courses":
+            courses = [{"_class": "course", "id": course_id, "title": f"Benchmark Course {course_id}",
+                        "url": f"/course/benchmark-{course_id}/"} for course_id in self.fake.course_ids()]
+            return self._paginate(courses, query)
+
+        match = re.match(r"/courses/(\d+)/subscriber-curriculum-items/?$", api_path)
+        if match:
+            course_id = int(match.group(1))
+            if course_id not in self.fake.course_ids():
+                return self._send_json({"detail": "Not found."}, 404)
+            return self._paginate(self.fake.curriculum(course_id), query)
+
+        match = re.match(r"/users/me/subscribed-courses/(\d+)/lectures/(\d+)/supplementary-assets/(\d+)/?$", api_path)
+        if match:
+            asset_id = int(match.group(3))
+            return self._send_json({"_class": "asset", "id": asset_id, "download_urls": {"File": [
+                {"label": "download", "file": f"{self.fake.origin}/media/files/{asset_id}.zip?Expires={int(time.time()) + 3600}"}
+            ]}})
+
+        match = re.match(r"/users/me/subscribed-courses/(\d+)/lectures/(\d+)/?$", api_path)
+        if match:
+            course_id, lecture_id = int(match.group(1)), int(match.group(2))
+            if lecture_id not in self.fake.lecture_ids(course_id):
+                return self._send_json({"detail": "Not found."}, 404)
+            return self._send_json(self.fake.lecture_asset(course_id, lecture_id))
+
+        self._send_json({"detail": "Not found."}, 404)
+
+    def _paginate(self, items, query):
+        page_size = max(1, min(int(query.get("page_size", ["12"])[0]), 100))
+        page = int(query.get("page", ["1"])[0])
+        results = items[(page - 1) * page_size:page * page_size]
+        if not results and page > 1:
+            return self._send_json({"detail": "Invalid page."}, 404)
+        next_url = None
+        if page * page_size < len(items):
+            parsed = urlparse(self.path)
+            params = {**parse_qs(parsed.query), "page": [str(page + 1)]}
+            next_url = self.fake.origin + parsed.path + "?" + "&".join(f"{k}={v[0]}" for k, v in params.items())
+        self._send_json({"count": len(items), "next": next_url, "previous": None, "results": results})
+
+    def _media(self, path, head):
+        match = re.match(r"/media/video/\d+/\d+/(\w+)\.mp4$", path)
+        if match:
+            payload = self.fake.video_size(match.group(1))
+            header = mp4_header(payload)
+
+            def read(offset, length):
+                if offset >= len(header):
+                    return self._pattern(offset - len(header), length)
+                data = header[offset:offset + length]
+                return data + self._pattern(0, length - len(data))
+            return self._send_bytes(len(header) + payload, read, "video/mp4", head)
+
+        match = re.match(r"/media/hls/(\d+)/(\d+)/master\.m3u8$", path)
+        if match:
+            lines = ["#EXTM3U"]
+            for label, bandwidth in HLS_BANDWIDTH.items():
+                lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={int(label) * 16 // 9}x{label}")
+                lines.append(f"{label}/index.m3u8")
+            return self._send_text("\n".join(lines) + "\n", head)
+
+        match = re.match(r"/media/hls/\d+/\d+/(\w+)/index\.m3u8$", path)
+        if match:
+            label = match.group(1)
+            segment_bytes = HLS_BANDWIDTH.get(label, 800000) * HLS_SEGMENT_SECONDS // 8
+            segments = max(1, self.fake.video_size(label) // segment_bytes)
+            lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{HLS_SEGMENT_SECONDS}", "#EXT-X-MEDIA-SEQUENCE:0"]
+            for index in range(segments):
+                lines.append(f"#EXTINF:{HLS_SEGMENT_SECONDS}.0,")
+                lines.append(f"{index}.ts")
+            lines.append("#EXT-X-ENDLIST")
+            return self._send_text("\n".join(lines) + "\n", head)
+
+        match = re.match(r"/media/hls/\d+/\d+/(\w+)/\d+\.ts$", path)
+        if match:
+            size = HLS_BANDWIDTH.get(match.group(1), 800000) * HLS_SEGMENT_SECONDS // 8
+            return self._send_bytes(size, self._pattern, "video/mp2t", head)
+
+        if re.match(r"/media/files/\d+\.zip$", path):
+            payload = self.fake.zip_payload()
+            return self._send_bytes(len(payload), lambda offset, length: payload[offset:offset + length],
+                                    "application/zip", head)
+
+        self._send_json({"detail": "Not found."}, 404)
+
+    def _send_text(self, text, head):
+        body = text.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.apple.mpegurl")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+
+def add_arguments(parser):
+    """The fake server's knobs, shared by the benchmark scripts."""
+    group = parser.add_argument_group("fake Udemy server")
+    group.add_argument("--courses", type=int, default=3)
+    group.add_argument("--chapters", type=int, default=5)
+    group.add_argument("--lectures-per-chapter", type=int, default=10)
+    group.add_argument("--video-mb", type=float, default=8.0, help="Size of the 1080p rendition of each video")
+    group.add_argument("--attachment-every", type=int, default=5, help="Every Nth lecture has a zip attachment (0: none)")
+    group.add_argument("--attachment-kb", type=int, default=256)
+    group.add_argument("--hls-every", type=int, default=0, help="Every Nth lecture is HLS-only (needs ffmpeg to download)")
+    group.add_argument("--latency-ms", type=float, default=0.0, help="Added to every API response")
+    group.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter on the latency")
+    group.add_argument("--rate-429", type=float, default=0.0, help="Share of API requests answered with 429")
+    group.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with each 429")
+    group.add_argument("--bandwidth-mbps", type=float, default=0.0, help="Per-connection media bandwidth (0: unlimited)")
+    group.add_argument("--seed", type=int, default=0)
+
+
+def from_args(args):
+    return FakeUdemy(
+        courses=args.courses, chapters=args.chapters, lectures_per_chapter=args.lectures_per_chapter,
+        video_mb=args.video_mb, attachment_every=args.attachment_every, attachment_kb=args.attachment_kb,
+        hls_every=args.hls_every, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, rate_429=args.rate_429,
+        retry_after=args.retry_after, bandwidth_mbps=args.bandwidth_mbps, seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    fake = from_args(args).start(port=args.port)
+    print(json.dumps({"listening": fake.origin, **fake.env()}))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+
+import metrics
+from cachebackends import CacheBackendError, SharedTier, default_cache_url, fill_lock, open_backend
+
+# Signed CDN URLs carry their expiry as a unix timestamp, e.g. CloudFront's
+# "Expires=1700000000" or Akamai's "token=exp=1700000000~acl=...".
+_EXPIRY_RE = re.compile(r"(?:[?&~]|token=|hdnts=)(?:Expires|expires|exp)=(\d{9,11})")
+
+
+def token_hash(access_token):
+    """Returns a short, non-reversible key for an access token so tokens are never kept as cache keys."""
+    return hashlib.sha256((access_token or "").encode()).hexdigest()[:32]
+
+
+def url_expiry(url):
+    """Returns the unix expiry embedded in a signed URL, or None if it has none."""
+    match = _EXPIRY_RE.search(url or "")
+    return int(match.group(1)) if match else None
+
+
+def asset_expiry(asset_info):
+    """Returns the earliest expiry across the stream_urls/download_urls files of a lecture asset payload."""
+    asset = asset_info.get("asset") or {}
+    expiries = []
+    for group in ("stream_urls", "download_urls"):
+        for streams in (asset.get(group) or {}).values():
+            for stream in streams or []:
+                expiry = url_expiry(stream.get("file"))
+                if expiry:
+                    expiries.append(expiry)
+    return min(expiries) if expiries else None
+
+
+class AssetCache:
+    """
+    In-process LRU cache for lecture asset payloads, optionally backed by a shared tier.
+    Entries live until shortly before the earliest signed URL inside them expires
+    (or default_ttl when the URLs carry no expiry), and concurrent lookups of the
+    same key share one upstream call, across workers too when there is a shared tier.
+    """
+    def __init__(self, max_entries=2048, default_ttl=300, expiry_margin=60, shared=None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.expiry_margin = expiry_margin
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _expires_at(self, value):
+        expiry = asset_expiry(value)
+        if expiry:
+            return expiry - self.expiry_margin
+        return time.time() + self.default_ttl
+
+    def _store(self, key, value):
+        expires_at = self._expires_at(value)
+        if expires_at <= time.time():
+            return
+
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key, loader):
+        """
+        Returns the cached payload for key, calling `await loader()` on a miss.
+        Error payloads ({"error": ...}) are handed back but never stored.
+        """
+        value = self._lookup(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # Someone is already fetching this exact asset; wait for their answer
+            self.hits += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        # The upstream call runs as its own task so a caller that disconnects
+        # doesn't cancel it for everyone else waiting on the same key.
+        task = asyncio.ensure_future(self._load(key, loader))
+        self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader):
+        try:
+            value = await self._load_shared(key, loader) if self.shared else await loader()
+            if value and "error" not in value:
+                self._store(key, value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    async def _load_shared(self, key, loader):
+        shared_key = ":".join(map(str, key))
+        value = await self.shared.get(shared_key)
+        if value is None:
+            async with fill_lock(self.shared, shared_key) as filling:
+                if not filling:
+                    value = await self.shared.get(shared_key)
+                if value is None:
+                    value = await loader()
+                    if value and "error" not in value:
+                        await self.shared.set(shared_key, value, self._expires_at(value) - time.time())
+                    return value
+        self.shared_hits += 1
+        return value
+
+    async def invalidate(self, key):
+        """Drops key here and from the shared tier, e.g. once upstream rejected its signed URLs."""
+        self._entries.pop(key, None)
+        if self.shared:
+            await self.shared.delete(":".join(map(str, key)))
+
+    def contains(self, key):
+        """True if key is cached in this process or already being fetched; doesn't count as a lookup."""
+        return key in self._inflight or self._lookup(key) is not None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0
+        }
+
+
+class TokenVerdictCache:
+    """
+    Short-lived memory of token validation results, keyed by token hash.
+    Accepted tokens are remembered for valid_ttl and rejected ones for invalid_ttl; results
+    without a verdict (Udemy unreachable) are never stored. Concurrent checks of one token
+    share a single upstream call, across workers too when there is a shared tier.
+    """
+    def __init__(self, max_entries=4096, valid_ttl=300, invalid_ttl=30, shared=None):
+        self.max_entries = max_entries
+        self.valid_ttl = valid_ttl
+        self.invalid_ttl = invalid_ttl
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _ttl(self, verdict):
+        return self.valid_ttl if verdict["valid"] else self.invalid_ttl
+
+    def _remember(self, key, verdict, ttl):
+        self._entries[key] = (time.time() + ttl, verdict)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def remember(self, key, verdict):
+        if "valid" not in verdict:
+            return
+        self._remember(key, verdict, self._ttl(verdict))
+        if self.shared is not None:
+            await self.shared.set(key, verdict, self._ttl(verdict))
+
+    async def get(self, key, loader):
+        """Returns the remembered verdict for key, or `await loader()`'s."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.time():
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader):
+        try:
+            verdict = await self.shared.get(key) if self.shared else None
+            if verdict is None:
+                async with fill_lock(self.shared, key) as filling:
+                    if not filling:
+                        verdict = await self.shared.get(key)
+                    if verdict is None:
+                        verdict = await loader()
+                        await self.remember(key, verdict)
+                        return verdict
+            # Another worker already asked Udemy; its remaining TTL isn't known, so keep it briefly
+            self.shared_hits += 1
+            self._remember(key, verdict, min(self._ttl(verdict), self.invalid_ttl))
+            return verdict
+        finally:
+            del self._inflight[key]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0
+        }
+
+
+class ListingCache:
+    """
+    Stale-while-revalidate cache for course lists and curricula.
+    Lookups go to an in-memory LRU first, then the shared tier (if any). Anything younger than
+    fresh_ttl is served as-is; anything up to max_stale old is served immediately while
+    a background refresh revalidates it upstream. Only a cold key waits on Udemy, and
+    only one worker at a time refreshes a given key.
+    """
+    def __init__(self, shared=None, max_entries=256, fresh_ttl=60, max_stale=7 * 24 * 3600):
+        self.shared = shared
+        self.max_entries = max_entries
+        self.fresh_ttl = fresh_ttl
+        self.max_stale = max_stale
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._background = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def _remember(self, key, fetched_at, value):
+        self._entries[key] = (fetched_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        return await self._lookup_shared(key)
+
+    async def _lookup_shared(self, key):
+        if self.shared is None:
+            return None
+        stored = await self.shared.get(key)
+        if stored is None:
+            return None
+        self._remember(key, stored["fetched_at"], stored["value"])
+        return stored["fetched_at"], stored["value"]
+
+    async def get(self, key, loader):
+        """
+        Returns the cached value for key.
+        `await loader(previous)` fetches a fresh value; it receives the cached value (or None)
+        so it can revalidate conditionally, and may return an {"error": ...} dict, which is
+        handed back on a cold miss but never stored.
+        """
+        entry = await self._lookup(key)
+        value = self._serve(key, loader, entry)
+        if value is not None:
+            return value
+
+        self.misses += 1
+        return await self._refresh(key, loader, entry[1] if entry else None)
+
+    async def get_cached(self, key, loader):
+        """
+        Like get(), but a cold miss returns None instead of waiting on the loader, for callers
+        that fetch the value themselves (e.g. streaming it out) and then put() it.
+        """
+        entry = await self._lookup(key)
+        value = self._serve(key, loader, entry)
+        if value is None:
+            self.misses += 1
+        return value
+
+    def version(self, key, value):
+        """
+        The fetched_at of `value` if it is still what this worker holds for key, else None.
+        Lets callers memoize work derived from a listing (e.g. its serialized response).
+        """
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None and entry[1] is value else None
+
+    async def put(self, key, value):
+        fetched_at = time.time()
+        previous = self._entries.get(key)
+        if previous is not None and previous[0] >= fetched_at:
+            # Versions must differ even when the clock doesn't move between two refreshes
+            fetched_at = previous[0] + 1e-6
+        self._remember(key, fetched_at, value)
+        if self.shared is not None:
+            await self.shared.set(key, {"fetched_at": fetched_at, "value": value}, self.max_stale)
+
+    def _serve(self, key, loader, entry):
+        """Returns a fresh or stale-but-usable value (refreshing the latter in the background), else None."""
+        if entry is None:
+            return None
+        fetched_at, value = entry
+        age = time.time() - fetched_at
+        if age < self.fresh_ttl:
+            self.hits += 1
+            return value
+        if age < self.max_stale:
+            self.stale_hits += 1
+            self._refresh_in_background(key, loader, value)
+            return value
+        return None
+
+    def _refresh(self, key, loader, previous):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader, previous))
+            self._inflight[key] = task
+        return asyncio.shield(task)
+
+    def _refresh_in_background(self, key, loader, previous):
+        if key in self._inflight:
+            return
+        task = asyncio.ensure_future(self._refresh(key, loader, previous))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        # A failed background refresh just leaves the stale value in place
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _load(self, key, loader, previous):
+        try:
+            async with fill_lock(self.shared, key) as filling:
+                if not filling:
+                    # Another worker just refreshed it
+                    entry = await self._lookup_shared(key)
+                    if entry is not None and time.time() - entry[0] < self.fresh_ttl:
+                        return entry[1]
+                value = await loader(previous)
+                if value and "error" not in value:
+                    await self.put(key, value)
+                return value
+        finally:
+            del self._inflight[key]
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0
+        }
+
+
+def _open_shared_backend():
+    url = default_cache_url()
+    try:
+        return open_backend(url)
+    except CacheBackendError as e:
+        # Read-only or missing filesystem (e.g. serverless): run memory-only
+        print(f"Shared cache unavailable at {url}: {e}")
+        return None
+
+
+_backend = _open_shared_backend()
+
+
+def _shared_tier(namespace):
+    return SharedTier(_backend, namespace) if _backend is not None and _backend.shared else None
+
+
+# Shared by every route that needs a lecture's asset payload
+asset_cache = AssetCache(shared=_shared_tier("asset:"))
+
+# /api/auth verdicts, per token hash
+token_cache = TokenVerdictCache(
+    valid_ttl=int(os.environ.get("AUTH_VALID_TTL", "300")),
+    invalid_ttl=int(os.environ.get("AUTH_INVALID_TTL", "30")),
+    shared=_shared_tier("token:")
+)
+
+# Course lists and curricula, per token hash
+listing_cache = ListingCache(
+    shared=_shared_tier("listing:"),
+    fresh_ttl=int(os.environ.get("LISTING_FRESH_TTL", "60")),
+    max_stale=int(os.environ.get("LISTING_MAX_STALE", str(7 * 24 * 3600)))
+)
+
+
+def _cache_metrics():
+    samples = []
+    for name, cache in (("lecture_assets", asset_cache), ("listings", listing_cache), ("tokens", token_cache)):
+        stats = cache.stats()
+        labels = {"cache": name}
+        samples.append(("cache_entries", "Entries currently held by each in-process cache.", labels, stats["entries"]))
+        samples.append(("cache_hit_ratio", "Share of lookups served from each cache.", labels, stats["hit_ratio"]))
+        samples.append(("cache_misses", "Lookups that had to go upstream, per cache.", labels, stats["misses"]))
+    return samples
+
+
+metrics.register_collector(_cache_metrics)
@@ -0,0 +1,406 @@
+"""
+Cache backends shared between server workers.
+
+Under several uvicorn/gunicorn (or Passenger) workers, per-process caches are duplicated and
+cold in each worker. The caches in cache.py keep a small in-process tier and put everything
+they store into the backend chosen by CACHE_URL as well:
+
+    memory://                          in-process only (nothing shared)
+    sqlite:///path/to/cache.sqlite3    one file shared by every worker on the host
+    redis://[:password@]host:6379/0    any server speaking the Redis protocol
+
+Every backend has per-key TTLs and an atomic add() used as a fill lock, so a cold key is
+fetched from Udemy by one worker while the others wait for its result. The memory and SQLite
+backends evict least recently used entries past CACHE_MAX_MB; a Redis server bounds itself
+with its own maxmemory / eviction policy.
+"""
+import asyncio
+import contextlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import unquote, urlparse
+
+from models import dumps, loads
+
+CACHE_MAX_BYTES = int(float(os.environ.get("CACHE_MAX_MB", "512")) * 1024 * 1024)
+# How long one worker may hold a key's fill lock before others assume it died
+FILL_LOCK_TTL = float(os.environ.get("CACHE_FILL_LOCK_TTL", "30"))
+FILL_POLL_INTERVAL = 0.05
+
+
+class CacheBackendError(Exception):
+    """The backend couldn't be reached or answered nonsense; callers treat it as a miss."""
+
+
+class MemoryBackend:
+    """In-process LRU with per-key expiry. The default; nothing is shared between workers."""
+    shared = False
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= now:
+            self._drop(key)
+            return None
+        return entry
+
+    def _drop(self, key):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key, time.time())
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def _store(self, key, value, ttl):
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.time() + ttl, value)
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)))
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def add(self, key, value, ttl):
+        """Stores value only if key is absent (or expired). Returns whether it was stored."""
+        with self._lock:
+            if self._live(key, time.time()) is not None:
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+
+class SQLiteBackend:
+    """A single SQLite file (WAL, memory-mapped reads) shared by every worker process on the host."""
+    shared = True
+    # Refresh a key's recency at most this often, so hot reads don't all turn into writes
+    TOUCH_INTERVAL = 60
+    # Size-bound checks run every this many writes
+    EVICT_EVERY = 64
+
+    def __init__(self, path, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._writes = 0
+        try:
+            # Created owner-only; SQLite gives its -wal/-shm files the same mode
+            os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        except OSError as e:
+            raise CacheBackendError(f"Cannot open cache database {path}: {e}") from e
+        try:
+            self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA mmap_size=268435456")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+            self._conn.commit()
+        except sqlite3.Error as e:
+            raise CacheBackendError(f"Cannot open cache database {path}: {e}") from e
+
+    def _run(self, fn):
+        with self._lock:
+            try:
+                return fn(self._conn)
+            except sqlite3.Error as e:
+                self._conn.rollback()
+                raise CacheBackendError(str(e)) from e
+
+    def get(self, key):
+        def read(conn):
+            now = time.time()
+            row = conn.execute("SELECT value, expires_at, accessed_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] <= now:
+                return None
+            if now - row[2] > self.TOUCH_INTERVAL:
+                conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+            return bytes(row[0])
+        return self._run(read)
+
+    def set(self, key, value, ttl):
+        def write(conn):
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now)
+            )
+            conn.commit()
+        self._run(write)
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            self._run(self._evict)
+
+    def add(self, key, value, ttl):
+        """Stores value only if key is absent (or expired). Atomic across processes."""
+        def write(conn):
+            now = time.time()
+            # The DELETE takes the write lock, so no other process can slip in before the INSERT
+            conn.execute("DELETE FROM cache WHERE key = ? AND expires_at <= ?", (key, now))
+            added = conn.execute(
+                "INSERT OR IGNORE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now)
+            ).rowcount == 1
+            conn.commit()
+            return added
+        return self._run(write)
+
+    def delete(self, key):
+        def write(conn):
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            conn.commit()
+        self._run(write)
+
+    def _evict(self, conn):
+        conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+        total = conn.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM cache").fetchone()[0]
+        if total > self.max_bytes:
+            excess = total - self.max_bytes
+            victims = []
+            for key, size in conn.execute("SELECT key, LENGTH(value) FROM cache ORDER BY accessed_at"):
+                victims.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            conn.executemany("DELETE FROM cache WHERE key = ?", victims)
+        conn.commit()
+
+
+class RedisBackend:
+    """Minimal RESP client (GET / SET PX [NX] / DEL) over a small pool of blocking sockets."""
+    shared = True
+
+    def __init__(self, host="127.0.0.1", port=6379, db=0, password=None, timeout=2.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = (sock, sock.makefile("rb"))
+        if self.password:
+            self._send(conn, "AUTH", self.password)
+        if self.db:
+            self._send(conn, "SELECT", self.db)
+        return conn
+
+    @staticmethod
+    def _encode(args):
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(out)
+
+    def _read(self, reader):
+        line = reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise CacheBackendError("Connection closed by cache server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest
+        if kind == b"-":
+            raise CacheBackendError(rest.decode(errors="replace"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [self._read(reader) for _ in range(length)]
+        raise CacheBackendError(f"Unexpected reply from cache server: {line[:40]!r}")
+
+    def _send(self, conn, *args):
+        conn[0].sendall(self._encode(args))
+        return self._read(conn[1])
+
+    def command(self, *args):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        try:
+            if conn is None:
+                conn = self._connect()
+            reply = self._send(conn, *args)
+        except (OSError, ValueError, CacheBackendError) as e:
+            if conn is not None:
+                conn[0].close()
+            if isinstance(e, CacheBackendError):
+                raise
+            raise CacheBackendError(f"Cache server {self.host}:{self.port} unavailable: {e}") from e
+        with self._lock:
+            self._idle.append(conn)
+        return reply
+
+    def get(self, key):
+        return self.command("GET", key)
+
+    def set(self, key, value, ttl):
+        self.command("SET", key, value, "PX", max(1, int(ttl * 1000)))
+
+    def add(self, key, value, ttl):
+        return self.command("SET", key, value, "PX", max(1, int(ttl * 1000)), "NX") is not None
+
+    def delete(self, key):
+        self.command("DEL", key)
+
+
+def open_backend(url):
+    """Builds the backend described by a CACHE_URL (memory://, sqlite:///path, redis://host:port/db)."""
+    parsed = urlparse(url)
+    if parsed.scheme == "memory":
+        return MemoryBackend()
+    if parsed.scheme == "sqlite":
+        return SQLiteBackend(url[len("sqlite://"):])
+    if parsed.scheme == "redis":
+        db = parsed.path.strip("/")
+        return RedisBackend(
+            host=parsed.hostname or "127.0.0.1",
+            port=parsed.port or 6379,
+            db=int(db) if db.isdigit() else 0,
+            password=unquote(parsed.password) if parsed.password else None
+        )
+    raise ValueError(f"Unsupported CACHE_URL: {url}")
+
+
+def private_cache_dir():
+    """
+    Per-account directory for the default cache file, readable by this account only: the cache
+    holds signed media URLs and users' course listings, and shared hosts have other local users.
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    path = os.path.join(base, "udemy_saver")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    os.chmod(path, 0o700)
+    return path
+
+
+def default_cache_url():
+    if os.environ.get("CACHE_URL"):
+        return os.environ["CACHE_URL"]
+    # LISTING_CACHE_PATH predates CACHE_URL; an empty value still means "memory only"
+    path = os.environ.get("LISTING_CACHE_PATH")
+    if path is None:
+        try:
+            path = os.path.join(private_cache_dir(), "cache.sqlite3")
+        except OSError:
+            # No writable home (e.g. serverless): nothing to share with anyway
+            path = ""
+    return "sqlite://" + path if path else "memory://"
+
+
+class SharedTier:
+    """
+    One cache's view of a shared backend: keys are namespaced, values are JSON, and backend
+    failures degrade to misses (and to loading without a fill lock) instead of failing requests.
+    """
+    def __init__(self, backend, namespace):
+        self.backend = backend
+        self.namespace = namespace
+        self.errors = 0
+
+    def _failed(self, e):
+        if not self.errors:
+            print(f"Shared cache unavailable ({self.namespace}): {e}")
+        self.errors += 1
+
+    async def get(self, key):
+        try:
+            raw = await asyncio.to_thread(self.backend.get, self.namespace + key)
+        except CacheBackendError as e:
+            self._failed(e)
+            return None
+        return loads(raw) if raw is not None else None
+
+    async def set(self, key, value, ttl):
+        if ttl <= 0:
+            return
+        try:
+            await asyncio.to_thread(self.backend.set, self.namespace + key, dumps(value), ttl)
+        except CacheBackendError as e:
+            self._failed(e)
+
+    async def delete(self, key):
+        await self._delete(self.namespace + key)
+
+    async def _add(self, key, ttl):
+        try:
+            return await asyncio.to_thread(self.backend.add, key, b"1", ttl)
+        except CacheBackendError as e:
+            self._failed(e)
+            return True
+
+    async def _exists(self, key):
+        try:
+            return await asyncio.to_thread(self.backend.get, key) is not None
+        except CacheBackendError:
+            return False
+
+    async def _delete(self, key):
+        try:
+            await asyncio.to_thread(self.backend.delete, key)
+        except CacheBackendError as e:
+            self._failed(e)
+
+    @contextlib.asynccontextmanager
+    async def fill_lock(self, key):
+        """
+        Serializes fills of `key` across workers. Yields True when this worker should load the
+        value itself, or False after waiting out another worker's fill (re-read the tier then).
+        """
+        lock = self.namespace + key + ":filling"
+        if await self._add(lock, FILL_LOCK_TTL):
+            try:
+                yield True
+            finally:
+                await self._delete(lock)
+            return
+
+        deadline = time.monotonic() + FILL_LOCK_TTL
+        while time.monotonic() < deadline and await self._exists(lock):
+            await asyncio.sleep(FILL_POLL_INTERVAL)
+        yield False
+
+
+@contextlib.asynccontextmanager
+async def fill_lock(shared, key):
+    """SharedTier.fill_lock, or an immediate go-ahead when the cache has no shared tier."""
+    if shared is None:
+        yield True
+        return
+    async with shared.fill_lock(key) as filling:
+        yield filling
@@ -1,119 +1,690 @@
+import base64
+import collections
+import contextlib
+import hashlib
+import itertools
+import json
 import os
+import re
 import requests
+import urllib3
 import subprocess
 import tempfile
+import threading
+import time
 import shutil
-from urllib.parse import urlparse
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+
+import metrics
+import mp4meta
+
+BRANDING_TEXT = "Downloaded from Udemy Saver by Lonewolf"
+
+# Every stream reads into one reusable buffer of this size, so memory stays flat whatever the file size
+BUFFER_SIZE = 1024 * 1024
+# Minimum seconds between progress bar redraws
+PROGRESS_INTERVAL = 0.5
+# Files at least this big are fetched as parallel Range segments
+SEGMENT_THRESHOLD = 32 * 1024 * 1024
+SEGMENT_COUNT = 4
+SEGMENT_RETRIES = 3
+# How often (bytes written) a segment checkpoints its progress to the sidecar
+CHECKPOINT_BYTES = 4 * 1024 * 1024
+# HLS segments fetched ahead of the remux, and retries per segment
+HLS_CONCURRENCY = 8
+HLS_RETRIES = 3
+# (connect, read) seconds for every request, so a stalled server fails the attempt instead of hanging a worker
+TIMEOUT = (float(os.environ.get("DOWNLOAD_CONNECT_TIMEOUT", "15")), float(os.environ.get("DOWNLOAD_READ_TIMEOUT", "60")))
+
+class DownloadError(Exception):
+    pass
+
+class DownloadCancelled(DownloadError):
+    pass
+
+class HLSNotSupported(Exception):
+    """The playlist needs something the native HLS fetcher doesn't do (e.g. encrypted segments)."""
+
+class Progress:
+    """Thread-safe progress bar that redraws at most every PROGRESS_INTERVAL seconds."""
+    def __init__(self, total_length, dl=0):
+        self.total_length = total_length
+        self.dl = dl
+        self._last_draw = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, amount):
+        with self._lock:
+            self.dl += amount
+            now = time.monotonic()
+            if now - self._last_draw >= PROGRESS_INTERVAL:
+                self._last_draw = now
+                self._draw()
+
+    def finish(self):
+        with self._lock:
+            self._draw()
+        print() # Print newline after progress bar
+
+    def _draw(self):
+        if not self.total_length:
+            print(f"\r{self.dl/(1024*1024):.2f} MB", end='', flush=True)
+            return
+        done = int(50 * self.dl / self.total_length)
+        print(f"\r[{'=' * done}{' ' * (50-done)}] {self.dl/(1024*1024):.2f}/{self.total_length/(1024*1024):.2f} MB", end='', flush=True)
 
 class Downloader:
-    def __init__(self, base_dir="Downloads"):
+    def __init__(self, base_dir="Downloads", bandwidth=None, on_progress=None, cancel_event=None):
         self.base_dir = base_dir
+        # Optional shared limiter (see engine.BandwidthLimiter) applied to every chunk we write
+        self.bandwidth = bandwidth
+        # Optional callback receiving the byte count of every chunk written
+        self.on_progress = on_progress
+        # Optional threading.Event; once set, transfers in flight stop at the next chunk
+        self.cancel_event = cancel_event
+        # Optional shared limiter (see engine.HostLimiter): every connection we open holds a slot for its host
+        self.hosts = None
+        # One pooled session for every transfer (and every segment of a transfer)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=32)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._buffers = threading.local()
         if not os.path.exists(self.base_dir):
             os.makedirs(self.base_dir)
 
     def sanitize_filename(self, filename):
-        """Removes invalid characters from filenames."""
-        invalid_chars = '<>:"/\\|?*'
-        for char in invalid_chars:
-            filename = filename.replace(char, '_')
-        return filename.strip()
+        return sanitize_filename(filename)
 
     def create_course_dir(self, course_name):
         safe_name = self.sanitize_filename(course_name)
+        if safe_name in ("", ".", ".."):
+            raise DownloadError(f"Invalid course folder name: {course_name!r}")
         course_path = os.path.join(self.base_dir, safe_name)
+        self._check_inside(course_path)
         if not os.path.exists(course_path):
             os.makedirs(course_path)
         return course_path
+
+    def _check_inside(self, path):
+        """Refuses any path that would resolve outside the download root (e.g. through a symlink)."""
+        root = os.path.realpath(self.base_dir)
+        if os.path.commonpath([root, os.path.realpath(path)]) != root:
+            raise DownloadError(f"Refusing to write outside {self.base_dir}: {path}")
         
     def create_chapter_dir(self, course_path, chapter_index, chapter_title):
         safe_title = self.sanitize_filename(chapter_title)
         chapter_name = f"{chapter_index:02d} - {safe_title}"
         chapter_path = os.path.join(course_path, chapter_name)
+        self._check_inside(chapter_path)
         if not os.path.exists(chapter_path):
             os.makedirs(chapter_path)
         return chapter_path
 
     def download_file(self, url, destination_path):
-        """Downloads a regular file with a progress bar."""
+        """
+        Downloads a regular file with a progress bar.
+        Data goes to `<destination>.part` (plus a `.part.json` sidecar tracking progress) and is only
+        renamed into place once its size/checksum checks out, so an interrupted download is resumed
+        on the next run instead of being mistaken for a finished file. Large files that support
+        Range requests are fetched as several parallel segments. Returns True on success.
+        """
         if os.path.exists(destination_path):
             print(f"    File already exists: {os.path.basename(destination_path)}. Skipping.")
-            return
+            return True
 
         print(f"    Downloading to: {os.path.basename(destination_path)}")
+        part_path = destination_path + ".part"
+        started = time.perf_counter()
         try:
-            with requests.get(url, stream=True) as r:
+            with self._host_slot(url):
+                # Probe with a one-byte range to learn the size and whether ranges are honoured
+                r = self.session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=TIMEOUT)
+                metrics.download_ttfb_seconds.observe(time.perf_counter() - started, method="file")
                 r.raise_for_status()
-                total_length = r.headers.get('content-length')
-                
-                with open(destination_path, 'wb') as f:
-                    if total_length is None: # no content length header
-                        f.write(r.content)
-                    else:
-                        dl = 0
-                        total_length = int(total_length)
-                        for data in r.iter_content(chunk_size=4096):
-                            dl += len(data)
-                            f.write(data)
-                            done = int(50 * dl / total_length)
-                            print(f"\r[{'=' * done}{' ' * (50-done)}] {dl/(1024*1024):.2f}/{total_length/(1024*1024):.2f} MB", end='', flush=True)
-            print() # Print newline after progress bar
+                ranged = r.status_code == 206
+                if ranged:
+                    total_length = _content_range_total(r)
+                    r.close()
+                else:
+                    # No range support: plain single-stream download from the probe response
+                    with r:
+                        self._download_stream(r, part_path)
+            if ranged and total_length:
+                self._download_ranges(url, part_path, total_length, _expected_md5(r))
+            elif ranged:
+                with self._host_slot(url), self.session.get(url, stream=True, timeout=TIMEOUT) as r:
+                    r.raise_for_status()
+                    self._download_stream(r, part_path)
+
+            os.replace(part_path, destination_path)
+            _remove_quietly(part_path + ".json")
+            metrics.observe_download("file", os.path.getsize(destination_path), started)
+            return True
         except Exception as e:
+            metrics.observe_download("file", 0, started, "error")
             print(f"\nError downloading {url}: {e}")
+            return False
+
+    def _download_stream(self, r, part_path):
+        total_length = r.headers.get('content-length')
+        total_length = int(total_length) if total_length is not None else None
+        _remove_quietly(part_path + ".json")
+
+        progress = Progress(total_length)
+        md5 = hashlib.md5()
+        with open(part_path, 'wb') as f:
+            if total_length:
+                _preallocate(f.fileno(), total_length)
+            for data in _read_body(r, self._buffer()):
+                f.write(data)
+                md5.update(data)
+                self._account(len(data))
+                progress.add(len(data))
+            # Trim any preallocated tail if the server sent less than it announced
+            f.truncate(progress.dl)
+        progress.finish()
+
+        if total_length is not None and progress.dl != total_length:
+            raise DownloadError(f"Size mismatch: expected {total_length} bytes, got {progress.dl}")
+        expected = _expected_md5(r)
+        if expected and md5.hexdigest() != expected:
+            raise DownloadError("Checksum mismatch")
+
+    def _download_ranges(self, url, part_path, total_length, expected_md5):
+        state_path = part_path + ".json"
+        state = _load_state(state_path)
+
+        # Only resume if the sidecar describes the same remote file
+        if not state or state.get("size") != total_length or state.get("md5") != expected_md5 or not os.path.exists(part_path):
+            count = SEGMENT_COUNT if total_length >= SEGMENT_THRESHOLD else 1
+            step = -(-total_length // count)
+            state = {
+                "size": total_length,
+                "md5": expected_md5,
+                "segments": [[start, min(start + step, total_length) - 1, 0] for start in range(0, total_length, step)]
+            }
+            with open(part_path, 'wb') as f:
+                _preallocate(f.fileno(), total_length)
+            _save_state(state_path, state)
+        else:
+            print(f"    Resuming partial download of {os.path.basename(part_path[:-5])}")
+
+        lock = threading.Lock()
+        progress = Progress(total_length, sum(seg[2] for seg in state["segments"]))
+        fd = os.open(part_path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+        try:
+            def fetch_segment(segment):
+                for attempt in range(SEGMENT_RETRIES):
+                    try:
+                        self._fetch_segment(url, fd, segment, state, state_path, lock, progress)
+                        return
+                    except requests.exceptions.RequestException:
+                        if attempt == SEGMENT_RETRIES - 1:
+                            raise
+                        time.sleep(2 ** attempt)
+
+            pending = [seg for seg in state["segments"] if seg[2] < seg[1] - seg[0] + 1]
+            with ThreadPoolExecutor(max_workers=max(1, len(pending))) as pool:
+                for future in [pool.submit(fetch_segment, seg) for seg in pending]:
+                    future.result()
+        finally:
+            os.close(fd)
+            with lock:
+                _save_state(state_path, state)
+            progress.finish()
+
+        if os.path.getsize(part_path) != total_length:
+            raise DownloadError(f"Size mismatch: expected {total_length} bytes, got {os.path.getsize(part_path)}")
+        if expected_md5 and _file_md5(part_path) != expected_md5:
+            _remove_quietly(part_path)
+            _remove_quietly(state_path)
+            raise DownloadError("Checksum mismatch, the partial download was discarded")
+
+    def _fetch_segment(self, url, fd, segment, state, state_path, lock, progress):
+        start, end, done = segment
+        if done > end - start:
+            return
+        since_checkpoint = 0
+        with self._host_slot(url), \
+                self.session.get(url, headers={"Range": f"bytes={start + done}-{end}"}, stream=True, timeout=TIMEOUT) as r:
+            r.raise_for_status()
+            if r.status_code != 206:
+                raise DownloadError("Server stopped honouring Range requests")
+            for data in _read_body(r, self._buffer()):
+                _pwrite(fd, data, start + segment[2])
+                self._account(len(data))
+                progress.add(len(data))
+                with lock:
+                    segment[2] += len(data)
+                    since_checkpoint += len(data)
+                    if since_checkpoint >= CHECKPOINT_BYTES:
+                        since_checkpoint = 0
+                        _save_state(state_path, state)
+        if segment[2] < end - start + 1:
+            # The body ended early without an error: retry the rest like any other dropped connection
+            raise requests.exceptions.ConnectionError("Connection closed before the segment was complete")
+
+    def _host_slot(self, url):
+        return self.hosts.for_url(url) if self.hosts is not None else contextlib.nullcontext()
+
+    def _account(self, amount):
+        """Called for every chunk received: enforces the bandwidth cap, reports progress and honours cancellation."""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise DownloadCancelled("Cancelled")
+        metrics.download_bytes_total.inc(amount)
+        if self.bandwidth:
+            self.bandwidth.consume(amount)
+        if self.on_progress:
+            self.on_progress(amount)
+
+    def _buffer(self):
+        """Returns this thread's reusable read buffer."""
+        buffer = getattr(self._buffers, "buffer", None)
+        if buffer is None:
+            buffer = self._buffers.buffer = bytearray(BUFFER_SIZE)
+        return buffer
 
     def download_video_ytdlp(self, url, destination_path, title):
-        """Uses yt-dlp to download m3u8 or mp4 videos."""
+        """Uses yt-dlp to download m3u8 or mp4 videos, then applies the branding metadata."""
         if not destination_path.endswith('.mp4'):
             destination_path += '.mp4'
             
         if os.path.exists(destination_path):
             print(f"    Video already exists: {os.path.basename(destination_path)}. Skipping.")
             return
-            
+
+        if self.fetch_video(url, destination_path, title):
+            self.apply_branding(destination_path, title)
+
+    def fetch_video(self, url, destination_path, title, rate_limit=None, quality=None):
+        """
+        Downloads a single video. Returns True if the file was downloaded.
+        HLS playlists and progressive MP4s are fetched in-process over the shared connection pool;
+        anything the native fetcher can't handle (e.g. encrypted segments) goes to yt-dlp.
+        quality picks the HLS variant by height label ('720'); rate_limit (bytes/sec) only applies
+        to yt-dlp, the native path uses the shared bandwidth limiter.
+        """
         print(f"    Downloading video: {title}")
+        try:
+            return self._fetch_video_native(url, destination_path, quality)
+        except DownloadCancelled:
+            print(f"    Cancelled: {title}")
+            return False
+        except HLSNotSupported as e:
+            print(f"    Native fetch not possible ({e}), falling back to yt-dlp.")
+        except (requests.exceptions.RequestException, DownloadError) as e:
+            print(f"    Native fetch failed ({e}), falling back to yt-dlp.")
+
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            return False
+        return self._fetch_video_ytdlp(url, destination_path, rate_limit)
+
+    def _fetch_video_ytdlp(self, url, destination_path, rate_limit=None):
         command = [
             'yt-dlp',
             '-o', destination_path,
             url
         ]
+        if rate_limit:
+            command[1:1] = ['--limit-rate', str(int(rate_limit))]
+        
+        started = time.perf_counter()
+        try:
+            # yt-dlp's own connections are out of our hands; the whole run counts as one
+            with self._host_slot(url):
+                subprocess.run(command, check=True)
+            size = os.path.getsize(destination_path) if os.path.exists(destination_path) else 0
+            metrics.observe_download("ytdlp", size, started)
+            return True
+        except subprocess.CalledProcessError as e:
+            metrics.observe_download("ytdlp", 0, started, "error")
+            print(f"Error downloading video: {e}")
+            print("Note: Udemy DRM videos cannot be downloaded with this script.")
+        except FileNotFoundError:
+            print("yt-dlp is not installed or not in PATH. Please install it to download videos.")
+        return False
+
+    def _fetch_video_native(self, url, destination_path, quality=None):
+        path = urlparse(url).path
+        is_playlist = path.endswith(".m3u8")
+        if not is_playlist and not path.endswith(".mp4"):
+            # Extension doesn't tell us; ask the server without reading the body
+            with self._host_slot(url), self.session.get(url, stream=True, timeout=TIMEOUT) as r:
+                r.raise_for_status()
+                is_playlist = "mpegurl" in r.headers.get("Content-Type", "").lower()
+
+        if not is_playlist:
+            # Progressive MP4: ranged, resumable download
+            if not self.download_file(url, destination_path):
+                raise DownloadError("MP4 download failed")
+            return True
+
+        with self._host_slot(url):
+            r = self.session.get(url, timeout=TIMEOUT)
+        r.raise_for_status()
+        playlist = r.text
+
+        if "#EXT-X-STREAM-INF" in playlist:
+            variant = pick_hls_variant(parse_hls_master(playlist, url), quality)
+            if variant is None:
+                raise HLSNotSupported("Master playlist has no variants")
+            playlist_url = variant["uri"]
+            with self._host_slot(playlist_url):
+                r = self.session.get(playlist_url, timeout=TIMEOUT)
+            r.raise_for_status()
+            playlist = r.text
+        else:
+            playlist_url = url
+
+        segments = parse_hls_media(playlist, playlist_url)
+        self._download_hls(segments, destination_path)
+        return True
+
+    def _download_hls(self, segments, destination_path):
+        """
+        Fetches HLS segments HLS_CONCURRENCY at a time and feeds them, in order, straight into a
+        single FFmpeg remux to MP4, so the video is written to disk exactly once.
+        """
+        if not segments:
+            raise HLSNotSupported("Empty media playlist")
+
+        temp_output = destination_path + ".part"
+        command = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-i', 'pipe:0',
+            '-map', '0:v?', '-map', '0:a?',
+            '-c', 'copy',
+            '-f', 'mp4',
+            temp_output
+        ]
+        try:
+            ffmpeg = subprocess.Popen(command, stdin=subprocess.PIPE)
+        except FileNotFoundError:
+            raise HLSNotSupported("ffmpeg is not installed")
+
+        progress = Progress(None)
+        started = time.perf_counter()
+        succeeded = False
+        try:
+            with ThreadPoolExecutor(max_workers=HLS_CONCURRENCY) as pool:
+                window = collections.deque()
+                pending = iter(segments)
+                for segment in itertools.islice(pending, HLS_CONCURRENCY):
+                    window.append(pool.submit(self._fetch_segment_bytes, segment))
+                while window:
+                    data = window.popleft().result()
+                    if not progress.dl:
+                        metrics.download_ttfb_seconds.observe(time.perf_counter() - started, method="hls")
+                    for segment in itertools.islice(pending, 1):
+                        window.append(pool.submit(self._fetch_segment_bytes, segment))
+                    ffmpeg.stdin.write(data)
+                    progress.add(len(data))
+            ffmpeg.stdin.close()
+            if ffmpeg.wait() != 0:
+                raise DownloadError(f"ffmpeg remux failed with exit code {ffmpeg.returncode}")
+            succeeded = True
+        except BrokenPipeError:
+            # ffmpeg quit before reading everything; its exit code says why
+            ffmpeg.wait()
+            raise DownloadError(f"ffmpeg remux failed with exit code {ffmpeg.returncode}")
+        finally:
+            progress.finish()
+            if not succeeded:
+                # A half-written .part MP4 must not be mistaken for a resumable download later
+                ffmpeg.kill()
+                ffmpeg.wait()
+                _remove_quietly(temp_output)
+                metrics.observe_download("hls", 0, started, "error")
+
+        os.replace(temp_output, destination_path)
+        metrics.observe_download("hls", progress.dl, started)
+
+    def _fetch_segment_bytes(self, segment):
+        """Fetches one HLS segment (or init section), retrying transient failures with backoff."""
+        headers = {}
+        if segment.get("byterange"):
+            start, length = segment["byterange"]
+            headers["Range"] = f"bytes={start}-{start + length - 1}"
+
+        for attempt in range(HLS_RETRIES):
+            try:
+                with self._host_slot(segment["uri"]):
+                    r = self.session.get(segment["uri"], headers=headers, timeout=TIMEOUT)
+                r.raise_for_status()
+                self._account(len(r.content))
+                return r.content
+            except requests.exceptions.RequestException:
+                if attempt == HLS_RETRIES - 1:
+                    raise
+                time.sleep(0.5 * 2 ** attempt)
+
+    def apply_branding(self, destination_path, title):
+        """
+        Adds the branding metadata and soft subtitle to a downloaded video.
+        MP4s are edited in place (only the container boxes change, the media data is left where it is);
+        anything the box editor can't handle goes through a full FFmpeg copy mux instead.
+        """
+        print(f"    Applying branding metadata and soft subtitles...")
+        started = time.perf_counter()
+        try:
+            mp4meta.brand_in_place(
+                destination_path,
+                title=title,
+                description=BRANDING_TEXT,
+                comment=BRANDING_TEXT,
+                subtitle=BRANDING_TEXT
+            )
+            metrics.postprocess_seconds.observe(time.perf_counter() - started, method="in_place")
+            print(f"    Branding applied successfully.")
+            return
+        except (mp4meta.NotSupported, struct.error) as e:
+            print(f"    Can't brand in place ({e}), remuxing with FFmpeg instead.")
+
+        started = time.perf_counter()
+        self._brand_with_ffmpeg(destination_path, title)
+        metrics.postprocess_seconds.observe(time.perf_counter() - started, method="ffmpeg")
+
+    def _brand_with_ffmpeg(self, destination_path, title):
+        """Adds the branding metadata and soft subtitle via a fast FFmpeg mux into a new file."""
+        # 1. Create a temporary SRT file
+        fd, srt_path = tempfile.mkstemp(suffix=".srt")
+        with os.fdopen(fd, 'w') as f:
+            f.write(f"1\n00:00:00,000 --> 00:00:15,000\n{BRANDING_TEXT}\n")
+        
+        # 2. Temporary output video path
+        temp_output = destination_path + ".temp.mp4"
+        
+        # 3. Fast FFmpeg mux (copy video/audio, convert sub to mov_text, add metadata)
+        ffmpeg_cmd = [
+            'ffmpeg', '-y',
+            '-i', destination_path,
+            '-i', srt_path,
+            '-c', 'copy',
+            '-c:s', 'mov_text',
+            '-metadata', f'title={title}',
+            '-metadata', f'description={BRANDING_TEXT}',
+            '-metadata', f'comment={BRANDING_TEXT}',
+            temp_output
+        ]
         
         try:
-            subprocess.run(command, check=True)
-            
-            # Apply branding via fast FFmpeg multiplexing
-            print(f"    Applying branding metadata and soft subtitles...")
-            
-            # 1. Create a temporary SRT file
-            fd, srt_path = tempfile.mkstemp(suffix=".srt")
-            with os.fdopen(fd, 'w') as f:
-                f.write("1\n00:00:00,000 --> 00:00:15,000\nDownloaded from Udemy Saver by Lonewolf\n")
-            
-            # 2. Temporary output video path
-            temp_output = destination_path + ".temp.mp4"
-            
-            # 3. Fast FFmpeg mux (copy video/audio, convert sub to mov_text, add metadata)
-            ffmpeg_cmd = [
-                'ffmpeg', '-y',
-                '-i', destination_path,
-                '-i', srt_path,
-                '-c', 'copy',
-                '-c:s', 'mov_text',
-                '-metadata', f'title={title}',
-                '-metadata', 'description=Downloaded from Udemy Saver by Lonewolf',
-                '-metadata', 'comment=Downloaded from Udemy Saver by Lonewolf',
-                temp_output
-            ]
-            
             subprocess.run(ffmpeg_cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             
             # 4. Replace original file with branded file
             shutil.move(temp_output, destination_path)
-            
-            # 5. Cleanup
-            os.remove(srt_path)
             print(f"    Branding applied successfully.")
-            
         except subprocess.CalledProcessError as e:
-            print(f"Error downloading or branding video: {e}")
-            print("Note: Udemy DRM videos cannot be downloaded with this script.")
+            print(f"Error branding video: {e}")
         except FileNotFoundError:
-            print("yt-dlp or ffmpeg is not installed or not in PATH. Please install them to download and brand videos.")
+            print("ffmpeg is not installed or not in PATH. Please install it to brand videos.")
+        finally:
+            # 5. Cleanup
+            os.remove(srt_path)
+
+
+def sanitize_filename(filename):
+    """Removes invalid characters from filenames."""
+    invalid_chars = '<>:"/\\|?*'
+    for char in invalid_chars:
+        filename = filename.replace(char, '_')
+    return filename.strip()
+
+def _read_body(r, buffer):
+    """
+    Yields the response body as memoryviews over `buffer`, refilled in place on every read.
+    Each view is only valid until the next one is produced.
+    """
+    if r.headers.get("Content-Encoding", "identity") != "identity":
+        # Compressed bodies must go through requests' decoder; chunks are still bounded
+        yield from r.iter_content(chunk_size=len(buffer))
+        return
+
+    view = memoryview(buffer)
+    while True:
+        try:
+            n = r.raw.readinto(view)
+        except (urllib3.exceptions.HTTPError, OSError) as e:
+            # Reading raw bypasses requests' wrapping; re-raise as it would, so callers' retries apply
+            raise requests.exceptions.ConnectionError(e)
+        if not n:
+            return
+        yield view[:n]
+
+def _preallocate(fd, size):
+    """Reserves `size` bytes for a file up front so the filesystem can lay it out contiguously."""
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass
+    os.ftruncate(fd, size)
+
+_pwrite_lock = threading.Lock()
+
+def _pwrite(fd, data, offset):
+    if hasattr(os, "pwrite"):
+        os.pwrite(fd, data, offset)
+        return
+    # Windows has no pwrite; serialise seek+write instead
+    with _pwrite_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
+
+def _hls_attributes(line):
+    """Parses an attribute list like `BANDWIDTH=1280000,RESOLUTION=1280x720,CODECS="a,b"`."""
+    return {key: value.strip('"') for key, value in re.findall(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)', line)}
+
+def parse_hls_master(text, base_url):
+    """Returns the variants of a master playlist as dicts with uri, bandwidth and height."""
+    variants = []
+    attributes = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-STREAM-INF:"):
+            attributes = _hls_attributes(line.split(":", 1)[1])
+        elif line and not line.startswith("#") and attributes is not None:
+            resolution = attributes.get("RESOLUTION", "")
+            height = int(resolution.split("x")[1]) if "x" in resolution else 0
+            variants.append({
+                "uri": urljoin(base_url, line),
+                "bandwidth": int(attributes.get("BANDWIDTH", 0) or 0),
+                "height": height
+            })
+            attributes = None
+    return variants
+
+def pick_hls_variant(variants, quality=None):
+    """Picks the variant whose height matches the quality label, else the best one."""
+    if not variants:
+        return None
+    if quality:
+        for variant in variants:
+            if str(variant["height"]) == str(quality):
+                return variant
+    return max(variants, key=lambda v: (v["height"], v["bandwidth"]))
+
+def parse_hls_media(text, base_url):
+    """
+    Returns the ordered segments of a media playlist as dicts with uri and optional byterange,
+    including the EXT-X-MAP init section first when there is one.
+    """
+    segments = []
+    duration = None
+    byterange = None
+    next_offset = 0
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-KEY:"):
+            method = _hls_attributes(line.split(":", 1)[1]).get("METHOD", "NONE")
+            if method != "NONE":
+                raise HLSNotSupported(f"Encrypted segments ({method})")
+        elif line.startswith("#EXT-X-MAP:"):
+            attributes = _hls_attributes(line.split(":", 1)[1])
+            init = {"uri": urljoin(base_url, attributes["URI"])}
+            if attributes.get("BYTERANGE"):
+                length, _, start = attributes["BYTERANGE"].partition("@")
+                init["byterange"] = (int(start or 0), int(length))
+            segments.append(init)
+        elif line.startswith("#EXTINF:"):
+            duration = float(line.split(":", 1)[1].split(",")[0] or 0)
+        elif line.startswith("#EXT-X-BYTERANGE:"):
+            length, _, start = line.split(":", 1)[1].partition("@")
+            start = int(start) if start else next_offset
+            byterange = (start, int(length))
+            next_offset = start + int(length)
+        elif line and not line.startswith("#"):
+            segment = {"uri": urljoin(base_url, line), "duration": duration}
+            if byterange:
+                segment["byterange"] = byterange
+            segments.append(segment)
+            duration = None
+            byterange = None
+    return segments
+
+def _content_range_total(r):
+    """Returns the total size from a `Content-Range: bytes 0-0/12345` header, or None."""
+    match = re.match(r"bytes \d+-\d+/(\d+)", r.headers.get("Content-Range", ""))
+    return int(match.group(1)) if match else None
+
+def _expected_md5(r):
+    """Returns the MD5 the server vouches for (Content-MD5, or a plain single-part S3 ETag), if any."""
+    content_md5 = r.headers.get("Content-MD5")
+    if content_md5 and r.status_code == 200:
+        try:
+            return base64.b64decode(content_md5).hex()
+        except ValueError:
+            pass
+    etag = r.headers.get("ETag", "").strip('"')
+    if re.fullmatch(r"[0-9a-f]{32}", etag):
+        return etag
+    return None
+
+def _file_md5(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+def _load_state(state_path):
+    try:
+        with open(state_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _save_state(state_path, state):
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,345 @@
+import os
+import queue
+import threading
+import time
+from urllib.parse import urlparse
+
+import metrics
+from models import Asset, Chapter, Lecture, attachment_url, curriculum_item
+
+_STOP = object()
+
+
+class BandwidthLimiter:
+    """Token bucket shared by every transfer worker to cap total throughput (bytes/sec)."""
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        """Blocks until `amount` bytes may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount or self.tokens >= self.capacity:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostLimiter:
+    """
+    Caps the number of simultaneous connections to any single host. The Downloader takes a slot
+    per connection it opens (each Range segment and HLS segment fetch), not per file.
+    """
+    def __init__(self, per_host=4):
+        self.per_host = per_host
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self._semaphores[host]
+
+
+class Stage:
+    """
+    A pool of worker threads draining a bounded queue into the next stage.
+    on_error(item, exception) is called when the handler raises.
+    """
+    def __init__(self, name, workers, handler, queue_size, cancel_event=None, on_error=None):
+        self.name = name
+        self.handler = handler
+        self.on_error = on_error
+        self.cancel_event = cancel_event
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.threads = [threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True) for i in range(workers)]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, item):
+        self.queue.put(item)
+
+    def close(self):
+        """Lets the workers finish everything queued so far, then waits for them."""
+        for _ in self.threads:
+            self.queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                continue
+            try:
+                self.handler(item)
+            except Exception as e:
+                print(f"    [{self.name}] Failed: {e}")
+                if self.on_error is not None:
+                    self.on_error(item, e)
+
+
+def attachment_file_name(supp, file_url):
+    """Builds the on-disk name for an attachment, borrowing the extension from the URL if the title has none."""
+    supp_title = supp.title or supp.filename or "attachment"
+    ext = ""
+    if supp_title.find('.') == -1:  # No extension in title
+        base_name = os.path.basename(urlparse(file_url).path)
+        if '.' in base_name:
+            ext = f".{base_name.split('.')[-1]}"
+    return supp_title + ext
+
+
+def iter_lectures(dl, course_path, curriculum):
+    """
+    Walks the curriculum (raw items or parsed models), creating chapter folders,
+    and yields (Lecture, chapter path) pairs.
+    """
+    current_chapter_index = 0
+    current_chapter_path = course_path
+
+    for item in curriculum:
+        if isinstance(item, dict):
+            item = curriculum_item(item)
+
+        if isinstance(item, Chapter):
+            current_chapter_index += 1
+            current_chapter_path = dl.create_chapter_dir(course_path, current_chapter_index, item.title)
+            print(f"\n-> Chapter: {item.title}")
+
+        elif isinstance(item, Lecture):
+            yield item, current_chapter_path
+
+
+class DownloadEngine:
+    """
+    Pipelined course downloader built around Downloader.
+    Lectures flow through three stages, each with its own worker pool and a bounded queue
+    in front of it: resolve (Udemy API lookups), transfer (yt-dlp / file downloads, limited
+    per host and optionally by a global bandwidth cap) and post-process (branding).
+    Finished files are recorded in the manifest when one is given; with sync=True the manifest,
+    not the file names, decides what is already mirrored, so unchanged lectures are never resolved.
+    on_event(name, job) is called with "queued", "done" and "failed" for every file (a lecture whose
+    lookup raised counts as one failed file of kind "lecture"), and setting cancel_event drains
+    the remaining work without doing it. quality is passed to
+    Asset.select_video ('720', '<=720', 'lowest'; highest when None). With a ContentStore,
+    assets already downloaded for another course are linked from it instead of downloaded.
+    """
+    def __init__(self, api, downloader, resolve_workers=4, transfer_workers=4, postprocess_workers=2,
+                 per_host=4, bandwidth_limit=None, queue_size=16, manifest=None, sync=False,
+                 on_event=None, cancel_event=None, quality=None, store=None):
+        self.api = api
+        self.downloader = downloader
+        self.quality = quality
+        self.on_event = on_event
+        self.cancel_event = cancel_event
+        self.manifest = manifest
+        self.store = store
+        self.sync = sync and manifest is not None
+        self.hosts = HostLimiter(per_host)
+        self.downloader.hosts = self.hosts
+        self.bandwidth_limit = bandwidth_limit
+        self.transfer_workers = transfer_workers
+        if bandwidth_limit:
+            self.downloader.bandwidth = BandwidthLimiter(bandwidth_limit)
+
+        self.resolve_stage = Stage("resolve", resolve_workers, self._resolve, queue_size, cancel_event,
+                                   self._resolve_failed)
+        self.transfer_stage = Stage("transfer", transfer_workers, self._transfer, queue_size, cancel_event,
+                                    self._file_failed)
+        self.postprocess_stage = Stage("post", postprocess_workers, self._postprocess, queue_size, cancel_event,
+                                       self._file_failed)
+
+    def run(self, course_id, lectures):
+        """
+        Downloads every lecture in `lectures`, an iterable of (lecture item, chapter path) pairs.
+        Returns once every stage has drained.
+        """
+        with metrics.span("course", course=course_id):
+            for stage in (self.postprocess_stage, self.transfer_stage, self.resolve_stage):
+                stage.start()
+
+            try:
+                # `lectures` may be lazy (e.g. a curriculum still being paged in), so work starts on the first one
+                for item, chapter_path in lectures:
+                    self.resolve_stage.put((course_id, item, chapter_path))
+            finally:
+                # Close front to back so each stage sees everything the previous one produced
+                self.resolve_stage.close()
+                self.transfer_stage.close()
+                self.postprocess_stage.close()
+
+    def _resolve(self, job):
+        course_id = job[0]
+        with metrics.span("resolve", course=course_id, lecture=job[1].id):
+            self._resolve_lecture(job)
+
+    def _resolve_lecture(self, job):
+        course_id, lecture, chapter_path = job
+        dl = self.downloader
+        lecture_title = lecture.title
+        lecture_id = lecture.id
+        object_index = lecture.object_index or 0
+        print(f"  * Lecture: {lecture_title}")
+
+        safe_title = dl.sanitize_filename(f"{object_index:03d} - {lecture_title}")
+        video_path = os.path.join(chapter_path, safe_title + ".mp4")
+        asset_id = lecture.asset.id
+        is_video = lecture.asset.is_video
+
+        if self.sync and is_video and asset_id:
+            # A replaced video must not be mistaken for the one already on disk
+            self.manifest.drop_replaced(course_id, lecture_id, "video", {asset_id})
+
+        if self.sync and is_video and asset_id and self.manifest.reuse(course_id, lecture_id, asset_id, video_path,
+                                                                       requested=self.quality or ""):
+            print(f"    Video unchanged: {os.path.basename(video_path)}. Skipping.")
+        elif os.path.exists(video_path):
+            print(f"    Video already exists: {os.path.basename(video_path)}. Skipping.")
+            if self.sync and asset_id and not self.manifest.get(course_id, lecture_id, asset_id):
+                # Mirrored before the manifest existed: adopt it so later syncs can track it
+                self.manifest.record(course_id, lecture_id, asset_id, "video", None, video_path, requested=self.quality)
+        elif is_video:
+            asset_info = self.api.get_lecture_asset(course_id, lecture_id)
+            if asset_info and "error" not in asset_info:
+                asset = Asset.from_json(asset_info.get('asset'))
+                video = asset.select_video(self.quality)
+                if video:
+                    job = {
+                        "kind": "video", "url": video.url, "dest": video_path, "title": lecture_title,
+                        "course_id": course_id, "lecture_id": lecture_id,
+                        "asset_id": asset_id or asset.id, "quality": video.label
+                    }
+                    if not self._link_from_store(job):
+                        self._queue_transfer(job)
+                else:
+                    print(f"    No video stream available for {lecture_title} (might be an article, DRM locked, or quiz).")
+
+        # Download supplementary assets (attachments)
+        supplementary = lecture.attachments
+        if self.sync:
+            self.manifest.drop_replaced(course_id, lecture_id, "attachment", {supp.id for supp in supplementary})
+
+        for supp in supplementary:
+            supp_id = supp.id
+            if not supp_id:
+                continue
+            if supp.is_external:
+                print(f"    -> {supp.title} is an external link, not a downloadable file.")
+                continue
+
+            if self.sync:
+                entry = self.manifest.get(course_id, lecture_id, supp_id)
+                expected = os.path.join(chapter_path, os.path.basename(entry["path"])) if entry else None
+                if entry and self.manifest.reuse(course_id, lecture_id, supp_id, expected):
+                    print(f"    Attachment unchanged: {os.path.basename(expected)}. Skipping.")
+                    continue
+
+            stored_path = self.store.lookup(supp_id) if self.store is not None else None
+            if stored_path:
+                # The stored copy keeps the extension the name needs, so no supplementary-asset lookup
+                dest_path = os.path.join(chapter_path, dl.sanitize_filename(attachment_file_name(supp, stored_path)))
+                job = {
+                    "kind": "attachment", "url": None, "dest": dest_path, "title": None,
+                    "course_id": course_id, "lecture_id": lecture_id, "asset_id": supp_id, "quality": None
+                }
+                if self._link_from_store(job):
+                    continue
+
+            supp_info = self.api.get_supplementary_asset(course_id, lecture_id, supp_id)
+            file_url = attachment_url(supp_info) if supp_info and "error" not in supp_info else None
+            if not file_url:
+                print(f"    -> Could not extract a valid download link for {supp.title}.")
+                continue
+
+            dest_path = os.path.join(chapter_path, dl.sanitize_filename(attachment_file_name(supp, file_url)))
+            self._queue_transfer({
+                "kind": "attachment", "url": file_url, "dest": dest_path, "title": None,
+                "course_id": course_id, "lecture_id": lecture_id, "asset_id": supp_id, "quality": None
+            })
+
+    def _link_from_store(self, job):
+        """Links an asset downloaded for another course into place. Returns False if it must be downloaded."""
+        if self.store is None or not job["asset_id"]:
+            return False
+        checksum = self.store.link_existing(job["asset_id"], job["quality"], job["dest"])
+        if checksum is None:
+            return False
+        print(f"    Linked from store: {os.path.basename(job['dest'])}")
+        self._notify("queued", job)
+        if self.manifest is not None:
+            self.manifest.record(job["course_id"], job["lecture_id"], job["asset_id"], job["kind"],
+                                 job["quality"], job["dest"], checksum, self._requested(job))
+        self._notify("done", job)
+        return True
+
+    def _queue_transfer(self, job):
+        self._notify("queued", job)
+        self.transfer_stage.put(job)
+
+    def _transfer(self, job):
+        with metrics.span("transfer", course=job["course_id"], lecture=job["lecture_id"], kind=job["kind"]):
+            if job["kind"] == "video":
+                # yt-dlp runs out of process, so give each worker an even share of the cap
+                rate = self.bandwidth_limit / self.transfer_workers if self.bandwidth_limit else None
+                if self.downloader.fetch_video(job["url"], job["dest"], job["title"], rate_limit=rate, quality=job["quality"]):
+                    self.postprocess_stage.put(job)
+                else:
+                    self._notify("failed", job)
+            elif self.downloader.download_file(job["url"], job["dest"]):
+                self._record(job)
+                self._notify("done", job)
+            else:
+                self._notify("failed", job)
+
+    def _postprocess(self, job):
+        with metrics.span("postprocess", course=job["course_id"], lecture=job["lecture_id"]):
+            self.downloader.apply_branding(job["dest"], job["title"])
+        self._record(job)
+        self._notify("done", job)
+
+    def _resolve_failed(self, item, error):
+        # The lecture never got as far as its files: count it as one failed file so the job isn't "completed"
+        course_id, lecture, _ = item
+        job = {
+            "kind": "lecture", "url": None, "dest": None, "title": lecture.title,
+            "course_id": course_id, "lecture_id": lecture.id, "asset_id": None, "quality": None
+        }
+        self._notify("queued", job)
+        self._notify("failed", job)
+
+    def _file_failed(self, job, error):
+        self._notify("failed", job)
+
+    def _notify(self, name, job):
+        if self.on_event:
+            self.on_event(name, job)
+
+    def _requested(self, job):
+        return self.quality if job["kind"] == "video" else None
+
+    def _record(self, job):
+        if not job.get("asset_id") or not os.path.exists(job["dest"]):
+            return
+        checksum = None
+        if self.store is not None:
+            checksum = self.store.add(job["kind"], job["asset_id"], job["quality"], job["dest"])
+        if self.manifest is not None:
+            self.manifest.record(
+                job["course_id"], job["lecture_id"], job["asset_id"], job["kind"], job["quality"], job["dest"], checksum,
+                self._requested(job)
+            )
@@ -0,0 +1,257 @@
+"""
+Server-side download jobs.
+
+A job mirrors a course (or a subset of its lectures) into JOBS_DIR using the same
+DownloadEngine as the terminal downloader. Jobs wait in a priority queue and are picked
+up by JOB_WORKERS worker threads, with at most JOB_QUOTA_PER_TOKEN jobs running for any
+one access token at a time. Everything lives in memory: a restarted server forgets its
+jobs, but resuming one picks up the `.part` files and manifest it left behind.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+import uuid
+
+from cache import token_hash
+from downloader import Downloader, sanitize_filename
+from engine import DownloadEngine, iter_lectures
+from manifest import Manifest
+from store import ContentStore
+from udemy import UdemyAPI
+
+JOBS_DIR = os.environ.get("JOBS_DIR", "Downloads")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_QUOTA_PER_TOKEN = int(os.environ.get("JOB_QUOTA_PER_TOKEN", "2"))
+# Lower runs first
+DEFAULT_PRIORITY = 10
+
+TERMINAL_STATES = ("completed", "failed", "cancelled")
+
+
+class JobConflict(Exception):
+    """Another queued or running job already writes into the same course folder."""
+
+
+class Job:
+    """One course download. The access token is kept for the workers but never serialized."""
+    def __init__(self, access_token, course_id, title=None, lecture_ids=None, priority=DEFAULT_PRIORITY):
+        self.id = uuid.uuid4().hex
+        self.access_token = access_token
+        self.owner = token_hash(access_token)
+        self.course_id = course_id
+        self.title = title or f"Course {course_id}"
+        # Jobs writing into the same folder would overwrite each other's .part files
+        self.folder = sanitize_filename(self.title).casefold()
+        self.lecture_ids = set(lecture_ids) if lecture_ids else None
+        self.priority = priority
+        self.state = "queued"
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.bytes_done = 0
+        self.files_total = 0
+        self.files_done = 0
+        self.files_failed = 0
+        # Bumped on every change so event streams know when to push an update
+        self.version = 0
+        self.cancel_event = threading.Event()
+        self._lock = threading.Lock()
+        self._rate_window = (time.monotonic(), 0)
+        self._throughput = 0.0
+
+    def add_bytes(self, amount):
+        with self._lock:
+            self.bytes_done += amount
+            now = time.monotonic()
+            window_start, window_bytes = self._rate_window
+            window_bytes += amount
+            if now - window_start >= 1.0:
+                self._throughput = window_bytes / (now - window_start)
+                window_start, window_bytes = now, 0
+            self._rate_window = (window_start, window_bytes)
+            self.version += 1
+
+    def on_event(self, name, file_job):
+        with self._lock:
+            if name == "queued":
+                self.files_total += 1
+            elif name == "done":
+                self.files_done += 1
+            elif name == "failed":
+                self.files_failed += 1
+            self.version += 1
+
+    def set_state(self, state, error=None):
+        with self._lock:
+            self.state = state
+            self.error = error
+            if state == "running":
+                self.started_at = time.time()
+                self.finished_at = None
+            elif state in TERMINAL_STATES:
+                self.finished_at = time.time()
+                self._throughput = 0.0
+            self.version += 1
+
+    def throughput(self):
+        """Bytes/sec over the last second or so; decays to 0 once the transfer stalls."""
+        window_start, _ = self._rate_window
+        if self.state != "running" or time.monotonic() - window_start > 5:
+            return 0.0
+        return self._throughput
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "course_id": self.course_id,
+            "title": self.title,
+            "lecture_ids": sorted(self.lecture_ids) if self.lecture_ids else None,
+            "priority": self.priority,
+            "state": self.state,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "bytes_done": self.bytes_done,
+            "throughput": round(self.throughput(), 1),
+            "files_total": self.files_total,
+            "files_done": self.files_done,
+            "files_failed": self.files_failed
+        }
+
+
+class JobManager:
+    """Priority scheduler and worker pool for download jobs."""
+    def __init__(self, root=JOBS_DIR, workers=JOB_WORKERS, quota_per_token=JOB_QUOTA_PER_TOKEN):
+        self.root = root
+        self.workers = workers
+        self.quota_per_token = quota_per_token
+        self.jobs = {}
+        self._queue = []
+        self._sequence = itertools.count()
+        self._running = {}
+        self._cond = threading.Condition()
+        self._threads = []
+        self._manifest = None
+        self._store = None
+
+    def _start_workers(self):
+        # Lazily, so importing the API doesn't spawn threads or touch the download root
+        if self._threads:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        self._manifest = Manifest(self.root)
+        self._store = ContentStore(self.root, self._manifest)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _check_folder(self, job):
+        """Raises JobConflict if another unfinished job targets job's course folder. Caller holds the lock."""
+        for other in self.jobs.values():
+            if other is not job and other.folder == job.folder and other.state not in TERMINAL_STATES:
+                raise JobConflict(f"A job for {job.title!r} is already {other.state}")
+
+    def submit(self, job):
+        with self._cond:
+            self._check_folder(job)
+            self._start_workers()
+            self.jobs[job.id] = job
+            self._enqueue(job)
+        return job
+
+    def _enqueue(self, job):
+        heapq.heappush(self._queue, (job.priority, next(self._sequence), job))
+        self._cond.notify()
+
+    def get(self, job_id, owner):
+        """Returns the job if it exists and belongs to `owner` (a token hash), else None."""
+        job = self.jobs.get(job_id)
+        if job is None or job.owner != owner:
+            return None
+        return job
+
+    def list(self, owner):
+        return sorted((job for job in self.jobs.values() if job.owner == owner), key=lambda job: job.created_at)
+
+    def cancel(self, job):
+        """Stops a queued or running job. Partial files stay on disk for a later resume."""
+        with self._cond:
+            if job.state in TERMINAL_STATES:
+                return job
+            job.cancel_event.set()
+            if job.state == "queued":
+                self._queue = [entry for entry in self._queue if entry[2] is not job]
+                heapq.heapify(self._queue)
+                job.set_state("cancelled")
+        return job
+
+    def resume(self, job):
+        """Re-queues a cancelled or failed job; finished files are skipped and partial ones resumed."""
+        with self._cond:
+            if job.state not in ("cancelled", "failed"):
+                return job
+            self._check_folder(job)
+            job.cancel_event = threading.Event()
+            job.files_total = job.files_done = job.files_failed = 0
+            job.set_state("queued")
+            self._enqueue(job)
+        return job
+
+    def _next_job(self):
+        """Pops the best-priority job whose owner is under quota. Caller holds the lock."""
+        for entry in sorted(self._queue):
+            job = entry[2]
+            if self._running.get(job.owner, 0) < self.quota_per_token:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                return job
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                self._running[job.owner] = self._running.get(job.owner, 0) + 1
+                job.set_state("running")
+
+            try:
+                self._run(job)
+                if job.cancel_event.is_set():
+                    job.set_state("cancelled")
+                elif job.files_failed:
+                    job.set_state("failed", f"{job.files_failed} file(s) failed")
+                else:
+                    job.set_state("completed")
+            except Exception as e:
+                job.set_state("failed", str(e))
+            finally:
+                with self._cond:
+                    self._running[job.owner] -= 1
+                    # A slot for this owner opened up: another worker may now take their next job
+                    self._cond.notify_all()
+
+    def _run(self, job):
+        api = UdemyAPI(job.access_token)
+        dl = Downloader(self.root, on_progress=job.add_bytes, cancel_event=job.cancel_event)
+        course_path = dl.create_course_dir(job.title)
+        lectures = iter_lectures(dl, course_path, api.iter_course_curriculum(job.course_id, slim=True))
+        if job.lecture_ids:
+            lectures = ((lecture, path) for lecture, path in lectures if lecture.id in job.lecture_ids)
+
+        engine = DownloadEngine(
+            api, dl, manifest=self._manifest, sync=True, store=self._store,
+            on_event=job.on_event, cancel_event=job.cancel_event
+        )
+        engine.run(job.course_id, lectures)
+
+
+# Shared by the /api/jobs routes
+job_manager = JobManager()
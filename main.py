@@ -1,27 +1,60 @@
+import argparse
+import shutil
 import sys
 import os
+from curl_cffi.requests.exceptions import RequestException
 from udemy import UdemyAPI
 from downloader import Downloader
+from engine import DownloadEngine, iter_lectures
+from manifest import Manifest
+from models import Course
+from planner import SizePlanner
+from store import ContentStore
+from zipstream import course_attachments, write_attachments_zip
+import metrics
 
-def main():
-    print("=== Udemy Terminal Downloader ===")
-    access_token = input("Enter your Udemy access_token: ").strip()
-    
-    if not access_token:
-        print("Please provide a valid access_token.")
-        sys.exit(1)
-        
-    api = UdemyAPI(access_token)
-    
-    courses = api.get_subscribed_courses()
-    
-    if not courses:
-        print("No courses found or failed to authenticate.")
-        sys.exit(1)
+def parse_args():
+    parser = argparse.ArgumentParser(description="Udemy Terminal Downloader")
+    parser.add_argument("--resolve-workers", type=int, default=4, help="Parallel Udemy API lookups")
+    parser.add_argument("--transfer-workers", type=int, default=4, help="Parallel video/attachment downloads")
+    parser.add_argument("--postprocess-workers", type=int, default=2, help="Parallel branding (ffmpeg) jobs")
+    parser.add_argument("--per-host", type=int, default=4, help="Max simultaneous connections per host (each download segment counts)")
+    parser.add_argument("--limit-rate", type=float, default=None, help="Global bandwidth cap in MB/s")
+    parser.add_argument("--output", default="Downloads", help="Download root directory")
+    parser.add_argument("--token", default=os.environ.get("UDEMY_ACCESS_TOKEN"), help="Udemy access_token (prompted if omitted)")
+    parser.add_argument("--course", type=int, action="append", help="Course ID to download (repeatable, skips the menu)")
+    parser.add_argument("--all", action="store_true", help="Download every enrolled course")
+    parser.add_argument("--sync", action="store_true",
+                        help="Only fetch lectures that are new or changed since the last run (uses the manifest in the download root)")
+    parser.add_argument("--quality", help="Video quality: '720', '<=720' (best not above), 'lowest' (default: highest)")
+    parser.add_argument("--plan", action="store_true", help="Only print the download size per quality tier, don't download")
+    parser.add_argument("--budget-gb", type=float, default=None,
+                        help="Disk budget per course; the best quality that fits is chosen (default with --plan: free space)")
+    parser.add_argument("--time-budget-hours", type=float, default=None,
+                        help="With --limit-rate, also fit each course into what that rate transfers in this many hours")
+    parser.add_argument("--attachments-zip", action="store_true",
+                        help="Only save each course's attachments, as one '<course> - attachments.zip' in the download root")
+    parser.add_argument("--no-store", action="store_true",
+                        help="Don't link assets already downloaded for another course from the download root's .store")
+    parser.add_argument("--trace", action="store_true", help="Print the duration of every resolve/transfer/post-process span")
+    parser.add_argument("--metrics-out", help="Write Prometheus-format metrics to this file when done")
+    return parser.parse_args()
+
+def print_span(name, tags, seconds):
+    details = " ".join(f"{key}={value}" for key, value in tags.items() if value is not None)
+    print(f"    [trace] {name} {details} {seconds * 1000:.1f}ms")
+
+def choose_courses(args, courses):
+    """Returns the courses to download, from --course/--all or an interactive menu."""
+    if args.all:
+        return courses
+    if args.course:
+        wanted = set(args.course)
+        return [course for course in courses if course.id in wanted]
 
     print("\n--- Subscribed Courses ---")
     for idx, course in enumerate(courses, 1):
-        print(f"{idx}. {course['title']}")
+        print(f"{idx}. {course.title}")
         
     print("--------------------------")
     
@@ -34,118 +67,128 @@ def main():
         print("Invalid input.")
         sys.exit(1)
         
-    selected_course = courses[choice - 1]
+    return [courses[choice - 1]]
+
+def plan_budget(args, dl):
+    """Returns the byte budget a course must fit in, from --budget-gb/--time-budget-hours or free disk space."""
+    budgets = []
+    if args.budget_gb is not None:
+        budgets.append(int(args.budget_gb * 1024 ** 3))
+    else:
+        budgets.append(shutil.disk_usage(dl.base_dir).free)
+    if args.time_budget_hours and args.limit_rate:
+        budgets.append(int(args.limit_rate * 1024 * 1024 * args.time_budget_hours * 3600))
+    return min(budgets)
+
+def plan_course(args, api, dl, selected_course):
+    """Prints the size of a course per quality tier and returns the best tier that fits the budget."""
+    print(f"\nPlanning: {selected_course.title} ...")
+    curriculum = api.get_course_curriculum(selected_course.id, slim=True)
+    if "error" in curriculum:
+        print(f"Failed to fetch curriculum: {curriculum['error']}")
+        return None
+
+    budget = plan_budget(args, dl)
+    plan = SizePlanner(api).plan(selected_course.id, curriculum["curriculum"], budget)
+    print(f"  {plan['videos']} videos, attachments {plan['attachment_bytes'] / 1024 ** 3:.2f} GB, budget {budget / 1024 ** 3:.2f} GB")
+    for tier in plan["tiers"]:
+        notes = []
+        if tier["estimated"]:
+            notes.append(f"{tier['estimated']} estimated")
+        if tier["unknown"]:
+            notes.append(f"{tier['unknown']} unknown")
+        marker = " <- fits" if tier["quality"] == plan["recommended"] else ""
+        print(f"  {tier['quality']:>6}: {tier['bytes'] / 1024 ** 3:8.2f} GB{' (' + ', '.join(notes) + ')' if notes else ''}{marker}")
+    return plan
+
+def zip_attachments(args, api, dl, selected_course):
+    """Streams every attachment of a course into one ZIP file, without unpacking anything to disk."""
+    print(f"\nZipping attachments of: {selected_course.title} ...")
+    curriculum = api.get_course_curriculum(selected_course.id, slim=True)
+    if "error" in curriculum:
+        print(f"Failed to fetch curriculum: {curriculum['error']}")
+        return
+    attachments = course_attachments(curriculum["curriculum"])
+    if not attachments:
+        print("  No attachments.")
+        return
+
+    zip_path = os.path.join(dl.base_dir, dl.sanitize_filename(selected_course.title) + " - attachments.zip")
+    with open(zip_path + ".part", "wb") as f:
+        written, missing = write_attachments_zip(api, dl.session, selected_course.id, attachments, f,
+                                                 workers=args.resolve_workers)
+    os.replace(zip_path + ".part", zip_path)
+    print(f"  Saved {written} attachments to {zip_path}" + (f" ({len(missing)} missing)" if missing else ""))
+
+def download_course(args, api, dl, manifest, selected_course, quality=None, store=None):
+    print(f"\nFetching curriculum for: {selected_course.title} ...")
+    # Lectures are handed to the engine page by page, while the rest of the curriculum is still loading
+    curriculum = api.iter_course_curriculum(selected_course.id, slim=True)
+    course_path = dl.create_course_dir(selected_course.title)
     
-    print(f"\nFetching curriculum for: {selected_course['title']} ...")
-    curriculum = api.get_course_curriculum(selected_course['id'])
+    engine = DownloadEngine(
+        api, dl,
+        resolve_workers=args.resolve_workers,
+        transfer_workers=args.transfer_workers,
+        postprocess_workers=args.postprocess_workers,
+        per_host=args.per_host,
+        bandwidth_limit=int(args.limit_rate * 1024 * 1024) if args.limit_rate else None,
+        manifest=manifest,
+        sync=args.sync,
+        quality=quality,
+        store=store
+    )
+    try:
+        engine.run(selected_course.id, iter_lectures(dl, course_path, curriculum))
+    except RequestException as e:
+        print(f"Failed to fetch curriculum: {e}")
+
+def main():
+    args = parse_args()
+    if args.trace:
+        metrics.add_span_hook(print_span)
+    print("=== Udemy Terminal Downloader ===")
+    access_token = args.token or input("Enter your Udemy access_token: ").strip()
     
-    if not curriculum:
-        print("Failed to fetch curriculum.")
+    if not access_token:
+        print("Please provide a valid access_token.")
         sys.exit(1)
         
-    dl = Downloader()
-    course_path = dl.create_course_dir(selected_course['title'])
+    api = UdemyAPI(access_token)
     
-    current_chapter_title = "Uncategorized"
-    current_chapter_index = 0
-    current_chapter_path = course_path
+    res = api.get_subscribed_courses()
+    courses = [Course.from_json(course) for course in res.get("courses") or []]
     
-    for item in curriculum:
-        item_type = item.get('_class')
-        
-        if item_type == 'chapter':
-            current_chapter_index += 1
-            current_chapter_title = item.get('title')
-            current_chapter_path = dl.create_chapter_dir(course_path, current_chapter_index, current_chapter_title)
-            print(f"\n-> Chapter: {current_chapter_title}")
-            
-        elif item_type == 'lecture':
-            lecture_title = item.get('title')
-            lecture_id = item.get('id')
-            object_index = item.get('object_index')
-            
-            safe_title = dl.sanitize_filename(f"{object_index:03d} - {lecture_title}")
-            print(f"  * Lecture: {lecture_title}")
-            
-            # Fetch stream URLs
-            asset_info = api.get_lecture_asset(selected_course['id'], lecture_id)
-            if not asset_info:
-                continue
-                
-            asset = asset_info.get('asset', {})
-            stream_urls = asset.get('stream_urls', {})
-            download_urls = asset.get('download_urls', {})
-            
-            # Prefer 1080p, else 720p, else 480p, else 360p
-            video_url = None
-            if stream_urls:
-                videos = stream_urls.get('Video', [])
-                if videos:
-                    # sort by resolution descending or simply take the first if it's highest to lowest.
-                    # Usually it's a list. We will just use yt-dlp on the first URL or the best download URL.
-                    video_url = videos[0].get('file')
-
-            # Alternative: direct download_url from 'download_urls'
-            if not video_url and download_urls:
-                 videos = download_urls.get('Video', [])
-                 if videos:
-                     video_url = videos[0].get('file')
+    if not courses:
+        print("No courses found or failed to authenticate.")
+        sys.exit(1)
 
-            # Download video (if any)
-            if video_url:
-                dest_path = os.path.join(current_chapter_path, safe_title)
-                print(f"    Downloading Video...")
-                dl.download_video_ytdlp(video_url, dest_path, lecture_title)
-            else:
-                 print("    No video stream available (might be an article, DRM locked, or quiz).")
-                 print("    [DEBUG] Asset Info:", asset)
+    dl = Downloader(args.output)
+    manifest = Manifest(dl.base_dir)
+    store = None if args.no_store else ContentStore(dl.base_dir, manifest)
 
-            # Download supplementary assets (attachments)
-            supplementary = item.get('supplementary_assets', [])
-            for supp in supplementary:
-                 supp_title = supp.get('title') or supp.get('filename') or "attachment"
-                 supp_id = supp.get('id')
-                 
-                 print(f"    Attachment found: {supp_title}")
-                 
-                 if not supp_id:
-                     print("      -> No asset ID found to download.")
-                     continue
-                     
-                 # Fetch the actual download URL for the asset
-                 supp_info = api.get_supplementary_asset(selected_course['id'], lecture_id, supp_id)
-                 if supp_info and 'download_urls' in supp_info:
-                     # Usually under File -> list of dicts with 'file' key
-                     # Or sometimes directly under a different key depending on asset_type
-                     download_urls = supp_info.get('download_urls', {})
-                     file_url = None
-                     
-                     if 'File' in download_urls and len(download_urls['File']) > 0:
-                         file_url = download_urls['File'][0].get('file')
-                         
-                     if file_url:
-                         # Attempt to get extension from the URL or filename
-                         ext = ""
-                         if supp_title.find('.') == -1: # No extension in title
-                             parsed_url = urlparse(file_url)
-                             base_name = os.path.basename(parsed_url.path)
-                             if '.' in base_name:
-                                 ext = f".{base_name.split('.')[-1]}"
-                         
-                         safe_supp_title = dl.sanitize_filename(supp_title + ext)
-                         
-                         dest_path = os.path.join(current_chapter_path, safe_supp_title)
-                         dl.download_file(file_url, dest_path)
-                     else:
-                         print("      -> Could not extract a valid download link from the asset info.")
-                 else:
-                     # If it's an external link, Udemy doesn't provide a direct file URL.
-                     if supp.get('is_external'):
-                         print("      -> This is an external link, not a downloadable file.")
-                     else:
-                         print("      -> Failed to fetch download info for this asset.")
+    for selected_course in choose_courses(args, courses):
+        if args.attachments_zip:
+            zip_attachments(args, api, dl, selected_course)
+            continue
+        quality = args.quality
+        if args.plan or args.budget_gb is not None or args.time_budget_hours:
+            plan = plan_course(args, api, dl, selected_course)
+            if args.plan or plan is None:
+                continue
+            if plan["tiers"] and plan["recommended"] is None:
+                print("  No quality fits the budget. Skipping.")
+                continue
+            if plan["recommended"]:
+                quality = f"<={plan['recommended']}" if plan["recommended"].isdigit() else plan["recommended"]
+                print(f"  Downloading at {quality}")
+        download_course(args, api, dl, manifest, selected_course, quality, store)
                  
     print("\nDownload process completed.")
 
+    if args.metrics_out:
+        with open(args.metrics_out, "w") as f:
+            f.write(metrics.render())
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,175 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+MANIFEST_NAME = ".udemy_manifest.sqlite3"
+
+
+def file_checksum(path):
+    """SHA-256 of a file, read in 1 MB blocks."""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class Manifest:
+    """
+    Per-download-root record of every file we've mirrored: which lecture/asset it came from,
+    the quality asked for and the one chosen, its size, checksum and where it ended up. Sync mode diffs the live
+    curriculum against it so only new or changed lectures are resolved and downloaded.
+    """
+    def __init__(self, root):
+        self.path = os.path.join(root, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                course_id INTEGER NOT NULL,
+                lecture_id INTEGER NOT NULL,
+                asset_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                quality TEXT,
+                size INTEGER NOT NULL,
+                checksum TEXT NOT NULL,
+                path TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                requested TEXT,
+                PRIMARY KEY (course_id, lecture_id, asset_id)
+            )
+        """)
+        # Manifests written before the requested quality was tracked
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(files)")]
+        if "requested" not in columns:
+            self._conn.execute("ALTER TABLE files ADD COLUMN requested TEXT")
+        # Index of the content-addressed store (see store.py); quality is '' for attachments
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS store (
+                asset_id INTEGER NOT NULL,
+                quality TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                checksum TEXT NOT NULL,
+                path TEXT NOT NULL,
+                PRIMARY KEY (asset_id, quality)
+            )
+        """)
+        self._conn.commit()
+
+    def _row(self, row):
+        if row is None:
+            return None
+        keys = ("course_id", "lecture_id", "asset_id", "kind", "quality", "size", "checksum", "path", "requested")
+        return dict(zip(keys, row))
+
+    def get(self, course_id, lecture_id, asset_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT course_id, lecture_id, asset_id, kind, quality, size, checksum, path, requested FROM files "
+                "WHERE course_id = ? AND lecture_id = ? AND asset_id = ?",
+                (course_id, lecture_id, asset_id)
+            ).fetchone()
+        return self._row(row)
+
+    def for_lecture(self, course_id, lecture_id, kind):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT course_id, lecture_id, asset_id, kind, quality, size, checksum, path, requested FROM files "
+                "WHERE course_id = ? AND lecture_id = ? AND kind = ?",
+                (course_id, lecture_id, kind)
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def record(self, course_id, lecture_id, asset_id, kind, quality, path, checksum=None, requested=None):
+        """
+        Records a finished file. The checksum is computed from disk unless given; `requested` is the
+        quality asked for (Asset.select_video's argument), `quality` the stream label it picked.
+        """
+        size = os.path.getsize(path)
+        checksum = checksum or file_checksum(path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (course_id, lecture_id, asset_id, kind, quality, size, checksum, os.path.abspath(path), time.time(),
+                 requested or "")
+            )
+            self._conn.commit()
+
+    def move(self, course_id, lecture_id, asset_id, new_path):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE files SET path = ?, updated_at = ? WHERE course_id = ? AND lecture_id = ? AND asset_id = ?",
+                (os.path.abspath(new_path), time.time(), course_id, lecture_id, asset_id)
+            )
+            self._conn.commit()
+
+    def forget(self, course_id, lecture_id, asset_id):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM files WHERE course_id = ? AND lecture_id = ? AND asset_id = ?",
+                (course_id, lecture_id, asset_id)
+            )
+            self._conn.commit()
+
+    def reuse(self, course_id, lecture_id, asset_id, expected_path, requested=None):
+        """
+        Returns True if this exact asset is already mirrored, moving it to expected_path first if the
+        lecture or chapter was renamed. Returns False if it still has to be downloaded. For videos,
+        `requested` is the quality now asked for: a copy fetched for another one is deleted.
+        """
+        entry = self.get(course_id, lecture_id, asset_id)
+        if entry is None:
+            return False
+        if not os.path.exists(entry["path"]) or os.path.getsize(entry["path"]) != entry["size"]:
+            self.forget(course_id, lecture_id, asset_id)
+            return False
+        if requested is not None and (entry["requested"] or "") != requested:
+            os.remove(entry["path"])
+            self.forget(course_id, lecture_id, asset_id)
+            print(f"    Quality changed: {os.path.basename(entry['path'])} will be downloaded again")
+            return False
+
+        if os.path.abspath(expected_path) != entry["path"]:
+            os.makedirs(os.path.dirname(expected_path), exist_ok=True)
+            os.replace(entry["path"], expected_path)
+            self.move(course_id, lecture_id, asset_id, expected_path)
+            print(f"    Renamed: {os.path.basename(entry['path'])} -> {os.path.basename(expected_path)}")
+        return True
+
+    def stored(self, asset_id, quality=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT kind, size, checksum, path FROM store WHERE asset_id = ? AND quality = ?",
+                (asset_id, quality or "")
+            ).fetchone()
+        return dict(zip(("kind", "size", "checksum", "path"), row)) if row else None
+
+    def record_stored(self, asset_id, quality, kind, size, checksum, path):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO store VALUES (?, ?, ?, ?, ?, ?)",
+                (asset_id, quality or "", kind, size, checksum, os.path.abspath(path))
+            )
+            self._conn.commit()
+
+    def forget_stored(self, asset_id, quality=None):
+        with self._lock:
+            self._conn.execute("DELETE FROM store WHERE asset_id = ? AND quality = ?", (asset_id, quality or ""))
+            self._conn.commit()
+
+    def drop_replaced(self, course_id, lecture_id, kind, current_asset_ids):
+        """
+        Deletes files of a lecture whose asset was replaced upstream (e.g. a re-recorded video),
+        so the new version isn't mistaken for an existing download.
+        """
+        for entry in self.for_lecture(course_id, lecture_id, kind):
+            if entry["asset_id"] in current_asset_ids:
+                continue
+            if os.path.exists(entry["path"]):
+                os.remove(entry["path"])
+                print(f"    Removed outdated file: {os.path.basename(entry['path'])}")
+            self.forget(course_id, lecture_id, entry["asset_id"])
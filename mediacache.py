@@ -0,0 +1,270 @@
+"""
+Size-bounded on-disk cache for relayed lecture media.
+
+Files are keyed by (course, lecture, quality), not by user: a cached video is only handed to
+callers whose own token resolved that lecture. Entries are written to a `.part` file while the
+upstream response streams through and only become visible once complete. When the total size
+goes over max_bytes, the least recently served entries are evicted.
+
+The cached videos are paid course content: by default they live in the account's private cache
+directory (mode 0700) and every file is created 0600. Several server workers can share one
+MEDIA_CACHE_DIR: files published by another worker are picked up on lookup, and a `.part` file
+is created exclusively so only one worker fills a key.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from curl_cffi.requests.exceptions import RequestException
+from fastapi.responses import StreamingResponse
+
+from cachebackends import private_cache_dir
+from udemy import get_async_session
+
+# Unset: a "media" folder in cachebackends.private_cache_dir(), resolved on first use
+MEDIA_CACHE_DIR = os.environ.get("MEDIA_CACHE_DIR")
+MEDIA_CACHE_MAX_BYTES = int(float(os.environ.get("MEDIA_CACHE_MAX_GB", "20")) * 1024 ** 3)
+# A .part file untouched for this long belongs to a fill that died
+STALE_PART_SECONDS = 3600
+# Bytes gathered before each write to the cache file, so the event loop isn't hit per network chunk
+WRITE_CHUNK = 1024 * 1024
+RELAYED_HEADERS = ("Content-Length", "Content-Range", "Content-Type", "Last-Modified")
+# CDN answers meaning the signed URL itself is no good any more
+REJECTED_URL_STATUSES = (401, 403, 404, 410)
+
+
+def media_key(course_id, lecture_id, quality):
+    return hashlib.sha256(f"{course_id}:{lecture_id}:{quality}".encode()).hexdigest()[:40]
+
+
+class MediaCache:
+    def __init__(self, root=MEDIA_CACHE_DIR, max_bytes=MEDIA_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._filling = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._loaded = False
+
+    def _load(self):
+        # Lazily, so importing the API doesn't touch the disk
+        if self._loaded:
+            return
+        if self.root is None:
+            self.root = os.path.join(private_cache_dir(), "media")
+        os.makedirs(self.root, mode=0o700, exist_ok=True)
+        found = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            stat = os.stat(path)
+            if name.endswith(".part"):
+                if time.time() - stat.st_mtime > STALE_PART_SECONDS:
+                    # Left behind by a fill that never finished (fresh ones may be another worker's)
+                    os.remove(path)
+                continue
+            found.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+        self._loaded = True
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def lookup(self, key):
+        """Returns the path of a complete cached file (marking it recently used), or None."""
+        with self._lock:
+            self._load()
+            if key not in self._entries and os.path.exists(self.path(key)):
+                # Published by another worker
+                self._entries[key] = os.path.getsize(self.path(key))
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            if not os.path.exists(self.path(key)):
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # Persist recency across restarts
+        now = time.time()
+        os.utime(self.path(key), (now, now))
+        return self.path(key)
+
+    def begin_fill(self, key):
+        """Claims the right to fill `key`. Returns the .part path to write, or None if someone else is filling it."""
+        with self._lock:
+            self._load()
+            if key in self._filling or key in self._entries:
+                return None
+            part_path = self.path(key) + ".part"
+            try:
+                if time.time() - os.path.getmtime(part_path) > STALE_PART_SECONDS:
+                    os.remove(part_path)
+            except OSError:
+                pass
+            try:
+                # Exclusive create: another worker may be filling the same key
+                os.close(os.open(part_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+            except FileExistsError:
+                return None
+            self._filling.add(key)
+        return part_path
+
+    def commit(self, key, expected_size=None):
+        """Publishes a finished fill; a truncated one (size mismatch) is discarded."""
+        part_path = self.path(key) + ".part"
+        try:
+            size = os.path.getsize(part_path)
+            if expected_size is not None and size != expected_size:
+                os.remove(part_path)
+                return False
+            os.replace(part_path, self.path(key))
+            with self._lock:
+                self._entries[key] = size
+                self._entries.move_to_end(key)
+                self._evict()
+            return True
+        finally:
+            with self._lock:
+                self._filling.discard(key)
+
+    def abort(self, key):
+        try:
+            os.remove(self.path(key) + ".part")
+        except OSError:
+            pass
+        with self._lock:
+            self._filling.discard(key)
+
+    def _evict(self):
+        total = sum(self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            try:
+                # Anyone still streaming it keeps their open handle
+                os.remove(self.path(key))
+            except OSError:
+                pass
+            total -= size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": sum(self._entries.values()),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+async def _stream_through(upstream, part_path):
+    """Yields the upstream body chunk by chunk, also writing it to part_path when given."""
+    f = open(part_path, "wb") if part_path else None
+    buffer = bytearray()
+    try:
+        async for chunk in upstream.aiter_content():
+            if f is not None:
+                buffer += chunk
+                if len(buffer) >= WRITE_CHUNK:
+                    await asyncio.to_thread(f.write, bytes(buffer))
+                    buffer.clear()
+            yield chunk
+        if f is not None and buffer:
+            await asyncio.to_thread(f.write, bytes(buffer))
+    finally:
+        await upstream.aclose()
+        if f is not None:
+            f.close()
+
+
+def _expected_size(upstream):
+    length = upstream.headers.get("Content-Length")
+    return int(length) if upstream.status_code == 200 and length and length.isdigit() else None
+
+
+async def _fill(cache, key, url, part_path):
+    try:
+        upstream = await get_async_session().get(url, stream=True)
+        if upstream.status_code != 200:
+            await upstream.aclose()
+            cache.abort(key)
+            return
+        async for _ in _stream_through(upstream, part_path):
+            pass
+    except BaseException:
+        cache.abort(key)
+        raise
+    await asyncio.to_thread(cache.commit, key, _expected_size(upstream))
+
+
+_background = set()
+
+
+def fill_in_background(cache, key, url):
+    """Starts caching `url` under `key` unless it is cached or already being filled."""
+    part_path = cache.begin_fill(key)
+    if part_path is None:
+        return
+    task = asyncio.ensure_future(_fill(cache, key, url, part_path))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+async def relay(cache, key, url, range_header=None, on_rejected=None):
+    """
+    Streams `url` to the client with backpressure (each chunk is read only after the previous one
+    was sent). A full-body request is written through to the cache; a ranged one is passed upstream
+    as-is and the full file is cached in the background for the next caller.
+    Returns a StreamingResponse, or None if the upstream request failed (error status or network error).
+    `await on_rejected()` is called when the CDN refuses the URL itself (expired or revoked signature).
+    """
+    headers = {"Range": range_header} if range_header else {}
+    try:
+        upstream = await get_async_session().get(url, headers=headers, stream=True)
+    except RequestException as e:
+        print(f"Media relay: upstream request failed: {e}")
+        return None
+    if upstream.status_code >= 400:
+        await upstream.aclose()
+        if on_rejected is not None and upstream.status_code in REJECTED_URL_STATUSES:
+            await on_rejected()
+        return None
+
+    if range_header:
+        fill_in_background(cache, key, url)
+
+    async def body():
+        # Claimed only once the body is actually streamed, so a response that's never sent can't leave a fill behind
+        part_path = cache.begin_fill(key) if upstream.status_code == 200 and not range_header else None
+        complete = False
+        try:
+            async for chunk in _stream_through(upstream, part_path):
+                yield chunk
+            complete = True
+        except RequestException as e:
+            # Too late for an error status: the client sees the body end short of Content-Length
+            print(f"Media relay: upstream failed mid-stream: {e}")
+        finally:
+            if part_path is not None:
+                if complete:
+                    await asyncio.to_thread(cache.commit, key, _expected_size(upstream))
+                else:
+                    # Client went away (or upstream failed) mid-file: the next full request fills it instead
+                    cache.abort(key)
+
+    response_headers = {name: upstream.headers[name] for name in RELAYED_HEADERS if upstream.headers.get(name)}
+    response_headers["Accept-Ranges"] = "bytes"
+    return StreamingResponse(body(), status_code=upstream.status_code, headers=response_headers,
+                             media_type=upstream.headers.get("Content-Type") or "video/mp4")
+
+
+media_cache = MediaCache()
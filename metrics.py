@@ -0,0 +1,179 @@
+"""
+Minimal Prometheus-style metrics and timing spans, with no third-party dependency.
+
+Counters and histograms are process-wide and thread-safe; render() produces the text
+exposition format served at /metrics. span() times a block, records it in the
+`span_seconds` histogram tagged by name and course, and hands it to any hooks
+registered with add_span_hook() (e.g. main.py --trace prints every span).
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds: from a fast API call to a long video transfer
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+# Bytes/sec: 100 KB/s .. 1 GB/s
+THROUGHPUT_BUCKETS = tuple(float(1024 * 100 * 4 ** i) for i in range(8))
+PAGE_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+_metrics = []
+_collectors = []
+_span_hooks = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # key -> [bucket counts..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, state):
+                    le = _format_labels(self.labels, key, [("le", _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{le} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(state[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {state[-1]}")
+        return lines
+
+
+def register_collector(collect):
+    """
+    Registers a callable run at scrape time that returns gauge samples as a list of
+    (name, help, {label: value}, value) tuples, for values owned by other modules.
+    """
+    _collectors.append(collect)
+
+
+def add_span_hook(hook):
+    """hook(name, tags, seconds) is called after every span completes."""
+    _span_hooks.append(hook)
+
+
+def render():
+    """Returns every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+
+    gauges = {}
+    for collect in _collectors:
+        for name, help_text, labels, value in collect():
+            gauges.setdefault((name, help_text), []).append((labels, value))
+    for (name, help_text), samples in gauges.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+span_seconds = Histogram("span_seconds", "Duration of timed spans, by span name and course.", ("span", "course"))
+
+
+@contextmanager
+def span(name, course=None, **tags):
+    """Times the enclosed block as a span tagged with its course (and any extra tags for hooks)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        span_seconds.observe(seconds, span=name, course=course if course is not None else "")
+        for hook in _span_hooks:
+            hook(name, {"course": course, **tags}, seconds)
+
+
+# Upstream Udemy API
+udemy_request_seconds = Histogram(
+    "udemy_request_seconds", "Latency of Udemy API requests, by client method and HTTP status.", ("method", "status")
+)
+udemy_retries_total = Counter("udemy_retries_total", "Udemy API requests retried after a 429, 5xx or network error.", ("method",))
+udemy_pages_per_call = Histogram(
+    "udemy_pages_per_call", "Listing pages fetched per paginated Udemy API call.", ("method",), PAGE_BUCKETS
+)
+
+# Transfers
+download_bytes_total = Counter("download_bytes_total", "Bytes downloaded in-process (yt-dlp transfers aren't counted).")
+download_ttfb_seconds = Histogram(
+    "download_ttfb_seconds", "Time from starting a download to its first response byte.", ("method",)
+)
+download_throughput = Histogram(
+    "download_throughput_bytes_per_second", "Average throughput of each completed download.", ("method",),
+    THROUGHPUT_BUCKETS
+)
+download_seconds = Histogram(
+    "download_seconds", "Wall time of each download, by method and outcome.", ("method", "outcome")
+)
+postprocess_seconds = Histogram(
+    "postprocess_seconds", "Duration of the branding pass, by method.", ("method",)
+)
+
+
+def observe_request(method, status, started):
+    udemy_request_seconds.observe(time.perf_counter() - started, method=method, status=status)
+
+
+def observe_download(method, size, started, outcome="ok"):
+    seconds = time.perf_counter() - started
+    download_seconds.observe(seconds, method=method, outcome=outcome)
+    if outcome == "ok" and size and seconds > 0:
+        download_throughput.observe(size / seconds, method=method)
@@ -0,0 +1,182 @@
+"""
+Compact typed views of Udemy curriculum and asset payloads.
+
+Items are parsed once into small __slots__ objects that keep only the fields the downloader
+and API actually use, instead of passing every requested `fields[...]` entry around as nested
+dicts. Stream selection lives here (Asset.select_video) so every caller picks videos the same way.
+"""
+try:
+    import orjson
+
+    def loads(data):
+        """Parses a JSON document (bytes or str), using orjson when it's installed."""
+        return orjson.loads(data)
+
+    def dumps(value):
+        """Serializes to compact UTF-8 JSON bytes, using orjson when it's installed."""
+        return orjson.dumps(value)
+except ImportError:
+    import json
+
+    def loads(data):
+        """Parses a JSON document (bytes or str), using orjson when it's installed."""
+        return json.loads(data)
+
+    def dumps(value):
+        """Serializes to compact UTF-8 JSON bytes, using orjson when it's installed."""
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class Stream:
+    __slots__ = ("label", "url")
+
+    def __init__(self, label, url):
+        self.label = label
+        self.url = url
+
+    @property
+    def height(self):
+        try:
+            return int(self.label)
+        except (TypeError, ValueError):
+            return 0
+
+    def to_dict(self):
+        return {"url": self.url, "quality": self.label}
+
+
+def _streams(group):
+    return [Stream(s.get("label"), s.get("file")) for s in (group or {}).get("Video") or [] if s.get("file")]
+
+
+class Asset:
+    """A lecture's asset: its type and, once resolved, its video streams (highest first)."""
+    __slots__ = ("id", "asset_type", "title", "filename", "is_external", "is_drm", "streams", "downloads")
+
+    def __init__(self, id=None, asset_type=None, title=None, filename=None, is_external=False,
+                 is_drm=False, streams=(), downloads=()):
+        self.id = id
+        self.asset_type = asset_type
+        self.title = title
+        self.filename = filename
+        self.is_external = is_external
+        self.is_drm = is_drm
+        self.streams = sorted(streams, key=lambda stream: stream.height, reverse=True)
+        self.downloads = list(downloads)
+
+    @classmethod
+    def from_json(cls, data):
+        data = data or {}
+        return cls(
+            id=data.get("id"),
+            asset_type=data.get("asset_type"),
+            title=data.get("title"),
+            filename=data.get("filename"),
+            is_external=bool(data.get("is_external")),
+            is_drm=bool(data.get("course_is_drmed") or data.get("media_license_token")),
+            streams=_streams(data.get("stream_urls")),
+            downloads=_streams(data.get("download_urls"))
+        )
+
+    @property
+    def is_video(self):
+        return (self.asset_type or "Video") == "Video"
+
+    @property
+    def qualities(self):
+        return [str(stream.label) for stream in self.streams if stream.label]
+
+    def select_video(self, quality=None):
+        """
+        Picks the video stream to use.
+        'quality' may be an exact label ('720', falls back to the highest), '<=720' for the best
+        stream not above that height, 'lowest', or empty for the highest available.
+        Falls back to the first direct download when there are no streams. Returns a Stream or None.
+        """
+        if not self.streams:
+            return self.downloads[0] if self.downloads else None
+
+        if quality == "lowest":
+            return self.streams[-1]
+        if quality and quality.startswith("<="):
+            ceiling = int(quality[2:]) if quality[2:].isdigit() else 0
+            fitting = [stream for stream in self.streams if stream.height <= ceiling]
+            return fitting[0] if fitting else self.streams[-1]
+        if quality:
+            for stream in self.streams:
+                if str(stream.label) == quality:
+                    return stream
+        return self.streams[0]
+
+
+class Attachment:
+    __slots__ = ("id", "title", "filename", "is_external")
+
+    def __init__(self, id, title=None, filename=None, is_external=False):
+        self.id = id
+        self.title = title
+        self.filename = filename
+        self.is_external = is_external
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data.get("id"), data.get("title"), data.get("filename"), bool(data.get("is_external")))
+
+
+class Chapter:
+    __slots__ = ("id", "title", "object_index")
+
+    def __init__(self, id, title, object_index=None):
+        self.id = id
+        self.title = title
+        self.object_index = object_index
+
+
+class Lecture:
+    __slots__ = ("id", "title", "object_index", "asset", "attachments")
+
+    def __init__(self, id, title, object_index=None, asset=None, attachments=()):
+        self.id = id
+        self.title = title
+        self.object_index = object_index
+        self.asset = asset or Asset()
+        self.attachments = list(attachments)
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            data.get("id"),
+            data.get("title"),
+            data.get("object_index"),
+            Asset.from_json(data.get("asset")),
+            [Attachment.from_json(supp) for supp in data.get("supplementary_assets") or []]
+        )
+
+
+class Course:
+    __slots__ = ("id", "title", "url")
+
+    def __init__(self, id, title, url=None):
+        self.id = id
+        self.title = title
+        self.url = url
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data.get("id"), data.get("title"), data.get("url"))
+
+
+def curriculum_item(data):
+    """Parses one raw curriculum entry into a Chapter or Lecture; quizzes and practice tests give None."""
+    item_type = data.get("_class")
+    if item_type == "chapter":
+        return Chapter(data.get("id"), data.get("title"), data.get("object_index"))
+    if item_type == "lecture":
+        return Lecture.from_json(data)
+    return None
+
+
+def attachment_url(supp_payload):
+    """Extracts the direct file URL from a supplementary asset payload (it's usually under 'File')."""
+    files = (supp_payload.get("download_urls") or {}).get("File") or []
+    return files[0].get("file") if files else None
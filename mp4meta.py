@@ -0,0 +1,250 @@
+"""
+In-place MP4 branding.
+
+Adds title/description/comment tags and a short tx3g soft-subtitle track by editing only the
+container boxes. The rebuilt `moov` (plus a tiny `mdat` holding the subtitle sample) is appended
+to the end of the file and the old `moov` is turned into a `free` box, so the media payload is
+never moved and every existing chunk offset stays valid. Re-branding writes the new `moov` into a
+`free` box left by an earlier run when it fits, and leaves the file alone if nothing changed.
+"""
+import os
+import struct
+
+SUBTITLE_HANDLER_NAME = b"Udemy Saver subtitles"
+
+_IDENTITY_MATRIX = struct.pack(">9I", 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+
+
+class NotSupported(Exception):
+    """The file can't be branded in place (not an MP4, fragmented, or an unexpected layout)."""
+
+
+def _box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def _full_box(box_type, version, flags, payload):
+    return _box(box_type, struct.pack(">I", (version << 24) | flags) + payload)
+
+
+def _iter_boxes(data, start=0, end=None):
+    """Yields (type, offset, size, header_size) for the boxes laid out in data[start:end]."""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            # "Extends to the end": anything written after it would become part of it
+            raise NotSupported(f"Open-ended box {box_type!r} at {offset}")
+        if size < header or offset + size > end:
+            raise NotSupported(f"Corrupt box {box_type!r} at {offset}")
+        yield box_type, offset, size, header
+        offset += size
+
+
+def _top_level_boxes(f, file_size):
+    boxes = []
+    offset = 0
+    while offset + 8 <= file_size:
+        f.seek(offset)
+        size, box_type = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            raise NotSupported(f"Open-ended top-level box {box_type!r} at {offset}")
+        if size < header or offset + size > file_size:
+            raise NotSupported(f"Corrupt top-level box {box_type!r} at {offset}")
+        boxes.append((box_type, offset, size, header))
+        offset += size
+    return boxes
+
+
+def _free_slot(boxes, size, file_size):
+    """
+    Returns (offset, size) of a `free` box a `size`-byte moov can be written over: one it fills
+    exactly, one with room left for a trailing `free` header, or the last box in the file.
+    Returns (file_size, 0) when there's none and the moov has to be appended.
+    """
+    for box_type, offset, box_size, header in boxes:
+        if box_type == b"free" and header == 8 and (
+            box_size == size or box_size >= size + 8 or offset + box_size == file_size
+        ):
+            return offset, box_size
+    return file_size, 0
+
+
+def _ilst_item(box_type, text):
+    # 'data' atom: type 1 = UTF-8, locale 0
+    return _box(box_type, _box(b"data", struct.pack(">II", 1, 0) + text.encode("utf-8")))
+
+
+def _build_udta(old_udta, title, description, comment):
+    """Rebuilds moov/udta with a fresh iTunes-style meta/ilst, keeping any other udta children."""
+    kept = b""
+    if old_udta is not None:
+        for box_type, offset, size, header in _iter_boxes(old_udta, 8):
+            if box_type != b"meta":
+                kept += old_udta[offset:offset + size]
+
+    handler = _full_box(b"hdlr", 0, 0, struct.pack(">I4s", 0, b"mdir") + b"appl" + b"\0" * 8 + b"\0")
+    items = b""
+    if title:
+        items += _ilst_item(b"\xa9nam", title)
+    if description:
+        items += _ilst_item(b"desc", description)
+    if comment:
+        items += _ilst_item(b"\xa9cmt", comment)
+    meta = _full_box(b"meta", 0, 0, handler + _box(b"ilst", items))
+    return _box(b"udta", kept + meta)
+
+
+def _parse_mvhd(mvhd):
+    """Returns (timescale, duration) from an mvhd box."""
+    version = mvhd[8]
+    if version == 1:
+        return struct.unpack_from(">IQ", mvhd, 8 + 4 + 16)
+    return struct.unpack_from(">II", mvhd, 8 + 4 + 8)
+
+
+def _rebuild_mvhd(mvhd, duration, next_track_id):
+    mvhd = bytearray(mvhd)
+    version = mvhd[8]
+    if version == 1:
+        struct.pack_into(">Q", mvhd, 8 + 4 + 16 + 4, duration)
+    else:
+        struct.pack_into(">I", mvhd, 8 + 4 + 8 + 4, min(duration, 0xFFFFFFFF))
+    struct.pack_into(">I", mvhd, len(mvhd) - 4, next_track_id)
+    return bytes(mvhd)
+
+
+def _subtitle_trak(track_id, movie_timescale, sample_durations, sample_sizes, chunk_offset):
+    """Builds a tx3g text track whose samples sit back to back in a single chunk."""
+    duration_ms = sum(sample_durations)
+    movie_duration = duration_ms * movie_timescale // 1000
+
+    tkhd = _full_box(b"tkhd", 0, 0x3, struct.pack(
+        ">IIIII8xhhhH", 0, 0, track_id, 0, movie_duration, 0, 0, 0, 0
+    ) + _IDENTITY_MATRIX + struct.pack(">II", 0, 0))
+
+    language = ((ord("u") - 0x60) << 10) | ((ord("n") - 0x60) << 5) | (ord("d") - 0x60)
+    mdhd = _full_box(b"mdhd", 0, 0, struct.pack(">IIIIHH", 0, 0, 1000, duration_ms, language, 0))
+    hdlr = _full_box(b"hdlr", 0, 0, struct.pack(">I4s", 0, b"sbtl") + b"\0" * 12 + SUBTITLE_HANDLER_NAME + b"\0")
+
+    font_table = _box(b"ftab", struct.pack(">HHB", 1, 1, 5) + b"Serif")
+    tx3g = _box(b"tx3g", b"\0" * 6 + struct.pack(
+        ">HIbb4B4hHHHBB4B",
+        1,                      # data_reference_index
+        0,                      # display flags
+        1, -1,                  # centred, bottom
+        0, 0, 0, 0,             # background rgba
+        0, 0, 0, 0,             # default text box
+        0, 0, 1, 0, 18,         # style: chars 0-0, font 1, plain, 18pt
+        255, 255, 255, 255      # text rgba
+    ) + font_table)
+
+    if chunk_offset > 0xFFFFFFFF:
+        chunk_offsets = _full_box(b"co64", 0, 0, struct.pack(">IQ", 1, chunk_offset))
+    else:
+        chunk_offsets = _full_box(b"stco", 0, 0, struct.pack(">II", 1, chunk_offset))
+
+    count = len(sample_durations)
+
+    stbl = _box(b"stbl",
+        _full_box(b"stsd", 0, 0, struct.pack(">I", 1) + tx3g) +
+        _full_box(b"stts", 0, 0, struct.pack(">I", count) + b"".join(struct.pack(">II", 1, d) for d in sample_durations)) +
+        _full_box(b"stsc", 0, 0, struct.pack(">IIII", 1, 1, count, 1)) +
+        _full_box(b"stsz", 0, 0, struct.pack(">II", 0, count) + b"".join(struct.pack(">I", n) for n in sample_sizes)) +
+        chunk_offsets
+    )
+    dinf = _box(b"dinf", _full_box(b"dref", 0, 0, struct.pack(">I", 1) + _full_box(b"url ", 0, 1, b"")))
+    minf = _box(b"minf", _full_box(b"nmhd", 0, 0, b"") + dinf + stbl)
+    return _box(b"trak", tkhd + _box(b"mdia", mdhd + hdlr + minf))
+
+
+def brand_in_place(path, title=None, description=None, comment=None, subtitle=None, subtitle_seconds=15):
+    """
+    Tags an MP4 and adds a soft subtitle shown for the first `subtitle_seconds`, without
+    rewriting the media data. Raises NotSupported when the file can't be edited this way.
+    Running it again on a branded file only refreshes the tags, reusing the space of the
+    `moov` it retired last time, and does nothing when the tags are unchanged.
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        boxes = _top_level_boxes(f, file_size)
+        types = [box[0] for box in boxes]
+        if b"moof" in types:
+            raise NotSupported("Fragmented MP4")
+        if types.count(b"moov") != 1 or b"mdat" not in types:
+            raise NotSupported("No single moov/mdat pair")
+
+        _, moov_offset, moov_size, moov_header = boxes[types.index(b"moov")]
+        f.seek(moov_offset)
+        moov = f.read(moov_size)
+
+        children = list(_iter_boxes(moov, moov_header))
+        mvhd = udta = None
+        body = b""
+        for box_type, offset, size, header in children:
+            box = moov[offset:offset + size]
+            if box_type == b"mvhd":
+                mvhd = box
+            elif box_type == b"udta":
+                udta = box
+            else:
+                body += box
+        if mvhd is None:
+            raise NotSupported("moov has no mvhd")
+
+        timescale, duration = _parse_mvhd(mvhd)
+        next_track_id = struct.unpack_from(">I", mvhd, len(mvhd) - 4)[0]
+
+        # Everything new goes after the current end of file
+        appended = b""
+        write_at = file_size
+        if subtitle and SUBTITLE_HANDLER_NAME not in moov:
+            text = subtitle.encode("utf-8")
+            samples = [struct.pack(">H", len(text)) + text]
+            durations = [subtitle_seconds * 1000]
+            # An empty sample clears the text for the rest of the video
+            remaining_ms = duration * 1000 // timescale - durations[0]
+            if remaining_ms > 0:
+                samples.append(struct.pack(">H", 0))
+                durations.append(remaining_ms)
+
+            appended = _box(b"mdat", b"".join(samples))
+            body += _subtitle_trak(next_track_id, timescale, durations, [len(s) for s in samples], write_at + 8)
+            duration = max(duration, sum(durations) * timescale // 1000)
+            next_track_id += 1
+
+        new_moov = _box(b"moov",
+            _rebuild_mvhd(mvhd, duration, next_track_id) + body + _build_udta(udta, title, description, comment)
+        )
+
+        if not appended:
+            if new_moov == moov:
+                return
+            write_at, slot_size = _free_slot(boxes, len(new_moov), file_size)
+        else:
+            slot_size = 0
+
+        f.seek(write_at)
+        f.write(appended + new_moov)
+        end = f.tell()
+        slot_end = write_at + slot_size
+        if end < slot_end:
+            if slot_end == file_size:
+                f.truncate(end)
+            else:
+                f.write(struct.pack(">I4s", slot_end - end, b"free"))
+        f.flush()
+        os.fsync(f.fileno())
+
+        # Only retire the old moov once the new one is safely on disk
+        f.seek(moov_offset + 4)
+        f.write(b"free")
@@ -0,0 +1,183 @@
+"""
+Download size planning.
+
+Before a bulk mirror, SizePlanner resolves every lecture of a course, probes the size of each
+candidate video stream and attachment (HEAD, falling back to a one-byte Range GET), and totals
+the bytes per quality tier. HLS playlists can't be sized without fetching every segment, so they
+are estimated from the variant's declared BANDWIDTH times the playlist duration.
+"""
+import http.cookiejar
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+from downloader import parse_hls_master, pick_hls_variant
+from models import Asset, Lecture, attachment_url
+
+PLAN_WORKERS = int(os.environ.get("PLAN_WORKERS", "16"))
+
+_EXTINF_RE = re.compile(r"#EXTINF:([\d.]+)")
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Returns the process-wide probe session, so every plan shares one connection pool.
+    Probes hit signed CDN URLs and the session never keeps cookies, so nothing leaks between users.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+            adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=max(PLAN_WORKERS, 16))
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def probe_size(session, url):
+    """Returns the byte size of `url` without downloading it, or None if the server won't say."""
+    try:
+        r = session.head(url, allow_redirects=True, timeout=15)
+        if r.ok and r.headers.get("Content-Length") and "mpegurl" not in r.headers.get("Content-Type", "").lower():
+            return int(r.headers["Content-Length"])
+
+        # Some CDNs reject HEAD or omit the length on it: ask for a single byte instead
+        with session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=15) as r:
+            if r.status_code == 206:
+                total = r.headers.get("Content-Range", "").rpartition("/")[2]
+                return int(total) if total.isdigit() else None
+            if r.ok and r.headers.get("Content-Length"):
+                return int(r.headers["Content-Length"])
+    except (requests.exceptions.RequestException, ValueError):
+        pass
+    return None
+
+
+def estimate_hls_size(session, url, quality=None):
+    """Estimates an HLS rendition's size as its BANDWIDTH (bits/s) times the media playlist's duration."""
+    try:
+        r = session.get(url, timeout=15)
+        r.raise_for_status()
+        playlist = r.text
+        bandwidth = None
+        if "#EXT-X-STREAM-INF" in playlist:
+            variant = pick_hls_variant(parse_hls_master(playlist, url), quality)
+            if variant is None:
+                return None
+            bandwidth = variant.get("bandwidth")
+            r = session.get(variant["uri"], timeout=15)
+            r.raise_for_status()
+            playlist = r.text
+        duration = sum(float(seconds) for seconds in _EXTINF_RE.findall(playlist))
+        if not bandwidth or not duration:
+            return None
+        return int(bandwidth * duration / 8)
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+
+
+def _is_playlist(url):
+    return urlparse(url).path.endswith(".m3u8")
+
+
+def _tier_sort_key(label):
+    return int(label) if str(label).isdigit() else 0
+
+
+class SizePlanner:
+    """Sizes a course per quality tier and picks the best tier that fits a byte budget."""
+    def __init__(self, api, workers=PLAN_WORKERS):
+        self.api = api
+        self.workers = workers
+        self.session = get_session()
+
+    def _size(self, stream):
+        if _is_playlist(stream.url):
+            return estimate_hls_size(self.session, stream.url, stream.label), True
+        return probe_size(self.session, stream.url), False
+
+    def _plan_lecture(self, course_id, lecture):
+        """Returns (Asset or None, {stream url: (size, estimated)}, attachment bytes, unknown attachments)."""
+        asset = None
+        sizes = {}
+        if lecture.asset.is_video:
+            asset_info = self.api.get_lecture_asset(course_id, lecture.id)
+            if asset_info and "error" not in asset_info:
+                asset = Asset.from_json(asset_info.get("asset"))
+                if asset.is_drm:
+                    asset = None
+                else:
+                    for stream in asset.streams or asset.downloads:
+                        sizes[stream.url] = self._size(stream)
+
+        attachment_bytes = 0
+        unknown_attachments = 0
+        for supp in lecture.attachments:
+            if not supp.id or supp.is_external:
+                continue
+            supp_info = self.api.get_supplementary_asset(course_id, lecture.id, supp.id)
+            file_url = attachment_url(supp_info) if supp_info and "error" not in supp_info else None
+            size = probe_size(self.session, file_url) if file_url else None
+            if size is None:
+                unknown_attachments += 1
+            else:
+                attachment_bytes += size
+        return asset, sizes, attachment_bytes, unknown_attachments
+
+    def plan(self, course_id, curriculum, budget_bytes=None):
+        """
+        Sizes every lecture in `curriculum` (raw items or models). For each quality tier, a lecture
+        counts at its best stream not above that tier, i.e. what `quality='<=tier'` would download.
+        Returns the per-tier totals and, when budget_bytes is given, the best tier that fits it.
+        """
+        lectures = []
+        for item in curriculum:
+            if isinstance(item, dict):
+                item = Lecture.from_json(item) if item.get("_class") == "lecture" else None
+            if isinstance(item, Lecture):
+                lectures.append(item)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(lambda lecture: self._plan_lecture(course_id, lecture), lectures))
+
+        attachment_bytes = sum(result[2] for result in results)
+        unknown_attachments = sum(result[3] for result in results)
+        assets = [result[:2] for result in results if result[0] is not None]
+
+        labels = {str(stream.label) for asset, _ in assets for stream in asset.streams if stream.label}
+        tiers = []
+        for label in sorted(labels, key=_tier_sort_key, reverse=True):
+            total = attachment_bytes
+            unknown = estimated = 0
+            for asset, sizes in assets:
+                stream = asset.select_video(f"<={label}" if label.isdigit() else label)
+                size, is_estimate = sizes.get(stream.url, (None, False)) if stream else (None, False)
+                if size is None:
+                    unknown += 1
+                    continue
+                total += size
+                estimated += is_estimate
+            tiers.append({"quality": label, "bytes": total, "unknown": unknown, "estimated": estimated})
+
+        recommended = None
+        if budget_bytes is not None:
+            recommended = next((tier["quality"] for tier in tiers if tier["bytes"] <= budget_bytes), None)
+
+        return {
+            "course_id": course_id,
+            "lectures": len(lectures),
+            "videos": len(assets),
+            "attachment_bytes": attachment_bytes,
+            "unknown_attachments": unknown_attachments,
+            "tiers": tiers,
+            "budget_bytes": budget_bytes,
+            "recommended": recommended
+        }
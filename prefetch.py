@@ -0,0 +1,183 @@
+"""
+Speculative lecture asset lookups, off by default (PREFETCH_LECTURES=0).
+
+Once a curriculum has been served, the asset lookups for its first PREFETCH_LECTURES video
+lectures are warmed into the asset cache in the background, and every lecture a user resolves
+warms the ones after it, so the click that follows finds its asset already cached.
+
+Speculation only ever uses spare capacity: each token gets PREFETCH_BUDGET upstream lookups
+per PREFETCH_WINDOW seconds, lookups are paced by the token's own rate limiter and stop as
+soon as it has less than PREFETCH_HEADROOM of its burst left (or Udemy is throttling us, or
+the circuit breaker isn't closed), and a token's warming is cancelled when it moves on to
+another course or makes no request for PREFETCH_IDLE seconds.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+import ratelimit
+from cache import token_hash
+from models import Lecture, curriculum_item
+
+PREFETCH_LECTURES = int(os.environ.get("PREFETCH_LECTURES", "0"))
+PREFETCH_BUDGET = int(os.environ.get("PREFETCH_BUDGET", "100"))
+PREFETCH_WINDOW = float(os.environ.get("PREFETCH_WINDOW", "3600"))
+PREFETCH_IDLE = float(os.environ.get("PREFETCH_IDLE", "60"))
+# Share of the rate limiter's burst kept free for requests users are actually waiting on
+PREFETCH_HEADROOM = float(os.environ.get("PREFETCH_HEADROOM", "0.5"))
+PREFETCH_CONCURRENCY = int(os.environ.get("PREFETCH_CONCURRENCY", "2"))
+
+
+def video_lecture_ids(curriculum):
+    """Ids of the video lectures in a curriculum (raw items), in order."""
+    ids = []
+    for data in curriculum:
+        item = curriculum_item(data)
+        if isinstance(item, Lecture) and item.asset.is_video:
+            ids.append(item.id)
+    return ids
+
+
+class _TokenState:
+    __slots__ = ("active_at", "window_started", "used", "task")
+
+    def __init__(self):
+        self.active_at = time.monotonic()
+        self.window_started = self.active_at
+        self.used = 0
+        self.task = None
+
+
+class Prefetcher:
+    """
+    Warms `fetch(api, course_id, lecture_id)` for lectures users are likely to open next;
+    `cached(api, course_id, lecture_id)` says which of them need no upstream call.
+    """
+    def __init__(self, fetch, cached, lectures=PREFETCH_LECTURES, budget=PREFETCH_BUDGET, window=PREFETCH_WINDOW,
+                 idle=PREFETCH_IDLE, headroom=PREFETCH_HEADROOM, concurrency=PREFETCH_CONCURRENCY,
+                 max_courses=1024, max_tokens=4096):
+        self.fetch = fetch
+        self.cached = cached
+        self.lectures = lectures
+        self.budget = budget
+        self.window = window
+        self.idle = idle
+        self.headroom = headroom
+        self.concurrency = concurrency
+        self.max_courses = max_courses
+        self.max_tokens = max_tokens
+        self._courses = OrderedDict()  # (token hash, course id) -> video lecture ids in order
+        self._tokens = OrderedDict()  # token hash -> _TokenState
+        self.scheduled = 0
+        self.fetched = 0
+        self.already_cached = 0
+        self.over_budget = 0
+        self.yielded = 0
+        self.cancelled = 0
+
+    @property
+    def enabled(self):
+        return self.lectures > 0
+
+    def _state(self, token):
+        state = self._tokens.get(token)
+        if state is None:
+            state = self._tokens[token] = _TokenState()
+            while len(self._tokens) > self.max_tokens:
+                _, evicted = self._tokens.popitem(last=False)
+                if evicted.task is not None:
+                    evicted.task.cancel()
+        self._tokens.move_to_end(token)
+        return state
+
+    def touch(self, access_token):
+        """Marks the token as active; api.py calls it on every request that carries one."""
+        state = self._tokens.get(token_hash(access_token)) if self.enabled else None
+        if state is not None:
+            state.active_at = time.monotonic()
+
+    def curriculum_served(self, api, course_id, curriculum):
+        """A curriculum (raw items) was sent to the client: warm its first lectures."""
+        if not self.enabled:
+            return
+        token = token_hash(api.access_token)
+        ids = video_lecture_ids(curriculum)
+        self._courses[(token, course_id)] = ids
+        self._courses.move_to_end((token, course_id))
+        while len(self._courses) > self.max_courses:
+            self._courses.popitem(last=False)
+        self._schedule(api, token, course_id, ids[:self.lectures])
+
+    def lecture_resolved(self, api, course_id, lecture_id):
+        """A lecture was resolved: warm the ones after it."""
+        if not self.enabled:
+            return
+        token = token_hash(api.access_token)
+        self._state(token).active_at = time.monotonic()
+        ids = self._courses.get((token, course_id))
+        if not ids or lecture_id not in ids:
+            return
+        start = ids.index(lecture_id) + 1
+        self._schedule(api, token, course_id, ids[start:start + self.lectures])
+
+    def _schedule(self, api, token, course_id, lecture_ids):
+        state = self._state(token)
+        # The user's focus moved: whatever was being warmed before is no longer the best guess
+        if state.task is not None and not state.task.done():
+            state.task.cancel()
+            self.cancelled += 1
+        if not lecture_ids:
+            return
+        self.scheduled += len(lecture_ids)
+        state.task = asyncio.ensure_future(self._warm(api, state, course_id, list(lecture_ids)))
+        state.task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def _charge(self, state):
+        now = time.monotonic()
+        if now - state.window_started >= self.window:
+            state.window_started = now
+            state.used = 0
+        if state.used >= self.budget:
+            return False
+        state.used += 1
+        return True
+
+    def _spare_capacity(self, api):
+        if ratelimit.breaker.state != "closed":
+            return False
+        bucket = ratelimit.limiter.for_token(api.access_token)
+        return bucket is None or (bucket.rate >= bucket.max_rate and
+                                  bucket.headroom() >= bucket.capacity * self.headroom + 1)
+
+    async def _warm(self, api, state, course_id, lecture_ids):
+        pending = iter(lecture_ids)
+
+        async def worker():
+            for lecture_id in pending:
+                if time.monotonic() - state.active_at > self.idle:
+                    return
+                if self.cached(api, course_id, lecture_id):
+                    self.already_cached += 1
+                    continue
+                if not self._spare_capacity(api):
+                    self.yielded += 1
+                    return
+                if not self._charge(state):
+                    self.over_budget += 1
+                    return
+                await self.fetch(api, course_id, lecture_id)
+                self.fetched += 1
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "scheduled": self.scheduled,
+            "fetched": self.fetched,
+            "already_cached": self.already_cached,
+            "over_budget": self.over_budget,
+            "yielded": self.yielded,
+            "cancelled": self.cancelled
+        }
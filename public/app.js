@@ -22,6 +22,7 @@ const DOM = {
   backBtn: document.getElementById("back-btn"),
   detailTitle: document.getElementById("detail-course-title"),
   currContainer: document.getElementById("curriculum-container"),
+  resolveAllBtn: document.getElementById("resolve-all-btn"),
 
   helpLink: document.getElementById("help-link"),
   helpModal: document.getElementById("help-modal"),
@@ -74,6 +75,7 @@ function init() {
   DOM.logoutBtn.addEventListener("click", handleLogout);
   DOM.backBtn.addEventListener("click", () => switchView(DOM.dashView));
   DOM.searchInput.addEventListener("input", handleSearch);
+  DOM.resolveAllBtn.addEventListener("click", resolveAllLinks);
 
   // Help Modal Bindings
   if (DOM.helpLink && DOM.helpModal && DOM.closeHelpBtn) {
@@ -250,6 +252,8 @@ function handleSearch(e) {
 // --- Curriculum Flow ---
 async function loadCurriculum(course) {
   state.currentCourse = course;
+  DOM.resolveAllBtn.disabled = false;
+  DOM.resolveAllBtn.innerHTML = "⚡ Resolve all links";
   DOM.detailTitle.textContent = course.title;
   switchView(DOM.detailView);
 
@@ -304,6 +308,7 @@ function renderCurriculum(items) {
     ) {
       const li = document.createElement("li");
       li.className = "lecture-item";
+      li.dataset.lectureId = item.id;
 
       const type = item.asset
         ? item.asset.asset_type
@@ -352,6 +357,84 @@ function renderCurriculum(items) {
   });
 }
 
+// --- Batch Resolve ---
+// Streams /api/resolve-course (NDJSON) and swaps each lecture's buttons for direct links as they arrive.
+async function resolveAllLinks() {
+  const course = state.currentCourse;
+  if (!course) return;
+
+  const btn = DOM.resolveAllBtn;
+  const originalText = btn.innerHTML;
+  btn.disabled = true;
+  btn.innerHTML = "⏳ Resolving...";
+
+  try {
+    const res = await fetch(`/api/resolve-course/${course.id}`, {
+      headers: { Authorization: state.token },
+    });
+    if (!res.ok) {
+      const data = await res.json();
+      throw new Error(data.detail || "API Error");
+    }
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let resolved = 0;
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let newline;
+      while ((newline = buffer.indexOf("\n")) >= 0) {
+        const line = buffer.slice(0, newline).trim();
+        buffer = buffer.slice(newline + 1);
+        if (!line) continue;
+
+        const result = JSON.parse(line);
+        if (result.lecture_id) {
+          applyResolvedLecture(result);
+          resolved++;
+          btn.innerHTML = `⏳ Resolved ${resolved}...`;
+        }
+      }
+    }
+    btn.innerHTML = `✅ ${resolved} lectures resolved`;
+  } catch (err) {
+    alert(err.message);
+    btn.innerHTML = originalText;
+    btn.disabled = false;
+  }
+}
+
+function applyResolvedLecture(result) {
+  const li = DOM.currContainer.querySelector(
+    `li[data-lecture-id="${result.lecture_id}"]`,
+  );
+  if (!li) return;
+  const actions = li.querySelector(".lecture-actions");
+
+  let html = "";
+  if (result.status === "success" && result.url) {
+    const label = result.quality ? `${result.quality}p` : "Video";
+    html += `<a class="dl-btn" href="${result.url}" target="_blank" rel="noopener">⬇️ ${label}</a>`;
+  } else if (result.status === "drm_locked") {
+    html += `<span class="badge-locked">🔒 DRM Protected</span>`;
+  } else if (result.status !== "no_video") {
+    html += `<span class="badge-locked">Unavailable</span>`;
+  }
+
+  (result.attachments || []).forEach((att) => {
+    if (att.url) {
+      html += `<a class="dl-btn badge-attachment" href="${att.url}" target="_blank" rel="noopener">📎 ${att.filename || "Asset"}</a>`;
+    }
+  });
+
+  if (html) actions.innerHTML = html;
+}
+
 // Global Download Functions
 window.loadQualities = async function (courseId, lectureId, selectElement) {
   if (selectElement.dataset.loaded) return;
@@ -0,0 +1,208 @@
+"""
+Client-side pacing and retry policy for Udemy API requests.
+
+Every access token gets its own adaptive token bucket: it starts at UDEMY_RATE requests/sec,
+halves whenever Udemy answers 429 (pausing for Retry-After), and creeps back up with each
+success. Transient failures (network errors, 5xx, 429) are retried with exponential backoff
+and full jitter, and a process-wide circuit breaker stops sending anything for a while once
+Udemy keeps failing, so a degraded upstream isn't hammered by every worker at once.
+"""
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+import metrics
+
+# Steady request rate per token (req/s, 0 disables pacing) and how far it may burst
+RATE = float(os.environ.get("UDEMY_RATE", "10"))
+BURST = float(os.environ.get("UDEMY_BURST", "20"))
+# Floor the adaptive rate never drops below after repeated 429s
+MIN_RATE = float(os.environ.get("UDEMY_MIN_RATE", "0.5"))
+MAX_RETRIES = int(os.environ.get("UDEMY_MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.environ.get("UDEMY_BACKOFF_BASE", "0.5"))
+# Longest single wait; a Retry-After beyond it is returned to the caller instead of retried
+BACKOFF_MAX = float(os.environ.get("UDEMY_BACKOFF_MAX", "30"))
+# Consecutive failures that open the breaker, and how long it stays open
+BREAKER_THRESHOLD = int(os.environ.get("UDEMY_BREAKER_THRESHOLD", "10"))
+BREAKER_RESET = float(os.environ.get("UDEMY_BREAKER_RESET", "30"))
+
+RETRYABLE_STATUSES = (500, 502, 503, 504)
+
+
+def parse_retry_after(value):
+    """Returns the wait in seconds from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt):
+    """Exponential backoff with full jitter for the given (0-based) retry attempt."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class TokenBucket:
+    """
+    Adaptive token bucket. reserve() claims a slot and returns how long the caller must wait
+    before using it, so the same bucket paces both threads (time.sleep) and coroutines (asyncio.sleep).
+    """
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    def headroom(self):
+        """Slots that could be used right now without waiting (0 while paused), without claiming any."""
+        with self._lock:
+            now = time.monotonic()
+            if self.paused_until > now:
+                return 0.0
+            return max(0.0, min(self.capacity, self.tokens + (now - self.updated) * self.rate))
+
+    def throttled(self, retry_after=None):
+        """Udemy said 429: halve the rate, drop any saved-up burst and honour Retry-After."""
+        with self._lock:
+            self.rate = max(MIN_RATE, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def succeeded(self):
+        """Additive recovery towards the configured rate."""
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class RateLimiter:
+    """One TokenBucket per access token (keyed by a hash, never the token itself), LRU-bounded."""
+    def __init__(self, rate=RATE, burst=BURST, max_tokens=4096):
+        self.rate = rate
+        self.burst = burst
+        self.max_tokens = max_tokens
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def for_token(self, access_token):
+        if not self.rate:
+            return None
+        key = hashlib.sha256((access_token or "").encode()).hexdigest()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+                while len(self._buckets) > self.max_tokens:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(key)
+            return bucket
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive upstream failures and rejects calls for `reset_timeout`
+    seconds; then lets a single probe through (half-open) and closes again if it succeeds.
+    A probe that never reports back (cancelled, or failed outside HTTP) loses its lease after
+    another `reset_timeout`, and the next call becomes the probe.
+    """
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self.probe_started = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            now = time.monotonic()
+            if state == "half_open" and (not self._probing or now - self.probe_started >= self.reset_timeout):
+                self._probing = True
+                self.probe_started = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+def next_attempt(bucket, status, retry_after, attempt):
+    """
+    Feeds one upstream outcome into the limiter and breaker. `status` is the HTTP status, or
+    None for a network error. Returns the seconds to wait before retrying, or None when the
+    outcome should be handed back to the caller as-is.
+    """
+    wait = None
+    if status == 429:
+        # Udemy is up, just pacing us
+        breaker.record_success()
+        wait = parse_retry_after(retry_after)
+        if bucket is not None:
+            bucket.throttled(wait)
+    elif status is None or status in RETRYABLE_STATUSES:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+        if bucket is not None:
+            bucket.succeeded()
+        return None
+
+    if attempt >= MAX_RETRIES or (wait is not None and wait > BACKOFF_MAX):
+        return None
+    return max(wait or 0.0, retry_delay(attempt))
+
+
+# Shared by every UdemyAPI / AsyncUdemyAPI in the process
+limiter = RateLimiter()
+breaker = CircuitBreaker()
+
+
+def _breaker_metrics():
+    return [("udemy_circuit_open", "1 while the Udemy circuit breaker is shedding calls.", {}, int(breaker.state == "open"))]
+
+
+metrics.register_collector(_breaker_metrics)
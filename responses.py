@@ -0,0 +1,144 @@
+"""
+Pre-serialized JSON responses with strong ETags and compression.
+
+negotiated_json() serializes the payload (orjson when available), derives a strong ETag from
+the bytes, answers If-None-Match with 304, and compresses bodies above COMPRESS_MIN_SIZE with
+brotli (if installed) or gzip depending on Accept-Encoding. Given a cache_key that changes
+with the payload, the body and ETag are memoized under it, so serving (or revalidating) an
+unchanged cached listing costs a dict lookup; compressed bodies are memoized by ETag, so each
+is only compressed once per change.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from fastapi.responses import Response
+
+from models import dumps
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "5"))
+ENCODED_CACHE_ENTRIES = int(os.environ.get("ENCODED_CACHE_ENTRIES", "128"))
+SERIALIZED_CACHE_ENTRIES = int(os.environ.get("SERIALIZED_CACHE_ENTRIES", "512"))
+
+_encoded = OrderedDict()
+_encoded_lock = threading.Lock()
+_serialized = OrderedDict()  # cache_key -> (body, etag)
+
+
+class FastJSONResponse(Response):
+    """JSONResponse drop-in that serializes with orjson when it's installed."""
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
+
+
+def _accepted_encodings(accept_encoding):
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, *params = part.split(";")
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    pass
+        if quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def _choose_encoding(accept_encoding):
+    accepted = _accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def _compress(body, encoding, etag):
+    key = (etag, encoding)
+    with _encoded_lock:
+        cached = _encoded.get(key)
+        if cached is not None:
+            _encoded.move_to_end(key)
+            return cached
+
+    if encoding == "br":
+        compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+    with _encoded_lock:
+        _encoded[key] = compressed
+        while len(_encoded) > ENCODED_CACHE_ENTRIES:
+            _encoded.popitem(last=False)
+    return compressed
+
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Compressed variants carry a suffix ("<hash>-gzip"); they all validate the same payload
+    base = etag.strip('"')
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"').split("-")[0] == base:
+            return True
+    return False
+
+
+def _serialize(payload, cache_key):
+    if cache_key is not None:
+        with _encoded_lock:
+            cached = _serialized.get(cache_key)
+            if cached is not None:
+                _serialized.move_to_end(cache_key)
+                return cached
+
+    body = dumps(payload() if callable(payload) else payload)
+    serialized = (body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"')
+    if cache_key is not None:
+        with _encoded_lock:
+            _serialized[cache_key] = serialized
+            while len(_serialized) > SERIALIZED_CACHE_ENTRIES:
+                _serialized.popitem(last=False)
+    return serialized
+
+
+def negotiated_json(request, payload, status_code=200, cache_key=None):
+    """
+    Returns `payload` as JSON, honouring If-None-Match and Accept-Encoding.
+    payload may be a zero-argument callable, only called when the body isn't memoized under cache_key.
+    """
+    body, etag = _serialize(payload, cache_key)
+    headers = {"ETag": etag, "Vary": "Accept-Encoding, Authorization", "Cache-Control": "private, no-cache"}
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if len(body) >= COMPRESS_MIN_SIZE:
+        encoding = _choose_encoding(request.headers.get("accept-encoding"))
+        if encoding:
+            body = _compress(body, encoding, etag)
+            headers["Content-Encoding"] = encoding
+            # Strong validators must differ between encodings of the same payload
+            headers["ETag"] = etag[:-1] + "-" + encoding + '"'
+
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
@@ -0,0 +1,127 @@
+"""
+Content-addressed media store under the download root.
+
+Udemy bundles and re-released courses often reuse the same lecture assets. Every finished
+download is also hardlinked (or reflink-cloned) into `<root>/.store/` under its Udemy asset
+id, plus quality for videos, so the next course that contains that asset links the stored
+copy into its tree instead of downloading it again. Links are hardlinks when the filesystem
+allows, then reflinks (copy-on-write clones), then relative symlinks; on filesystems with
+none of those, files are simply downloaded per course as before.
+
+The store's index (key -> size, checksum, path) lives in the download root's manifest, and a
+stored file is only linked again if its checksum still matches.
+"""
+import os
+
+from manifest import file_checksum
+
+STORE_DIR = ".store"
+# Linux FICLONE ioctl (btrfs, XFS, bcachefs...): a copy-on-write clone of a whole file
+FICLONE = 0x40049409
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def _reflink(src, dst):
+    if fcntl is None:
+        raise OSError("reflinks are not supported on this platform")
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError:
+            target.close()
+            os.remove(dst)
+            raise
+
+
+def link_file(src, dst):
+    """
+    Makes dst refer to src's contents, replacing dst atomically if it exists.
+    Returns "hardlink", "reflink" or "symlink", or None if the filesystem supports none of them.
+    """
+    tmp = dst + ".link"
+    for method in ("hardlink", "reflink", "symlink"):
+        try:
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+            if method == "hardlink":
+                os.link(src, tmp)
+            elif method == "reflink":
+                _reflink(src, tmp)
+            else:
+                os.symlink(os.path.relpath(src, os.path.dirname(dst) or "."), tmp)
+            os.replace(tmp, dst)
+            return method
+        except OSError:
+            continue
+    return None
+
+
+class ContentStore:
+    """Deduplicates downloads across course trees; see the module docstring."""
+    def __init__(self, root, manifest):
+        self.dir = os.path.join(root, STORE_DIR)
+        self.manifest = manifest
+
+    def _path(self, kind, asset_id, quality, ext):
+        name = f"{asset_id}-{quality}" if quality else str(asset_id)
+        return os.path.join(self.dir, kind, name + ext)
+
+    def lookup(self, asset_id, quality=None):
+        """Returns the stored path for this asset, or None if it isn't stored (or is damaged)."""
+        entry = self.manifest.stored(asset_id, quality)
+        if entry is None:
+            return None
+        if not os.path.isfile(entry["path"]) or os.path.getsize(entry["path"]) != entry["size"]:
+            self.manifest.forget_stored(asset_id, quality)
+            return None
+        return entry["path"]
+
+    def link_existing(self, asset_id, quality, dest):
+        """
+        Links an already stored asset to dest. Returns the checksum if it did, or None if the
+        asset has to be downloaded (not stored, damaged, or no link method works here).
+        """
+        path = self.lookup(asset_id, quality)
+        if path is None:
+            return None
+        entry = self.manifest.stored(asset_id, quality)
+        if os.path.exists(dest) and os.path.samefile(path, dest):
+            return entry["checksum"]
+        # Edited in place through one of its links (or bit rot): don't spread it further
+        if file_checksum(path) != entry["checksum"]:
+            self.manifest.forget_stored(asset_id, quality)
+            return None
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if link_file(path, dest) is None:
+            return None
+        return entry["checksum"]
+
+    def add(self, kind, asset_id, quality, path):
+        """
+        Adds a finished download at `path` to the store (they share one copy on disk).
+        Returns the file's checksum. If a different file is already stored under this key
+        (e.g. a concurrent download branded with another title), the file is left as it is.
+        """
+        entry = self.manifest.stored(asset_id, quality)
+        if entry and os.path.exists(entry["path"]) and os.path.samefile(entry["path"], path):
+            return entry["checksum"]
+
+        checksum = file_checksum(path)
+        if entry and self.lookup(asset_id, quality):
+            if entry["checksum"] == checksum:
+                link_file(entry["path"], path)
+            return checksum
+
+        stored_path = self._path(kind, asset_id, quality, os.path.splitext(path)[1])
+        os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+        if link_file(path, stored_path) not in ("hardlink", "reflink"):
+            # A symlink into the course tree would break as soon as the course is moved or renamed
+            if os.path.lexists(stored_path):
+                os.remove(stored_path)
+            return checksum
+        self.manifest.record_stored(asset_id, quality, kind, os.path.getsize(stored_path), checksum, stored_path)
+        return checksum
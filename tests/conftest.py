@@ -0,0 +1,95 @@
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+
+import pytest
+
+# Importing api.py opens the default caches; keep test runs out of the real ones
+os.environ.setdefault("CACHE_URL", "memory://")
+os.environ.setdefault("MEDIA_CACHE_DIR", tempfile.mkdtemp(prefix="udemy_saver_test_media_"))
+os.environ.setdefault("JOBS_DIR", tempfile.mkdtemp(prefix="udemy_saver_test_jobs_"))
+
+
+class RESPServer:
+    """
+    In-process stand-in for a Redis server: GET, SET [PX ms] [NX], DEL, AUTH and SELECT over
+    RESP, with per-database keyspaces. Anything else gets an error reply.
+    """
+    def __init__(self, password=None):
+        self.password = password
+        self.data = {}
+        self.commands = []
+        self.lock = threading.Lock()
+        self.connections = []
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                server.connections.append(self.connection)
+                state = {"db": 0, "authed": server.password is None}
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    args = []
+                    for _ in range(int(line[1:])):
+                        length = int(self.rfile.readline()[1:])
+                        args.append(self.rfile.read(length + 2)[:-2])
+                    self.wfile.write(server.reply(state, args))
+
+        self.tcp = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.tcp.daemon_threads = True
+        self.port = self.tcp.server_address[1]
+        threading.Thread(target=self.tcp.serve_forever, daemon=True).start()
+
+    def reply(self, state, args):
+        command = args[0].upper()
+        with self.lock:
+            self.commands.append(command)
+            if command == b"AUTH":
+                if args[1].decode() != self.password:
+                    return b"-WRONGPASS invalid password\r\n"
+                state["authed"] = True
+                return b"+OK\r\n"
+            if not state["authed"]:
+                return b"-NOAUTH Authentication required.\r\n"
+            if command == b"SELECT":
+                state["db"] = int(args[1])
+                return b"+OK\r\n"
+            keys = self.data.setdefault(state["db"], {})
+            now = time.time()
+            for key in [key for key, (_, expires) in keys.items() if expires is not None and expires <= now]:
+                del keys[key]
+            if command == b"GET":
+                entry = keys.get(args[1])
+                return b"$-1\r\n" if entry is None else b"$%d\r\n%s\r\n" % (len(entry[0]), entry[0])
+            if command == b"SET":
+                options = [arg.upper() for arg in args[3:]]
+                expires = now + int(args[3 + options.index(b"PX") + 1]) / 1000 if b"PX" in options else None
+                if b"NX" in options and args[1] in keys:
+                    return b"$-1\r\n"
+                keys[args[1]] = (args[2], expires)
+                return b"+OK\r\n"
+            if command == b"DEL":
+                return b":%d\r\n" % (keys.pop(args[1], None) is not None)
+            return b"-ERR unknown command '%s'\r\n" % command
+
+    def close(self):
+        """Stops accepting and drops every open connection, like a server restart."""
+        for connection in self.connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.tcp.shutdown()
+        self.tcp.server_close()
+
+
+@pytest.fixture
+def resp_server():
+    server = RESPServer()
+    yield server
+    server.close()
@@ -0,0 +1,207 @@
+import asyncio
+import multiprocessing
+import os
+import stat
+import threading
+import time
+
+import pytest
+
+import cachebackends
+from cache import AssetCache
+from cachebackends import CacheBackendError, MemoryBackend, RedisBackend, SQLiteBackend, SharedTier, open_backend
+from conftest import RESPServer
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path, resp_server):
+    if request.param == "memory":
+        return MemoryBackend()
+    if request.param == "sqlite":
+        return SQLiteBackend(str(tmp_path / "cache.sqlite3"))
+    return RedisBackend(port=resp_server.port)
+
+
+def test_get_set_delete_and_ttl(backend):
+    assert backend.get("k") is None
+    backend.set("k", b"v", 60)
+    assert backend.get("k") == b"v"
+    backend.delete("k")
+    assert backend.get("k") is None
+    backend.set("short", b"v", 0.05)
+    time.sleep(0.1)
+    assert backend.get("short") is None
+
+
+def test_add_is_set_if_absent(backend):
+    assert backend.add("lock", b"1", 60)
+    assert not backend.add("lock", b"2", 60)
+    assert backend.get("lock") == b"1"
+    backend.set("expiring", b"1", 0.05)
+    time.sleep(0.1)
+    assert backend.add("expiring", b"2", 60)
+
+
+def test_memory_add_is_atomic():
+    backend = MemoryBackend()
+    barrier = threading.Barrier(16)
+    wins = []
+
+    def contend():
+        barrier.wait()
+        wins.append(backend.add("lock", b"1", 60))
+
+    threads = [threading.Thread(target=contend) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert wins.count(True) == 1
+
+
+def test_memory_evicts_least_recently_used():
+    backend = MemoryBackend(max_bytes=10)
+    backend.set("a", b"xxxx", 60)
+    backend.set("b", b"xxxx", 60)
+    backend.get("a")
+    backend.set("c", b"xxxx", 60)
+    assert backend.get("b") is None
+    assert backend.get("a") == b"xxxx" and backend.get("c") == b"xxxx"
+
+
+def _add_in_process(path, results):
+    results.put(SQLiteBackend(path).add("lock", b"1", 60))
+
+
+def test_sqlite_add_is_atomic_across_processes(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    SQLiteBackend(path)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_add_in_process, args=(path, results)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert sorted(results.get() for _ in processes) == [False, False, False, True]
+
+
+def test_redis_auth_select_and_error_replies():
+    server = RESPServer(password="s3cret")
+    try:
+        backend = open_backend(f"redis://:s3cret@127.0.0.1:{server.port}/2")
+        backend.set("k", b"v", 60)
+        assert backend.get("k") == b"v"
+        assert b"k" in server.data[2]
+        with pytest.raises(CacheBackendError, match="unknown command"):
+            backend.command("FLUSHALL")
+        # An error reply leaves the connection usable
+        assert backend.get("k") == b"v"
+        with pytest.raises(CacheBackendError, match="WRONGPASS"):
+            RedisBackend(port=server.port, password="wrong").get("k")
+    finally:
+        server.close()
+
+
+def test_redis_pool_reuses_and_recovers_connections(resp_server):
+    backend = RedisBackend(port=resp_server.port)
+    for i in range(5):
+        backend.set(f"k{i}", b"v", 60)
+    assert len(backend._idle) == 1
+
+    resp_server.close()
+    with pytest.raises(CacheBackendError):
+        backend.get("k0")
+    assert backend._idle == []
+
+    replacement = RESPServer()
+    try:
+        backend.port = replacement.port
+        backend.set("k", b"v", 60)
+        assert backend.get("k") == b"v"
+    finally:
+        replacement.close()
+
+
+def test_redis_unreachable_raises_backend_error():
+    with pytest.raises(CacheBackendError):
+        RedisBackend(port=1, timeout=0.2).get("k")
+
+
+def test_shared_tier_fill_lock_coalesces(resp_server):
+    tier = SharedTier(RedisBackend(port=resp_server.port), "test:")
+    loads = []
+
+    async def fetch():
+        value = await tier.get("key")
+        if value is None:
+            async with cachebackends.fill_lock(tier, "key") as filling:
+                if not filling:
+                    value = await tier.get("key")
+                if value is None:
+                    loads.append(1)
+                    await asyncio.sleep(0.1)
+                    value = {"n": 1}
+                    await tier.set("key", value, 60)
+        return value
+
+    async def main():
+        return await asyncio.gather(*(fetch() for _ in range(8)))
+
+    assert asyncio.run(main()) == [{"n": 1}] * 8
+    assert len(loads) == 1
+
+
+def test_shared_tier_degrades_to_misses_when_backend_is_down():
+    tier = SharedTier(RedisBackend(port=1, timeout=0.2), "test:")
+
+    async def main():
+        await tier.set("key", {"n": 1}, 60)
+        async with tier.fill_lock("key") as filling:
+            return await tier.get("key"), filling
+
+    assert asyncio.run(main()) == (None, True)
+    assert tier.errors >= 2
+
+
+def test_asset_invalidate_drops_local_and_shared_copies():
+    shared = SharedTier(MemoryBackend(), "assets:")
+    cache = AssetCache(shared=shared)
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        return {"asset": {"id": len(loads)}}
+
+    async def main():
+        await cache.get(("t", 1, 2), loader)
+        await cache.invalidate(("t", 1, 2))
+        assert await shared.get("t:1:2") is None
+        return await cache.get(("t", 1, 2), loader)
+
+    assert asyncio.run(main()) == {"asset": {"id": 2}}
+    assert len(loads) == 2
+
+
+def test_default_cache_is_private(tmp_path, monkeypatch):
+    monkeypatch.delenv("CACHE_URL", raising=False)
+    monkeypatch.delenv("LISTING_CACHE_PATH", raising=False)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    old_umask = os.umask(0o022)
+    try:
+        url = cachebackends.default_cache_url()
+        assert url == "sqlite://" + str(tmp_path / "udemy_saver" / "cache.sqlite3")
+        backend = open_backend(url)
+        backend.set("k", b"v", 60)
+    finally:
+        os.umask(old_umask)
+    assert stat.S_IMODE(os.stat(tmp_path / "udemy_saver").st_mode) == 0o700
+    for name in os.listdir(tmp_path / "udemy_saver"):
+        assert stat.S_IMODE(os.stat(tmp_path / "udemy_saver" / name).st_mode) == 0o600
+
+
+def test_default_cache_url_overrides(monkeypatch):
+    monkeypatch.setenv("LISTING_CACHE_PATH", "")
+    monkeypatch.delenv("CACHE_URL", raising=False)
+    assert cachebackends.default_cache_url() == "memory://"
+    monkeypatch.setenv("CACHE_URL", "redis://cache:6379/1")
+    assert cachebackends.default_cache_url() == "redis://cache:6379/1"
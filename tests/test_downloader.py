@@ -0,0 +1,202 @@
+import contextlib
+import hashlib
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import downloader
+from downloader import Downloader
+
+BODY = os.urandom(256 * 1024)
+
+
+class FlakyServer:
+    """Serves BODY with Range support; `truncate` and `stall` break that many ranged responses mid-body."""
+    def __init__(self, truncate=0, stall=0):
+        self.truncate = truncate
+        self.stall = stall
+        self.ranges = []
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                first, last = 0, len(BODY) - 1
+                header = self.headers.get("Range")
+                if header:
+                    first, _, end = header.split("=")[1].partition("-")
+                    first, last = int(first), int(end) if end else len(BODY) - 1
+                body = BODY[first:last + 1]
+                self.send_response(206 if header else 200)
+                if header:
+                    self.send_header("Content-Range", f"bytes {first}-{last}/{len(BODY)}")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                with server.lock:
+                    server.ranges.append(header)
+                    broken = len(body) > 1 and (server.truncate or server.stall)
+                    stall = broken and not server.truncate
+                    if broken:
+                        if server.truncate:
+                            server.truncate -= 1
+                        else:
+                            server.stall -= 1
+                if broken:
+                    self.wfile.write(body[:len(body) // 2])
+                    self.wfile.flush()
+                    if stall:
+                        time.sleep(3)
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/file.bin"
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def segmented(monkeypatch):
+    monkeypatch.setattr(downloader, "SEGMENT_THRESHOLD", 1024)
+    monkeypatch.setattr(downloader.time, "sleep", lambda seconds: None)
+
+
+def test_truncated_segment_is_retried(tmp_path, segmented):
+    server = FlakyServer(truncate=1)
+    try:
+        dest = tmp_path / "file.bin"
+        assert Downloader(str(tmp_path)).download_file(server.url, str(dest))
+        assert hashlib.sha256(dest.read_bytes()).digest() == hashlib.sha256(BODY).digest()
+        assert not os.path.exists(str(dest) + ".part.json")
+    finally:
+        server.close()
+
+
+def test_stalled_segment_times_out_and_is_retried(tmp_path, segmented, monkeypatch):
+    monkeypatch.setattr(downloader, "TIMEOUT", (2, 0.5))
+    server = FlakyServer(stall=1)
+    try:
+        dest = tmp_path / "file.bin"
+        started = time.monotonic()
+        assert Downloader(str(tmp_path)).download_file(server.url, str(dest))
+        assert time.monotonic() - started < 3
+        assert dest.read_bytes() == BODY
+    finally:
+        server.close()
+
+
+def test_interrupted_download_resumes_from_sidecar(tmp_path, segmented, monkeypatch):
+    monkeypatch.setattr(downloader, "SEGMENT_RETRIES", 1)
+    server = FlakyServer(truncate=downloader.SEGMENT_COUNT)
+    try:
+        dest = tmp_path / "file.bin"
+        dl = Downloader(str(tmp_path))
+        assert not dl.download_file(server.url, str(dest))
+        assert os.path.exists(str(dest) + ".part.json")
+
+        server.ranges.clear()
+        assert dl.download_file(server.url, str(dest))
+        assert dest.read_bytes() == BODY
+        # Only the missing halves were asked for again (plus the size probe)
+        resumed = [r for r in server.ranges if r != "bytes=0-0"]
+        assert resumed and all(int(r.split("=")[1].split("-")[0]) > 0 for r in resumed)
+    finally:
+        server.close()
+
+
+@pytest.mark.parametrize("title", ["..", ".", " .. ", ""])
+def test_course_dir_rejects_dot_names(tmp_path, title):
+    with pytest.raises(downloader.DownloadError):
+        Downloader(str(tmp_path / "root")).create_course_dir(title)
+    assert os.listdir(tmp_path) == ["root"]
+
+
+def test_course_dir_refuses_symlink_out_of_root(tmp_path):
+    root = tmp_path / "root"
+    root.mkdir()
+    (root / "escape").symlink_to(tmp_path)
+    dl = Downloader(str(root))
+    with pytest.raises(downloader.DownloadError):
+        dl.create_course_dir("escape")
+    assert dl.create_course_dir("../Course").startswith(str(root))
+
+
+def test_host_limit_counts_connections_not_files(tmp_path, segmented):
+    from engine import HostLimiter
+
+    class CountingHosts(HostLimiter):
+        def __init__(self, per_host):
+            super().__init__(per_host)
+            self.open = self.peak = self.taken = 0
+            self.lock = threading.Lock()
+
+        @contextlib.contextmanager
+        def for_url(self, url):
+            with super().for_url(url):
+                with self.lock:
+                    self.open += 1
+                    self.taken += 1
+                    self.peak = max(self.peak, self.open)
+                time.sleep(0.05)
+                try:
+                    yield
+                finally:
+                    with self.lock:
+                        self.open -= 1
+
+    server = FlakyServer()
+    try:
+        dl = Downloader(str(tmp_path))
+        dl.hosts = CountingHosts(2)
+        assert dl.download_file(server.url, str(tmp_path / "file.bin"))
+        assert dl.hosts.taken == 1 + downloader.SEGMENT_COUNT
+        assert dl.hosts.peak == 2
+    finally:
+        server.close()
+
+
+class ExitingFFmpeg:
+    """Stands in for an ffmpeg that wrote part of its output and then quit with an error."""
+    def __init__(self, command, stdin=None):
+        with open(command[-1], "wb") as f:
+            f.write(b"partial mp4")
+        self.returncode = None
+        self.stdin = self
+
+    def write(self, data):
+        raise BrokenPipeError()
+
+    def close(self):
+        pass
+
+    def kill(self):
+        pass
+
+    def wait(self):
+        self.returncode = 1
+        return 1
+
+
+def test_failed_hls_remux_removes_partial_output(tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader.subprocess, "Popen", ExitingFFmpeg)
+    dl = Downloader(str(tmp_path))
+    monkeypatch.setattr(dl, "_fetch_segment_bytes", lambda segment: b"ts data")
+    dest = tmp_path / "video.mp4"
+
+    with pytest.raises(downloader.DownloadError):
+        dl._download_hls([{"uri": "https://cdn/seg1.ts"}], str(dest))
+    assert not os.path.exists(str(dest) + ".part")
+    assert not dest.exists()
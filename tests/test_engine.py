@@ -0,0 +1,40 @@
+import os
+
+from downloader import sanitize_filename
+from engine import DownloadEngine
+from jobs import Job
+from models import Lecture
+
+
+class FakeAPI:
+    def get_lecture_asset(self, course_id, lecture_id):
+        if lecture_id == 3:
+            raise OSError("lookup blew up")
+        return {"asset": {"id": lecture_id, "asset_type": "Video",
+                          "stream_urls": {"Video": [{"label": "720", "file": f"https://cdn/{lecture_id}.mp4"}]}}}
+
+    def get_supplementary_asset(self, course_id, lecture_id, asset_id):
+        return None
+
+
+class FakeDownloader:
+    sanitize_filename = staticmethod(sanitize_filename)
+
+    def fetch_video(self, url, dest, title, rate_limit=None, quality=None):
+        with open(dest, "wb") as f:
+            f.write(b"video")
+        return True
+
+    def apply_branding(self, path, title):
+        if title == "Lecture 2":
+            raise OSError("disk full")
+
+
+def test_failures_in_any_stage_are_reported(tmp_path):
+    job = Job("token", 1)
+    lectures = [(Lecture(i, f"Lecture {i}", i), str(tmp_path)) for i in (1, 2, 3)]
+    DownloadEngine(FakeAPI(), FakeDownloader(), on_event=job.on_event).run(1, lectures)
+
+    # Lecture 2 fails in post-processing, lecture 3 before any of its files were queued
+    assert (job.files_total, job.files_done, job.files_failed) == (3, 1, 2)
+    assert os.path.exists(tmp_path / "001 - Lecture 1.mp4")
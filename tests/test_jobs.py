@@ -0,0 +1,34 @@
+import pytest
+
+from jobs import Job, JobConflict, JobManager
+
+
+@pytest.fixture
+def manager(tmp_path):
+    # No workers: submitted jobs stay queued
+    return JobManager(root=str(tmp_path), workers=0)
+
+
+def test_second_job_for_same_course_folder_is_refused(manager):
+    first = manager.submit(Job("token-a", 1, "My Course"))
+    with pytest.raises(JobConflict):
+        manager.submit(Job("token-a", 1, "My Course"))
+    # Another token, same folder: still the same .part files
+    with pytest.raises(JobConflict):
+        manager.submit(Job("token-b", 1, "my course"))
+    assert list(manager.jobs) == [first.id]
+
+    other = manager.submit(Job("token-a", 2, "Other Course"))
+    assert other.state == "queued"
+
+
+def test_folder_frees_up_once_the_job_ends(manager):
+    first = manager.submit(Job("token-a", 1, "My Course"))
+    manager.cancel(first)
+    second = manager.submit(Job("token-a", 1, "My Course"))
+
+    # Resuming the old job would now collide with the new one
+    with pytest.raises(JobConflict):
+        manager.resume(first)
+    assert first.state == "cancelled"
+    assert second.state == "queued"
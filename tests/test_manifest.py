@@ -0,0 +1,80 @@
+import os
+import sqlite3
+
+import pytest
+
+from manifest import MANIFEST_NAME, Manifest, file_checksum
+
+
+@pytest.fixture
+def root(tmp_path):
+    return str(tmp_path)
+
+
+@pytest.fixture
+def manifest(root):
+    return Manifest(root)
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_manifest_reuse_moves_renamed_files(root, manifest):
+    path = write(os.path.join(root, "A", "old.mp4"), b"video")
+    manifest.record(1, 10, 100, "video", "720", path)
+    assert manifest.get(1, 10, 100)["checksum"] == file_checksum(path)
+
+    renamed = os.path.join(root, "B", "new.mp4")
+    assert manifest.reuse(1, 10, 100, renamed)
+    assert os.path.exists(renamed) and not os.path.exists(path)
+    assert manifest.get(1, 10, 100)["path"] == os.path.abspath(renamed)
+
+    write(renamed, b"truncated!")
+    assert not manifest.reuse(1, 10, 100, renamed)
+    assert manifest.get(1, 10, 100) is None
+
+
+def test_manifest_drop_replaced(root, manifest):
+    old = write(os.path.join(root, "c", "old.mp4"), b"v1")
+    manifest.record(1, 10, 100, "video", None, old)
+    manifest.drop_replaced(1, 10, "video", {101})
+    assert not os.path.exists(old)
+    assert manifest.for_lecture(1, 10, "video") == []
+
+
+def test_manifest_reuse_refetches_when_requested_quality_changed(root, manifest):
+    path = write(os.path.join(root, "A", "01.mp4"), b"1080p video")
+    manifest.record(1, 10, 100, "video", "1080", path, requested=None)
+
+    assert manifest.reuse(1, 10, 100, path, requested="")
+    assert not manifest.reuse(1, 10, 100, path, requested="720")
+    assert not os.path.exists(path)
+    assert manifest.get(1, 10, 100) is None
+
+    write(path, b"720p video")
+    manifest.record(1, 10, 100, "video", "720", path, requested="720")
+    assert manifest.reuse(1, 10, 100, path, requested="720")
+
+
+def test_manifest_adds_requested_column_to_old_files(root):
+    conn = sqlite3.connect(os.path.join(root, MANIFEST_NAME))
+    conn.execute("""
+        CREATE TABLE files (
+            course_id INTEGER NOT NULL, lecture_id INTEGER NOT NULL, asset_id INTEGER NOT NULL,
+            kind TEXT NOT NULL, quality TEXT, size INTEGER NOT NULL, checksum TEXT NOT NULL,
+            path TEXT NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (course_id, lecture_id, asset_id)
+        )
+    """)
+    path = write(os.path.join(root, "A", "01.mp4"), b"video")
+    conn.execute("INSERT INTO files VALUES (1, 10, 100, 'video', '1080', 5, 'x', ?, 0)", (path,))
+    conn.commit()
+    conn.close()
+
+    manifest = Manifest(root)
+    assert manifest.get(1, 10, 100)["requested"] is None
+    # Fetched before tracking: only known to satisfy the default (highest) quality
+    assert manifest.reuse(1, 10, 100, path, requested="")
@@ -0,0 +1,98 @@
+import asyncio
+import os
+import stat
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from mediacache import MediaCache, relay
+from test_downloader import BODY, FlakyServer
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def consume(response):
+    chunks = []
+    async for chunk in response.body_iterator:
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return MediaCache(root=str(tmp_path / "media"), max_bytes=10 * 1024 * 1024)
+
+
+def test_full_request_is_relayed_and_cached(cache):
+    server = FlakyServer()
+    try:
+        async def main():
+            response = await relay(cache, "key", server.url)
+            return response.status_code, await consume(response)
+
+        assert run(main()) == (200, BODY)
+        assert cache.lookup("key") is not None
+    finally:
+        server.close()
+
+
+def test_unreachable_upstream_returns_none(cache):
+    assert run(relay(cache, "key", "http://127.0.0.1:1/video.mp4")) is None
+    assert cache.lookup("key") is None
+
+
+def test_upstream_dropping_mid_stream_leaves_no_partial_entry(cache):
+    server = FlakyServer(truncate=1)
+    try:
+        async def main():
+            # Without a Range header the fake server answers 200 with the full length, then cuts the body
+            response = await relay(cache, "key", server.url)
+            return await consume(response)
+
+        body = run(main())
+        assert len(body) < len(BODY)
+        assert cache.lookup("key") is None
+        assert not [name for name in os.listdir(cache.root) if name.endswith(".part")]
+        # The key isn't stuck as "being filled"
+        assert cache.begin_fill("key") is not None
+    finally:
+        server.close()
+
+
+@pytest.mark.parametrize("status, rejected", [(403, True), (410, True), (500, False)])
+def test_rejected_url_is_reported(cache, status, rejected):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_error(status)
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    calls = []
+
+    async def on_rejected():
+        calls.append(1)
+
+    try:
+        url = f"http://127.0.0.1:{httpd.server_address[1]}/video.mp4"
+        assert run(relay(cache, "key", url, on_rejected=on_rejected)) is None
+        assert bool(calls) == rejected
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_default_cache_is_private(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "xdg"))
+    cache = MediaCache(root=None)
+    part_path = cache.begin_fill("key")
+
+    assert os.path.dirname(part_path) == str(tmp_path / "xdg" / "udemy_saver" / "media")
+    assert stat.S_IMODE(os.stat(os.path.dirname(part_path)).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(part_path).st_mode) == 0o600
+    cache.abort("key")
@@ -0,0 +1,101 @@
+import os
+import struct
+
+import pytest
+
+import mp4meta
+
+MEDIA = bytes(range(256)) * 64
+
+
+def write_mp4(path, duration_seconds=60):
+    matrix = struct.pack(">9I", 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+    mvhd = mp4meta._box(b"mvhd", struct.pack(">IIIIII", 0, 0, 0, 1000, duration_seconds * 1000, 0x00010000)
+                        + struct.pack(">H", 0x0100) + bytes(10) + matrix + bytes(24) + struct.pack(">I", 2))
+    ftyp = mp4meta._box(b"ftyp", b"isom" + struct.pack(">I", 512) + b"isomiso2mp41")
+    path.write_bytes(ftyp + mp4meta._box(b"moov", mvhd) + mp4meta._box(b"mdat", MEDIA))
+
+
+def top_level(path):
+    with open(path, "rb") as f:
+        return mp4meta._top_level_boxes(f, os.path.getsize(path))
+
+
+def moov_of(path):
+    data = path.read_bytes()
+    [(_, offset, size, _)] = [box for box in top_level(path) if box[0] == b"moov"]
+    return data[offset:offset + size]
+
+
+def test_brand_keeps_media_and_adds_tags_and_subtitle(tmp_path):
+    path = tmp_path / "video.mp4"
+    write_mp4(path)
+    mp4meta.brand_in_place(path, title="Intro", description="Saved", subtitle="Hello")
+
+    types = [box[0] for box in top_level(path)]
+    assert types.count(b"moov") == 1
+    assert types[:4] == [b"ftyp", b"free", b"mdat", b"mdat"]
+    assert MEDIA in path.read_bytes()
+    moov = moov_of(path)
+    assert b"Intro" in moov and b"Saved" in moov
+    assert mp4meta.SUBTITLE_HANDLER_NAME in moov
+
+
+def test_rebrand_with_same_tags_leaves_file_untouched(tmp_path):
+    path = tmp_path / "video.mp4"
+    write_mp4(path)
+    mp4meta.brand_in_place(path, title="Intro", comment="Saved", subtitle="Hello")
+    branded = path.read_bytes()
+
+    mp4meta.brand_in_place(path, title="Intro", comment="Saved", subtitle="Hello")
+
+    assert path.read_bytes() == branded
+
+
+def test_rebrand_reuses_retired_moov_instead_of_growing(tmp_path):
+    path = tmp_path / "video.mp4"
+    write_mp4(path)
+    mp4meta.brand_in_place(path, title="First", subtitle="Hello")
+    mp4meta.brand_in_place(path, title="Second", subtitle="Hello")
+    size = os.path.getsize(path)
+
+    for title in ("Third", "Fourth", "Fifth", "Sixth"):
+        mp4meta.brand_in_place(path, title=title, subtitle="Hello")
+        assert os.path.getsize(path) <= size
+        types = [box[0] for box in top_level(path)]
+        assert types.count(b"moov") == 1
+        assert title.encode() in moov_of(path)
+        assert moov_of(path).count(mp4meta.SUBTITLE_HANDLER_NAME) == 1
+
+
+def test_shorter_tags_leave_a_valid_free_box(tmp_path):
+    path = tmp_path / "video.mp4"
+    write_mp4(path)
+    mp4meta.brand_in_place(path, title="A fairly long lecture title", subtitle="Hello")
+    mp4meta.brand_in_place(path, title="Another fairly long lecture title", subtitle="Hello")
+    mp4meta.brand_in_place(path, title="Short", subtitle="Hello")
+
+    # _top_level_boxes raises on anything that doesn't tile the file exactly
+    types = [box[0] for box in top_level(path)]
+    assert types.count(b"moov") == 1
+    assert b"Short" in moov_of(path)
+
+
+def test_fragmented_mp4_not_supported(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(mp4meta._box(b"ftyp", b"isom") + mp4meta._box(b"moov", b"") + mp4meta._box(b"moof", b""))
+    with pytest.raises(mp4meta.NotSupported):
+        mp4meta.brand_in_place(path, title="Intro")
+
+
+def test_open_ended_mdat_not_supported(tmp_path):
+    path = tmp_path / "video.mp4"
+    write_mp4(path)
+    data = bytearray(path.read_bytes())
+    [(_, offset, _, _)] = [box for box in top_level(path) if box[0] == b"mdat"]
+    data[offset:offset + 4] = bytes(4)  # size 0: the mdat runs to the end of the file
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(mp4meta.NotSupported):
+        mp4meta.brand_in_place(path, title="Intro", subtitle="Hello")
+    assert path.read_bytes() == bytes(data)
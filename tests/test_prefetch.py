@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+import pytest
+
+import ratelimit
+from cache import token_hash
+from prefetch import Prefetcher, video_lecture_ids
+from udemy import AsyncUdemyAPI
+
+CURRICULUM = [{"_class": "chapter", "id": 1, "title": "C"}] + [
+    {"_class": "lecture", "id": i, "title": f"L{i}", "asset": {"asset_type": "Video"}} for i in range(1, 11)
+] + [{"_class": "lecture", "id": 99, "title": "Article", "asset": {"asset_type": "Article"}}]
+
+
+@pytest.fixture(autouse=True)
+def unpaced(monkeypatch):
+    monkeypatch.setattr(ratelimit, "limiter", ratelimit.RateLimiter(rate=0))
+    monkeypatch.setattr(ratelimit, "breaker", ratelimit.CircuitBreaker())
+
+
+def prefetcher(fetched, delay=0.0, **options):
+    async def fetch(api, course_id, lecture_id):
+        await asyncio.sleep(delay)
+        fetched.append(lecture_id)
+
+    options = {"lectures": 3, "concurrency": 1, **options}
+    return Prefetcher(fetch, lambda api, course_id, lecture_id: lecture_id in fetched, **options)
+
+
+def test_video_lectures_include_slim_items_without_a_type():
+    slim = [{"_class": "lecture", "id": 5, "title": "L5", "asset": {"id": 50}}]
+    assert video_lecture_ids(CURRICULUM + slim) == list(range(1, 11)) + [5]
+
+
+def test_warms_first_lectures_then_the_ones_after_each_click():
+    fetched = []
+
+    async def main():
+        p = prefetcher(fetched)
+        api = AsyncUdemyAPI("token")
+        p.curriculum_served(api, 1, CURRICULUM)
+        await asyncio.sleep(0.05)
+        assert fetched == [1, 2, 3]
+        p.lecture_resolved(api, 1, 3)
+        await asyncio.sleep(0.05)
+        assert fetched == [1, 2, 3, 4, 5, 6]
+        p.lecture_resolved(api, 1, 5)
+        await asyncio.sleep(0.05)
+        return p.stats()
+
+    stats = asyncio.run(main())
+    assert fetched == [1, 2, 3, 4, 5, 6, 7, 8]
+    assert stats["already_cached"] == 1
+
+
+def test_budget_per_token():
+    fetched = []
+
+    async def main():
+        p = prefetcher(fetched, lectures=10, budget=4)
+        p.curriculum_served(AsyncUdemyAPI("a"), 1, CURRICULUM)
+        await asyncio.sleep(0.05)
+        assert len(fetched) == 4
+        p.curriculum_served(AsyncUdemyAPI("b"), 2, CURRICULUM)
+        await asyncio.sleep(0.05)
+        return p.stats()
+
+    assert asyncio.run(main())["over_budget"] == 2
+    assert len(fetched) == 8
+
+
+def test_idle_token_stops_warming_unless_touched():
+    async def warm(touch):
+        fetched = []
+        p = prefetcher(fetched, delay=0.05, lectures=10, idle=0.12)
+        p.curriculum_served(AsyncUdemyAPI("token"), 1, CURRICULUM)
+        for _ in range(12):
+            await asyncio.sleep(0.05)
+            if touch:
+                p.touch("token")
+        return fetched
+
+    assert len(asyncio.run(warm(touch=False))) < 5
+    assert len(asyncio.run(warm(touch=True))) == 10
+
+
+def test_yields_when_the_rate_limiter_is_short(monkeypatch):
+    monkeypatch.setattr(ratelimit, "limiter", ratelimit.RateLimiter(rate=1, burst=4))
+    fetched = []
+
+    async def main():
+        p = prefetcher(fetched)
+        api = AsyncUdemyAPI("token")
+        for _ in range(3):
+            ratelimit.limiter.for_token("token").reserve()
+        p.curriculum_served(api, 1, CURRICULUM)
+        await asyncio.sleep(0.05)
+        return p.stats()
+
+    assert asyncio.run(main())["yielded"] == 1
+    assert fetched == []
+
+
+def test_every_api_request_touches_the_token(monkeypatch):
+    from fastapi.testclient import TestClient
+    import api
+
+    state = api.prefetcher._state(token_hash("token"))
+    state.active_at = 0
+    monkeypatch.setattr(api.prefetcher, "lectures", 3)
+    TestClient(api.app).get("/api/cache-stats", headers={"Authorization": "token"})
+    assert time.monotonic() - state.active_at < 5
@@ -0,0 +1,84 @@
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import ratelimit
+from ratelimit import CircuitBreaker, TokenBucket, parse_retry_after
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after(" 12 ") == 12.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    future = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < parse_retry_after(future) <= 30
+    past = format_datetime(datetime.now(timezone.utc) - timedelta(seconds=30), usegmt=True)
+    assert parse_retry_after(past) == 0.0
+
+
+def test_bucket_bursts_then_paces(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+    clock[0] += 10
+    assert bucket.reserve() == 0.0
+    assert bucket.headroom() == pytest.approx(2)
+
+
+def test_bucket_throttle_halves_rate_and_pauses(clock):
+    bucket = TokenBucket(rate=4, burst=4)
+    bucket.throttled(retry_after=5)
+    assert bucket.rate == 2
+    assert bucket.headroom() == 0.0
+    assert bucket.reserve() == pytest.approx(5)
+    clock[0] += 6
+    for _ in range(20):
+        bucket.succeeded()
+    assert bucket.rate == 4
+
+
+def test_breaker_opens_and_recovers(clock):
+    breaker = CircuitBreaker(threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    clock[0] += 10
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_lost_probe_lease_expires(clock):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock[0] += 10
+    assert breaker.allow()  # this probe gets cancelled and never reports back
+    clock[0] += 5
+    assert not breaker.allow()
+    clock[0] += 5
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_next_attempt_retries_then_gives_up(monkeypatch):
+    monkeypatch.setattr(ratelimit, "breaker", CircuitBreaker(threshold=100))
+    bucket = TokenBucket(rate=10, burst=10)
+    assert ratelimit.next_attempt(bucket, 200, None, 0) is None
+    assert ratelimit.next_attempt(bucket, 429, "2", 0) >= 2
+    assert bucket.rate == 5
+    assert ratelimit.next_attempt(bucket, 503, None, 0) is not None
+    assert ratelimit.next_attempt(bucket, 503, None, ratelimit.MAX_RETRIES) is None
+    assert ratelimit.next_attempt(bucket, 429, str(int(ratelimit.BACKOFF_MAX) + 1), 0) is None
@@ -0,0 +1,34 @@
+import asyncio
+
+import api
+from models import Lecture
+
+
+class FakeAPI:
+    access_token = "resolve-test-token"
+
+    def __init__(self, assets):
+        self.assets = assets
+
+    async def get_lecture_asset(self, course_id, lecture_id):
+        return {"asset": self.assets[lecture_id]}
+
+    async def get_supplementary_asset(self, course_id, lecture_id, asset_id):
+        return None
+
+
+def test_resolve_lecture_looks_up_assets_without_a_type():
+    fake = FakeAPI({
+        1: {"id": 11, "asset_type": "Video", "stream_urls": {"Video": [{"label": "720", "file": "https://cdn/1.mp4"}]}},
+        2: {"id": 12, "asset_type": "Article"}
+    })
+    # Slim projection: the curriculum's asset carries only its id
+    video = Lecture.from_json({"id": 1, "title": "Video", "asset": {"id": 11}})
+    article = Lecture.from_json({"id": 2, "title": "Article", "asset": {"id": 12}})
+
+    async def main():
+        return [await api._resolve_lecture(fake, 7, lecture, None) for lecture in (video, article)]
+
+    first, second = asyncio.run(main())
+    assert first["status"] == "success"
+    assert second["status"] == "no_video"
@@ -0,0 +1,66 @@
+import asyncio
+import gzip
+
+import pytest
+
+import responses
+from cache import ListingCache
+from responses import negotiated_json
+
+
+class FakeRequest:
+    def __init__(self, **headers):
+        self.headers = {name.replace("_", "-"): value for name, value in headers.items()}
+
+
+@pytest.fixture(autouse=True)
+def empty_memo():
+    responses._serialized.clear()
+    responses._encoded.clear()
+
+
+def test_etag_and_304():
+    payload = {"courses": [{"id": 1}]}
+    first = negotiated_json(FakeRequest(), payload)
+    etag = first.headers["etag"]
+    assert negotiated_json(FakeRequest(if_none_match=etag), payload).status_code == 304
+    assert negotiated_json(FakeRequest(if_none_match='"other"'), payload).status_code == 200
+
+
+def test_compressed_variant_validates_the_same_payload():
+    payload = {"curriculum": ["x" * 50] * 100}
+    response = negotiated_json(FakeRequest(accept_encoding="gzip"), payload)
+    assert response.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(response.body).startswith(b'{"curriculum"')
+    assert negotiated_json(FakeRequest(if_none_match=response.headers["etag"]), payload).status_code == 304
+
+
+def test_memoized_body_skips_building_and_serializing(monkeypatch):
+    builds = []
+
+    def build():
+        builds.append(1)
+        return {"courses": [1, 2, 3]}
+
+    first = negotiated_json(FakeRequest(), build, cache_key=("courses:x", 1.0))
+    dumps_calls = []
+    monkeypatch.setattr(responses, "dumps", lambda value: dumps_calls.append(value))
+    again = negotiated_json(FakeRequest(if_none_match=first.headers["etag"]), build, cache_key=("courses:x", 1.0))
+    assert again.status_code == 304
+    assert builds == [1] and dumps_calls == []
+
+
+def test_listing_version_follows_refreshes():
+    cache = ListingCache(fresh_ttl=60)
+
+    async def main():
+        await cache.put("k", {"pages": [1]})
+        first = await cache.get("k", None)
+        version = cache.version("k", first)
+        await cache.put("k", {"pages": [2]})
+        second = await cache.get("k", None)
+        return version, cache.version("k", first), cache.version("k", second)
+
+    version, stale, current = asyncio.run(main())
+    assert version is not None and stale is None
+    assert current is not None and current > version
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+from manifest import Manifest, file_checksum
+from store import ContentStore, link_file
+
+
+@pytest.fixture
+def root(tmp_path):
+    return str(tmp_path)
+
+
+@pytest.fixture
+def manifest(root):
+    return Manifest(root)
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_link_file_replaces_destination(root):
+    src = write(os.path.join(root, "src"), b"data")
+    dst = write(os.path.join(root, "dst"), b"old")
+    assert link_file(src, dst) == "hardlink"
+    assert os.path.samefile(src, dst)
+
+
+def test_store_links_second_course_to_first_download(root, manifest):
+    store = ContentStore(root, manifest)
+    first = write(os.path.join(root, "Course A", "01.mp4"), b"lecture video")
+    checksum = store.add("video", 100, "720", first)
+    assert checksum == file_checksum(first)
+    assert store.lookup(100, "720") and store.lookup(100, "1080") is None
+
+    second = os.path.join(root, "Course B", "01.mp4")
+    assert store.link_existing(100, "720", second) == checksum
+    assert os.path.samefile(first, second)
+    assert os.stat(second).st_nlink == 3
+
+
+def test_store_keys_attachments_without_quality(root, manifest):
+    store = ContentStore(root, manifest)
+    path = write(os.path.join(root, "A", "notes.pdf"), b"pdf")
+    store.add("attachment", 200, None, path)
+    assert store.lookup(200).endswith(os.path.join(".store", "attachment", "200.pdf"))
+
+
+def test_store_refuses_to_spread_a_modified_copy(root, manifest):
+    store = ContentStore(root, manifest)
+    first = write(os.path.join(root, "A", "01.mp4"), b"original bytes")
+    store.add("video", 100, "720", first)
+    # Same size, different bytes: edited in place through the hardlink
+    with open(first, "r+b") as f:
+        f.write(b"ORIGINAL")
+
+    second = os.path.join(root, "B", "01.mp4")
+    assert store.link_existing(100, "720", second) is None
+    assert not os.path.exists(second)
+    assert manifest.stored(100, "720") is None
+
+
+def test_store_forgets_deleted_entries(root, manifest):
+    store = ContentStore(root, manifest)
+    first = write(os.path.join(root, "A", "01.mp4"), b"bytes")
+    store.add("video", 100, "720", first)
+    os.remove(store.lookup(100, "720"))
+    assert store.lookup(100, "720") is None
+    assert manifest.stored(100, "720") is None
@@ -0,0 +1,79 @@
+import io
+import struct
+import zipfile
+
+from models import Attachment
+from zipstream import MISSING_NAME, ZipStream, archive_name, course_attachments, missing_report
+
+
+def build(entries):
+    archive = ZipStream()
+    out = io.BytesIO()
+    for name, chunks in entries:
+        out.write(archive.start_entry(name))
+        for chunk in chunks:
+            out.write(archive.write(chunk))
+        out.write(archive.end_entry())
+    out.write(archive.finish())
+    assert archive.offset == out.tell()
+    return out.getvalue()
+
+
+def test_streamed_entries_read_back():
+    data = build([("a/one.bin", [b"x" * 1000, memoryview(b"y" * 10)]), ("two.txt", [b"hello"]), ("empty", [])])
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        assert zf.read("a/one.bin") == b"x" * 1000 + b"y" * 10
+        assert zf.read("two.txt") == b"hello"
+        assert zf.read("empty") == b""
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in zf.infolist())
+
+
+def test_entries_use_data_descriptors_and_zip64():
+    data = build([("f", [b"abc"])])
+    signature, version, flags = struct.unpack_from("<IHH", data)
+    assert signature == 0x04034B50 and version == 45 and flags & 0x0008
+    # The zip64 end record and locator sit right before the classic end record
+    assert data[-22:-18] == b"PK\x05\x06"
+    assert data[-42:-38] == b"PK\x06\x07"
+    assert struct.unpack_from("<I", data, data.index(b"PK\x07\x08") + 4)[0] == 0x352441C2  # crc32("abc")
+
+
+def test_more_entries_than_the_classic_end_record_holds():
+    archive = ZipStream()
+    data = b"".join(archive.add(f"{i}.txt", b"") for i in range(70000)) + archive.finish()
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert len(zf.infolist()) == 70000
+
+
+def test_duplicate_and_unicode_names():
+    archive = ZipStream()
+    data = archive.add("résumé.pdf", b"1") + archive.add("résumé.pdf", b"2") + archive.finish()
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.namelist() == ["résumé.pdf", "résumé (2).pdf"]
+        assert zf.read("résumé (2).pdf") == b"2"
+
+
+def test_course_attachments_follow_chapter_folders():
+    curriculum = [
+        {"_class": "chapter", "id": 1, "title": "Intro: basics"},
+        {"_class": "lecture", "id": 10, "title": "L", "supplementary_assets": [
+            {"id": 100, "title": "slides"}, {"id": 101, "title": "link", "is_external": True}
+        ]},
+        {"_class": "quiz", "id": 2, "title": "Quiz"},
+        {"_class": "chapter", "id": 3, "title": "Next"},
+        {"_class": "lecture", "id": 11, "title": "M", "supplementary_assets": [{"id": 110, "title": "code.zip"}]},
+    ]
+    found = course_attachments(curriculum)
+    assert [(folder, lecture.id, supp.id) for folder, lecture, supp in found] == [
+        ("01 - Intro_ basics", 10, 100), ("02 - Next", 11, 110)
+    ]
+    assert archive_name("01 - Intro_ basics", Attachment(100, "slides"), "https://cdn/x/slides.pdf?sig=1") == \
+        "01 - Intro_ basics/slides.pdf"
+
+
+def test_missing_report():
+    archive = ZipStream()
+    data = archive.add(MISSING_NAME, missing_report(["a/b.zip"])) + archive.finish()
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.read(MISSING_NAME).decode().splitlines()[1:] == ["a/b.zip"]
@@ -1,17 +1,152 @@
+import asyncio
+import collections
+import itertools
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
 from curl_cffi import requests
 
+import metrics
+import ratelimit
+from models import loads
+
+# Overridable so the benchmarks (bench/fake_udemy.py) can point everything at a local stand-in
+BASE_URL = os.environ.get("UDEMY_BASE_URL", "https://www.udemy.com/api-2.0")
+LOGIN_URL = os.environ.get("UDEMY_LOGIN_URL", "https://www.udemy.com/join/login-popup/")
+
+COURSES_PATH = "/users/me/subscribed-courses?page_size=100"
+# One-item, id-only listing: the cheapest authenticated call, used to check a token
+TOKEN_CHECK_PATH = "/users/me/subscribed-courses?page_size=1&fields[course]=id"
+CURRICULUM_PATH = "/courses/{course_id}/subscriber-curriculum-items?page_size=100&fields[lecture]=title,object_index,is_published,sort_order,created,asset,supplementary_assets,is_free&fields[quiz]=title,object_index,is_published,sort_order,type&fields[practice]=title,object_index,is_published,sort_order,type&fields[chapter]=title,object_index,is_published,sort_order&fields[asset]=title,filename,asset_type,status,time_estimation,is_external"
+# Just what the downloader reads: no publishing/sort/estimate fields, minimal quiz and practice entries
+CURRICULUM_SLIM_PATH = "/courses/{course_id}/subscriber-curriculum-items?page_size=100&fields[lecture]=title,object_index,asset,supplementary_assets&fields[quiz]=title&fields[practice]=title&fields[chapter]=title,object_index&fields[asset]=title,filename,asset_type,is_external"
+LECTURE_ASSET_PATH = "/users/me/subscribed-courses/{course_id}/lectures/{lecture_id}/?fields[lecture]=asset,description,download_url&fields[asset]=asset_type,stream_urls,download_urls,length,media_license_token,course_is_drmed"
+SUPPLEMENTARY_ASSET_PATH = "/users/me/subscribed-courses/{course_id}/lectures/{lecture_id}/supplementary-assets/{asset_id}/?fields[asset]=download_urls"
+
+# Size of the shared connection pool used by AsyncUdemyAPI
+MAX_CONNECTIONS = int(os.environ.get("UDEMY_MAX_CONNECTIONS", "64"))
+# How many follow-up pages of a paginated listing are fetched at once
+PAGE_FANOUT = int(os.environ.get("UDEMY_PAGE_FANOUT", "8"))
+# How long the anonymous cookies (csrftoken, bot checks) of a successful login are reused for later logins
+LOGIN_JAR_TTL = int(os.environ.get("LOGIN_JAR_TTL", str(6 * 3600)))
+
+
+def build_headers(access_token=None):
+    """Returns the request headers used for every Udemy API call."""
+    headers = {
+        "Accept": "application/json, text/plain, */*",
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
+    }
+    if access_token:
+        headers["Cookie"] = f"access_token={access_token}"
+        headers["Authorization"] = f"Bearer {access_token}"
+    return headers
+
+
+def remaining_page_urls(url, first_page):
+    """
+    Works out the URLs of pages 2..N from the `count` reported by the first page,
+    so they can be requested in parallel instead of following `next` links one by one.
+    """
+    results = first_page.get('results', [])
+    count = first_page.get('count')
+    if not first_page.get('next') or not results or not count:
+        return []
+
+    page_size = int(parse_qs(urlparse(url).query).get('page_size', [len(results)])[0])
+    pages = math.ceil(count / page_size)
+    return [f"{url}&page={page}" for page in range(2, pages + 1)]
+
+
+def curriculum_url(base_url, course_id, slim=False):
+    """URL of a course's curriculum listing; slim=True projects each item down to the fields the downloader uses."""
+    return base_url + (CURRICULUM_SLIM_PATH if slim else CURRICULUM_PATH).format(course_id=course_id)
+
+
+def courses_from_pages(pages):
+    """Builds the get_subscribed_courses response from raw listing pages."""
+    return {"courses": [_course_item(item) for page in pages for item in page["results"]]}
+
+
+def curriculum_from_pages(pages):
+    """Builds the get_course_curriculum response from raw listing pages."""
+    return {"curriculum": [item for page in pages for item in page["results"]]}
+
+
+def _course_item(item):
+    return {
+        "id": item.get('id'),
+        "title": item.get('title'),
+        "url": item.get('url')
+    }
+
+
+def _login_result(session, post_res):
+    """Interprets the login POST response and the cookies left on the session."""
+    # Check if Udemy blocked us with a Captcha or returned incorrect credentials
+    if post_res.status_code != 200:
+         if "captcha" in post_res.text.lower() or post_res.status_code == 403:
+             return {"error": "Udemy blocked the login request with a Captcha. Please use the access_token method."}
+         return {"error": f"Login failed: Incorrect email or password (Status {post_res.status_code})."}
+
+    # Extract the access_token cookie
+    access_token = session.cookies.get("access_token")
+    if not access_token:
+        # If 200 OK but no token, Udemy usually requires a 6-digit OTP or a browser security check.
+        return {"error": "Login succeeded, but Udemy requires a 6-digit OTP or Captcha verification. Please use your browser to extract the access_token manually."}
+
+    return {"access_token": access_token}
+
+
+def _login_payload(email, password, csrf_token):
+    login_data = {
+        "email": email,
+        "password": password,
+        "csrfmiddlewaretoken": csrf_token,
+        "locale": "en_US"
+    }
+    headers = {
+        "Referer": LOGIN_URL,
+        "Origin": "https://www.udemy.com",
+        "X-CSRFToken": csrf_token,
+        "Accept": "application/json, text/plain, */*"
+    }
+    return login_data, headers
+
+
+_login_jar = None  # (saved_at, [Cookie, ...]) from before a login that succeeded
+
+
+def _saved_login_cookies():
+    if _login_jar is None or time.time() - _login_jar[0] > LOGIN_JAR_TTL:
+        return None
+    return _login_jar[1]
+
+
+def _keep_login_cookies(cookies, result):
+    """Keeps the pre-login cookie jar once it has proven good, so the next login can skip the login page."""
+    global _login_jar
+    if "access_token" in result:
+        _login_jar = (time.time(), cookies)
+
+
+def _drop_login_cookies():
+    global _login_jar
+    _login_jar = None
+
+
+class CircuitOpen(requests.exceptions.RequestException):
+    """Udemy has been failing repeatedly; calls are shed until the breaker's reset timeout passes."""
+
+
 class UdemyAPI:
     def __init__(self, access_token=None):
         self.access_token = access_token
-        self.headers = {
-            "Accept": "application/json, text/plain, */*",
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
-        }
-        if self.access_token:
-            self.headers["Cookie"] = f"access_token={self.access_token}"
-            self.headers["Authorization"] = f"Bearer {self.access_token}"
-            
-        self.base_url = "https://www.udemy.com/api-2.0"
+        self.headers = build_headers(self.access_token)
+        self.base_url = BASE_URL
 
     @staticmethod
     def login_with_credentials(email, password):
@@ -22,7 +157,7 @@ class UdemyAPI:
         session = requests.Session(impersonate="chrome")
         try:
             # 1. Fetch CSRF token from the login page
-            init_res = session.get("https://www.udemy.com/join/login-popup/")
+            init_res = session.get(LOGIN_URL)
             init_res.raise_for_status()
             csrf_token = session.cookies.get("csrftoken")
             
@@ -30,102 +165,384 @@ class UdemyAPI:
                 return {"error": "Failed to initialize login session (No CSRF token)."}
                 
             # 2. POST the credentials
-            login_data = {
-                "email": email,
-                "password": password,
-                "csrfmiddlewaretoken": csrf_token,
-                "locale": "en_US"
-            }
-            headers = {
-                "Referer": "https://www.udemy.com/join/login-popup/",
-                "Origin": "https://www.udemy.com",
-                "X-CSRFToken": csrf_token,
-                "Accept": "application/json, text/plain, */*"
-            }
-            
-            post_res = session.post("https://www.udemy.com/join/login-popup/", data=login_data, headers=headers)
-            
-            # Check if Udemy blocked us with a Captcha or returned incorrect credentials
-            if post_res.status_code != 200:
-                 if "captcha" in post_res.text.lower() or post_res.status_code == 403:
-                     return {"error": "Udemy blocked the login request with a Captcha. Please use the access_token method."}
-                 return {"error": f"Login failed: Incorrect email or password (Status {post_res.status_code})."}
-                 
-            # 3. Extract the access_token cookie
-            access_token = session.cookies.get("access_token")
-            if not access_token:
-                # If 200 OK but no token, Udemy usually requires a 6-digit OTP or a browser security check.
-                return {"error": "Login succeeded, but Udemy requires a 6-digit OTP or Captcha verification. Please use your browser to extract the access_token manually."}
-                
-            return {"access_token": access_token}
+            login_data, headers = _login_payload(email, password, csrf_token)
+            post_res = session.post(LOGIN_URL, data=login_data, headers=headers)
+
+            # 3. Check the response and extract the access_token cookie
+            return _login_result(session, post_res)
             
         except requests.exceptions.RequestException as e:
             return {"error": "Network error during login attempt.", "details": str(e)}
 
-    def get_subscribed_courses(self):
-        """Fetches a list of enrolled courses."""
-        courses = []
-        page = 1
-        url = f"{self.base_url}/users/me/subscribed-courses?page_size=100"
-        
-        while url:
+    def _get_json(self, url, method="get"):
+        response = self._get(url, method)
+        response.raise_for_status()
+        return loads(response.content)
+
+    def _get(self, url, method):
+        """GET paced by the token's rate limiter, retrying 429/5xx/network errors with backoff."""
+        bucket = ratelimit.limiter.for_token(self.access_token)
+        for attempt in itertools.count():
+            if not ratelimit.breaker.allow():
+                raise CircuitOpen("Udemy API is failing; circuit breaker open")
+            if bucket is not None:
+                time.sleep(bucket.reserve())
+
+            started = time.perf_counter()
             try:
                 response = requests.get(url, headers=self.headers, impersonate="chrome")
-                response.raise_for_status()
-                data = response.json()
-                
-                for item in data.get('results', []):
-                    courses.append({
-                        "id": item.get('id'),
-                        "title": item.get('title'),
-                        "url": item.get('url')
-                    })
-                
-                url = data.get('next')
-                page += 1
-            except requests.exceptions.RequestException as e:
-                return {"error": "Failed to fetch courses. Token might be invalid or expired.", "details": str(e)}
-                
-        return {"courses": courses}
+            except requests.exceptions.RequestException:
+                metrics.observe_request(method, "error", started)
+                delay = ratelimit.next_attempt(bucket, None, None, attempt)
+                if delay is None:
+                    raise
+            else:
+                metrics.observe_request(method, response.status_code, started)
+                delay = ratelimit.next_attempt(bucket, response.status_code, response.headers.get("Retry-After"), attempt)
+                if delay is None:
+                    return response
+            metrics.udemy_retries_total.inc(method=method)
+            time.sleep(delay)
 
-    def get_course_curriculum(self, course_id):
-        """Fetches the curriculum for a specific course ID."""
-        url = f"{self.base_url}/courses/{course_id}/subscriber-curriculum-items?page_size=100&fields[lecture]=title,object_index,is_published,sort_order,created,asset,supplementary_assets,is_free&fields[quiz]=title,object_index,is_published,sort_order,type&fields[practice]=title,object_index,is_published,sort_order,type&fields[chapter]=title,object_index,is_published,sort_order&fields[asset]=title,filename,asset_type,status,time_estimation,is_external"
-        
-        curriculum = []
-        page = 1
-        
+    def _iter_pages(self, url, method="get"):
+        """
+        Yields every page of a paginated endpoint in page order, as soon as it is available.
+        Pages after the first are fetched concurrently in a sliding window of PAGE_FANOUT,
+        so at most that many pages are held in memory ahead of the consumer.
+        """
+        first = self._get_json(url, method)
+        yield first
+        page_count = 1
+        last = first
+
+        pool = ThreadPoolExecutor(max_workers=PAGE_FANOUT)
+        try:
+            window = collections.deque()
+            pending = iter(remaining_page_urls(url, first))
+            for page_url in itertools.islice(pending, PAGE_FANOUT):
+                window.append(pool.submit(self._get_json, page_url, method))
+            while window:
+                last = window.popleft().result()
+                for page_url in itertools.islice(pending, 1):
+                    window.append(pool.submit(self._get_json, page_url, method))
+                page_count += 1
+                yield last
+        finally:
+            # The consumer may stop early: don't fetch pages nobody will read
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        # The list grew while we were paging, or there was no count to plan with
+        url = last.get('next')
         while url:
-            try:
-                response = requests.get(url, headers=self.headers, impersonate="chrome")
-                response.raise_for_status()
-                data = response.json()
-                
-                curriculum.extend(data.get('results', []))
-                url = data.get('next')
-                page += 1
-            except requests.exceptions.RequestException as e:
-                return {"error": "Failed to fetch curriculum.", "details": str(e)}
-                
+            last = self._get_json(url, method)
+            page_count += 1
+            yield last
+            url = last.get('next')
+        metrics.udemy_pages_per_call.observe(page_count, method=method)
+
+    def _get_all_pages(self, url, method="get"):
+        """Fetches every page of a paginated endpoint and returns the combined results in page order."""
+        return [item for page in self._iter_pages(url, method) for item in page.get('results', [])]
+
+    def get_subscribed_courses(self):
+        """Fetches a list of enrolled courses."""
+        try:
+            results = self._get_all_pages(f"{self.base_url}{COURSES_PATH}", "get_subscribed_courses")
+        except requests.exceptions.RequestException as e:
+            return {"error": "Failed to fetch courses. Token might be invalid or expired.", "details": str(e)}
+
+        return {"courses": [_course_item(item) for item in results]}
+
+    def get_course_curriculum(self, course_id, slim=False):
+        """Fetches the curriculum for a specific course ID (slim=True requests only the fields the downloader uses)."""
+        url = curriculum_url(self.base_url, course_id, slim)
+        try:
+            curriculum = self._get_all_pages(url, "get_course_curriculum")
+        except requests.exceptions.RequestException as e:
+            return {"error": "Failed to fetch curriculum.", "details": str(e)}
+
         return {"curriculum": curriculum}
 
+    def iter_course_curriculum(self, course_id, slim=False):
+        """
+        Yields the curriculum items of a course (chapters and lectures, in order) page by page,
+        so callers can start on the first lectures before the rest of the listing has arrived.
+        Raises requests.exceptions.RequestException if a page can't be fetched.
+        """
+        url = curriculum_url(self.base_url, course_id, slim)
+        for page in self._iter_pages(url, "get_course_curriculum"):
+            yield from page.get('results', [])
+
     def get_lecture_asset(self, course_id, lecture_id):
         """Fetches the stream URLs for a lecture asset."""
-        url = f"{self.base_url}/users/me/subscribed-courses/{course_id}/lectures/{lecture_id}/?fields[lecture]=asset,description,download_url&fields[asset]=asset_type,stream_urls,download_urls,length,media_license_token,course_is_drmed"
+        url = self.base_url + LECTURE_ASSET_PATH.format(course_id=course_id, lecture_id=lecture_id)
         
         try:
-            response = requests.get(url, headers=self.headers, impersonate="chrome")
-            response.raise_for_status()
-            return response.json()
+            return self._get_json(url, "get_lecture_asset")
         except requests.exceptions.RequestException as e:
             return {"error": "Failed to fetch lecture asset.", "details": str(e)}
 
     def get_supplementary_asset(self, course_id, lecture_id, asset_id):
         """Fetches download URL for a supplementary asset (like .zip)."""
-        url = f"{self.base_url}/users/me/subscribed-courses/{course_id}/lectures/{lecture_id}/supplementary-assets/{asset_id}/?fields[asset]=download_urls"
+        url = self.base_url + SUPPLEMENTARY_ASSET_PATH.format(course_id=course_id, lecture_id=lecture_id, asset_id=asset_id)
+        try:
+            return self._get_json(url, "get_supplementary_asset")
+        except requests.exceptions.RequestException as e:
+            return {"error": "Failed to fetch supplementary asset.", "details": str(e)}
+
+
+_async_session = None
+_async_session_loop = None
+
+
+def get_async_session():
+    """
+    Returns the process-wide pooled AsyncSession.
+    Connections are kept alive and reused across every request served by this worker.
+    Cookies set by Udemy are discarded so nothing leaks between users sharing the pool.
+    """
+    global _async_session, _async_session_loop
+    loop = asyncio.get_running_loop()
+    if _async_session is None or _async_session_loop is not loop:
+        _async_session = requests.AsyncSession(impersonate="chrome", max_clients=MAX_CONNECTIONS, discard_cookies=True)
+        _async_session_loop = loop
+    return _async_session
+
+
+async def close_async_session():
+    """Closes the shared AsyncSession (called on application shutdown)."""
+    global _async_session, _async_session_loop
+    if _async_session is not None:
+        await _async_session.close()
+    _async_session = None
+    _async_session_loop = None
+
+
+class AsyncUdemyAPI:
+    """
+    Async counterpart of UdemyAPI.
+    Every call goes through the shared pooled session, so handlers never block the event loop.
+    """
+    def __init__(self, access_token=None):
+        self.access_token = access_token
+        self.headers = build_headers(self.access_token)
+        self.base_url = BASE_URL
+
+    async def _get_json(self, url, method="get"):
+        response = await self._get(url, self.headers, method)
+        response.raise_for_status()
+        return loads(response.content)
+
+    async def _get(self, url, headers, method):
+        """GET paced by the token's rate limiter, retrying 429/5xx/network errors with backoff."""
+        bucket = ratelimit.limiter.for_token(self.access_token)
+        for attempt in itertools.count():
+            if not ratelimit.breaker.allow():
+                raise CircuitOpen("Udemy API is failing; circuit breaker open")
+            if bucket is not None:
+                wait = bucket.reserve()
+                if wait:
+                    await asyncio.sleep(wait)
+
+            started = time.perf_counter()
+            try:
+                response = await get_async_session().get(url, headers=headers)
+            except requests.exceptions.RequestException:
+                metrics.observe_request(method, "error", started)
+                delay = ratelimit.next_attempt(bucket, None, None, attempt)
+                if delay is None:
+                    raise
+            else:
+                metrics.observe_request(method, response.status_code, started)
+                delay = ratelimit.next_attempt(bucket, response.status_code, response.headers.get("Retry-After"), attempt)
+                if delay is None:
+                    return response
+            metrics.udemy_retries_total.inc(method=method)
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    async def login_with_credentials(email, password):
+        """
+        Attempts to authenticate using an email and password.
+        Returns the access_token if successful, or an error dictionary.
+        """
+        # Login needs its own cookie jar (csrftoken / access_token), so it cannot use the shared pool.
+        async with requests.AsyncSession(impersonate="chrome") as session:
+            try:
+                # Reuse the csrftoken of an earlier successful login: a single POST instead of scraping the page
+                cookies = _saved_login_cookies()
+                if cookies:
+                    for cookie in cookies:
+                        session.cookies.jar.set_cookie(cookie)
+                    login_data, headers = _login_payload(email, password, session.cookies.get("csrftoken"))
+                    post_res = await session.post(LOGIN_URL, data=login_data, headers=headers)
+                    if post_res.status_code != 403:
+                        result = _login_result(session, post_res)
+                        _keep_login_cookies(cookies, result)
+                        return result
+                    # CSRF rejected (or a Captcha): start over from a fresh login page
+                    _drop_login_cookies()
+                    session.cookies.clear()
+
+                init_res = await session.get(LOGIN_URL)
+                init_res.raise_for_status()
+                csrf_token = session.cookies.get("csrftoken")
+
+                if not csrf_token:
+                    return {"error": "Failed to initialize login session (No CSRF token)."}
+
+                cookies = list(session.cookies.jar)
+                login_data, headers = _login_payload(email, password, csrf_token)
+                post_res = await session.post(LOGIN_URL, data=login_data, headers=headers)
+                result = _login_result(session, post_res)
+                _keep_login_cookies(cookies, result)
+                return result
+
+            except requests.exceptions.RequestException as e:
+                return {"error": "Network error during login attempt.", "details": str(e)}
+
+    async def check_token(self):
+        """
+        Validates the access token with a single one-item request instead of paging through the library.
+        Returns {"valid": True}, {"valid": False, "error": ...} when Udemy rejects the token,
+        or an error dictionary without "valid" when Udemy couldn't give an answer.
+        """
+        if not self.access_token:
+            return {"valid": False, "error": "Missing access token."}
+        try:
+            response = await self._get(self.base_url + TOKEN_CHECK_PATH, self.headers, "check_token")
+        except requests.exceptions.RequestException as e:
+            return {"error": "Could not reach Udemy to validate the token.", "details": str(e)}
+        if response.status_code in (401, 403):
+            return {"valid": False, "error": "Token is invalid or expired."}
+        if response.status_code >= 400:
+            return {"error": "Could not reach Udemy to validate the token.", "details": f"Status {response.status_code}"}
+        return {"valid": True}
+
+    async def _get_page(self, url, previous=None, method="get"):
+        """
+        Fetches one listing page as {"url", "etag", "count", "next", "results"}.
+        When a previously fetched copy of the page is given, it is revalidated with
+        If-None-Match and reused as-is on a 304.
+        """
+        headers = self.headers
+        if previous and previous.get("etag"):
+            headers = {**self.headers, "If-None-Match": previous["etag"]}
+
+        response = await self._get(url, headers, method)
+        if response.status_code == 304 and previous:
+            return previous
+        response.raise_for_status()
+        data = loads(response.content)
+        return {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "count": data.get('count'),
+            "next": data.get('next'),
+            "results": data.get('results', [])
+        }
+
+    async def _iter_pages(self, url, previous_pages=None, method="get"):
+        """
+        Yields every page of a paginated endpoint in page order, as soon as it is available.
+        Pages after the first are fetched concurrently in a sliding window of PAGE_FANOUT.
+        """
+        previous = {page["url"]: page for page in previous_pages or []}
+        first = await self._get_page(url, previous.get(url), method)
+        yield first
+        page_count = 1
+        last = first
+
+        window = collections.deque()
+        try:
+            pending = iter(remaining_page_urls(url, first))
+            for page_url in itertools.islice(pending, PAGE_FANOUT):
+                window.append(asyncio.ensure_future(self._get_page(page_url, previous.get(page_url), method)))
+            while window:
+                last = await window.popleft()
+                for page_url in itertools.islice(pending, 1):
+                    window.append(asyncio.ensure_future(self._get_page(page_url, previous.get(page_url), method)))
+                page_count += 1
+                yield last
+        finally:
+            # The consumer stopped early or a page failed: drop the prefetched ones
+            for task in window:
+                task.cancel()
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+        # The list grew while we were paging, or there was no count to plan with
+        url = last.get('next')
+        while url:
+            last = await self._get_page(url, previous.get(url), method)
+            page_count += 1
+            yield last
+            url = last.get('next')
+        metrics.udemy_pages_per_call.observe(page_count, method=method)
+
+    async def _get_pages(self, url, previous_pages=None, method="get"):
+        """Fetches every page of a paginated endpoint, in page order."""
+        return [page async for page in self._iter_pages(url, previous_pages, method)]
+
+    async def get_subscribed_courses_pages(self, previous_pages=None):
+        """
+        Fetches the raw pages of the enrolled course list.
+        Pass the pages from an earlier call to revalidate them with ETags instead of refetching.
+        """
+        try:
+            return {"pages": await self._get_pages(f"{self.base_url}{COURSES_PATH}", previous_pages, "get_subscribed_courses")}
+        except requests.exceptions.RequestException as e:
+            return {"error": "Failed to fetch courses. Token might be invalid or expired.", "details": str(e)}
+
+    async def get_course_curriculum_pages(self, course_id, previous_pages=None, slim=False):
+        """
+        Fetches the raw pages of a course curriculum.
+        Pass the pages from an earlier call to revalidate them with ETags instead of refetching.
+        """
+        url = curriculum_url(self.base_url, course_id, slim)
+        try:
+            return {"pages": await self._get_pages(url, previous_pages, "get_course_curriculum")}
+        except requests.exceptions.RequestException as e:
+            return {"error": "Failed to fetch curriculum.", "details": str(e)}
+
+    def iter_course_curriculum_pages(self, course_id, slim=False):
+        """
+        Async generator over the raw curriculum pages of a course, in order, as they arrive.
+        Raises requests.exceptions.RequestException if a page can't be fetched.
+        """
+        return self._iter_pages(curriculum_url(self.base_url, course_id, slim), method="get_course_curriculum")
+
+    async def iter_course_curriculum(self, course_id, slim=False):
+        """Async generator over a course's curriculum items (chapters and lectures, in order) page by page."""
+        async for page in self.iter_course_curriculum_pages(course_id, slim):
+            for item in page["results"]:
+                yield item
+
+    async def get_subscribed_courses(self):
+        """Fetches a list of enrolled courses."""
+        res = await self.get_subscribed_courses_pages()
+        if "error" in res:
+            return res
+        return courses_from_pages(res["pages"])
+
+    async def get_course_curriculum(self, course_id, slim=False):
+        """Fetches the curriculum for a specific course ID (slim=True requests only the fields the downloader uses)."""
+        res = await self.get_course_curriculum_pages(course_id, slim=slim)
+        if "error" in res:
+            return res
+        return curriculum_from_pages(res["pages"])
+
+    async def get_lecture_asset(self, course_id, lecture_id):
+        """Fetches the stream URLs for a lecture asset."""
+        url = self.base_url + LECTURE_ASSET_PATH.format(course_id=course_id, lecture_id=lecture_id)
+        try:
+            return await self._get_json(url, "get_lecture_asset")
+        except requests.exceptions.RequestException as e:
+            return {"error": "Failed to fetch lecture asset.", "details": str(e)}
+
+    async def get_supplementary_asset(self, course_id, lecture_id, asset_id):
+        """Fetches download URL for a supplementary asset (like .zip)."""
+        url = self.base_url + SUPPLEMENTARY_ASSET_PATH.format(course_id=course_id, lecture_id=lecture_id, asset_id=asset_id)
         try:
-            response = requests.get(url, headers=self.headers, impersonate="chrome")
-            response.raise_for_status()
-            return response.json()
+            return await self._get_json(url, "get_supplementary_asset")
         except requests.exceptions.RequestException as e:
             return {"error": "Failed to fetch supplementary asset.", "details": str(e)}
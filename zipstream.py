@@ -0,0 +1,173 @@
+"""
+Streaming ZIP export of a course's attachments.
+
+ZipStream produces an archive front to back, so it can go straight to a socket or file as the
+upstream bytes arrive: entries are stored (attachments are mostly zips and PDFs already), and
+every entry is zip64 with its CRC and sizes in a data descriptor after the data, so nothing
+has to be known up front or seeked back to. Only the central directory (a few dozen bytes per
+entry) is held until the end.
+"""
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from downloader import sanitize_filename
+from engine import attachment_file_name
+from models import Chapter, Lecture, attachment_url, curriculum_item
+
+ZIP_VERSION = 45  # zip64
+# Bit 3: CRC and sizes follow in a data descriptor. Bit 11: names are UTF-8.
+ZIP_FLAGS = 0x0008 | 0x0800
+ZIP64_MARKER = 0xFFFFFFFF
+MISSING_NAME = "MISSING.txt"
+
+
+def _dos_time(timestamp):
+    t = time.localtime(timestamp)
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+class ZipStream:
+    """
+    Writes a ZIP archive as a sequence of byte strings: start_entry(), write() for each chunk,
+    end_entry(), and finally finish(). Each call returns the bytes to send next.
+    """
+    def __init__(self):
+        self.offset = 0
+        self._central = []
+        self._names = set()
+        self._entry = None
+
+    def _emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def unique_name(self, name):
+        """Returns name, or "name (2).ext" and so on if the archive already has it."""
+        base, ext = os.path.splitext(name)
+        candidate, n = name, 1
+        while candidate in self._names:
+            n += 1
+            candidate = f"{base} ({n}){ext}"
+        return candidate
+
+    def start_entry(self, name, mtime=None):
+        name = self.unique_name(name)
+        self._names.add(name)
+        encoded = name.encode("utf-8")
+        dos_time, dos_date = _dos_time(mtime if mtime is not None else time.time())
+        self._entry = {"name": encoded, "time": dos_time, "date": dos_date, "offset": self.offset, "crc": 0, "size": 0}
+        # Sizes aren't known yet: the zip64 extra field is zeroed and the real values go in the data descriptor
+        extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0)
+        header = struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, ZIP_VERSION, ZIP_FLAGS, 0, dos_time, dos_date,
+            0, ZIP64_MARKER, ZIP64_MARKER, len(encoded), len(extra)
+        )
+        return self._emit(header + encoded + extra)
+
+    def write(self, data):
+        self._entry["crc"] = zlib.crc32(data, self._entry["crc"])
+        self._entry["size"] += len(data)
+        return self._emit(bytes(data))
+
+    def end_entry(self):
+        entry, self._entry = self._entry, None
+        self._central.append(entry)
+        return self._emit(struct.pack("<IIQQ", 0x08074B50, entry["crc"], entry["size"], entry["size"]))
+
+    def add(self, name, data, mtime=None):
+        """A whole small entry at once."""
+        return self.start_entry(name, mtime) + self.write(data) + self.end_entry()
+
+    def finish(self):
+        """The central directory and (zip64) end records."""
+        start = self.offset
+        records = []
+        for entry in self._central:
+            extra = struct.pack("<HHQQQ", 0x0001, 24, entry["size"], entry["size"], entry["offset"])
+            records.append(struct.pack(
+                "<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | ZIP_VERSION, ZIP_VERSION, ZIP_FLAGS, 0,
+                entry["time"], entry["date"], entry["crc"], ZIP64_MARKER, ZIP64_MARKER,
+                len(entry["name"]), len(extra), 0, 0, 0, 0o100644 << 16, ZIP64_MARKER
+            ) + entry["name"] + extra)
+        directory = b"".join(records)
+        count = len(self._central)
+        end64_offset = start + len(directory)
+        end64 = struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, (3 << 8) | ZIP_VERSION, ZIP_VERSION, 0, 0,
+                            count, count, len(directory), start)
+        locator = struct.pack("<IIQI", 0x07064B50, 0, end64_offset, 1)
+        end = struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                          ZIP64_MARKER, ZIP64_MARKER, 0)
+        return self._emit(directory + end64 + locator + end)
+
+
+def course_attachments(curriculum):
+    """
+    Returns (folder, lecture, attachment) for every downloadable attachment in a curriculum
+    (raw items or parsed models), with folder named like the CLI's chapter directories.
+    """
+    found = []
+    folder = ""
+    chapter_index = 0
+    for item in curriculum:
+        if isinstance(item, dict):
+            item = curriculum_item(item)
+        if isinstance(item, Chapter):
+            chapter_index += 1
+            folder = f"{chapter_index:02d} - {sanitize_filename(item.title or '')}"
+        elif isinstance(item, Lecture):
+            found += [(folder, item, supp) for supp in item.attachments if supp.id and not supp.is_external]
+    return found
+
+
+def archive_name(folder, supp, file_url):
+    name = sanitize_filename(attachment_file_name(supp, file_url))
+    return f"{folder}/{name}" if folder else name
+
+
+def missing_report(missing):
+    return ("These attachments could not be downloaded:\n" + "".join(f"{name}\n" for name in missing)).encode("utf-8")
+
+
+def write_attachments_zip(api, session, course_id, attachments, out, workers=8):
+    """
+    Resolves `attachments` (from course_attachments) with a thread pool and streams each file
+    into the file object `out` as soon as its URL is known. Returns (files written, names missing).
+    """
+    archive = ZipStream()
+    written = 0
+    missing = []
+
+    def resolve(found):
+        folder, lecture, supp = found
+        supp_info = api.get_supplementary_asset(course_id, lecture.id, supp.id)
+        return found, attachment_url(supp_info) if supp_info and "error" not in supp_info else None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in as_completed([pool.submit(resolve, found) for found in attachments]):
+            (folder, lecture, supp), file_url = future.result()
+            label = archive_name(folder, supp, file_url or "")
+            if not file_url:
+                missing.append(label)
+                continue
+            try:
+                with session.get(file_url, stream=True) as r:
+                    r.raise_for_status()
+                    out.write(archive.start_entry(label))
+                    try:
+                        for chunk in r.iter_content(chunk_size=1024 * 1024):
+                            out.write(archive.write(chunk))
+                    finally:
+                        # A broken transfer still closes its entry, so the rest of the archive stays readable
+                        out.write(archive.end_entry())
+                written += 1
+                print(f"    Added {label}")
+            except Exception as e:
+                print(f"    Failed to add {label}: {e}")
+                missing.append(label)
+    if missing:
+        out.write(archive.add(MISSING_NAME, missing_report(missing)))
+    out.write(archive.finish())
+    return written, missing